@@ -4,7 +4,7 @@ from flask_login import LoginManager
 import os
 import pytz
 from models import db, User, Role, Company, AccountType, HolidayType
-from datetime import datetime, timedelta
+from datetime import timedelta
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_apscheduler import APScheduler
@@ -471,53 +471,97 @@ def create_issue_defaults():
 
 def sync_all_calendars():
     """Sync all active calendar sources that have URLs"""
-    import requests
-    from models import CalendarSource
-    from routes.calendar import process_ics_calendar
-
-    # Get all active calendar sources with URLs
-    calendar_sources = CalendarSource.query.filter(
-        CalendarSource.source_url.isnot(None),
-        CalendarSource.is_active == True
-    ).all()
-
-    for source in calendar_sources:
-        try:
-            # Download the ICS file
-            response = requests.get(source.source_url)
-            if response.status_code == 200:
-                calendar_data = response.text
-                # Process the calendar with the source identifier
-                process_ics_calendar(
-                    calendar_data,
-                    source.unit_id,
-                    source.source_name,
-                    source.source_identifier
-                )
-                # Update the last_updated timestamp
-                source.last_updated = datetime.utcnow()
-                db.session.commit()
-                print(f"Successfully synced {source.source_identifier} for unit {source.unit.unit_number}")
-        except Exception as e:
-            print(f"Error syncing calendar for {source.unit.unit_number} from {source.source_identifier}: {str(e)}")
-            # Optionally, you could disable problematic sources after several failures
-            # source.is_active = False
-            # db.session.commit()
+    from utils.calendar_sync import CalendarSyncEngine
+
+    # Feeds are downloaded concurrently; bookings are written one source at a time
+    with app.app_context():
+        results = CalendarSyncEngine().run()
+        print_sync_results(results)
+
+    return results
+
+
+def sync_due_calendars():
+    """Sync the calendar sources whose next_sync_at has passed (runs every tick)"""
+    from utils.sync_scheduler import sync_due_calendars as run_due_syncs
+
+    with app.app_context():
+        results = run_due_syncs()
+        if results:
+            print_sync_results(results)
+
+    return results
+
+
+def print_sync_results(results):
+    for result in results:
+        print(result.summary())
+
+    failed = [result for result in results if result.error]
+    print(f"Calendar sync finished: {len(results) - len(failed)} synced, {len(failed)} failed")
+
+
+@app.cli.command('rebuild-occupancy')
+def rebuild_occupancy_command():
+    """Rebuild unit_day_occupancy from the bookings, repairing any drift"""
+    from utils.daily_occupancy import rebuild_unit_day_occupancy
+
+    inserted, deleted = rebuild_unit_day_occupancy()
+    db.session.commit()
+    print(f"unit_day_occupancy rebuilt: {inserted} rows added, {deleted} rows removed")
+
+
+@app.cli.command('rebuild-pnl')
+def rebuild_pnl_command():
+    """Recompute pnl_rollup from expenses, bookings and issues, repairing any drift"""
+    from utils.pnl_rollup import rebuild_pnl_rollup
+
+    refreshed = rebuild_pnl_rollup()
+    db.session.commit()
+    print(f"pnl_rollup rebuilt: {refreshed} unit-months recomputed")
+
+
+def fill_derived_tables():
+    """Fill unit_day_occupancy and pnl_rollup when create_all() or an upgrade left them empty"""
+    from sqlalchemy.exc import SQLAlchemyError
+    from utils.daily_occupancy import ensure_unit_day_occupancy
+    from utils.pnl_rollup import ensure_pnl_rollup
+
+    try:
+        occupancy_rows = ensure_unit_day_occupancy()
+        pnl_months = ensure_pnl_rollup()
+        db.session.commit()
+    except SQLAlchemyError as e:
+        # Another worker process is filling them at the same time
+        db.session.rollback()
+        print(f"Skipped filling derived tables: {e}")
+        return
+
+    if occupancy_rows:
+        print(f"unit_day_occupancy filled: {occupancy_rows} rows added")
+    if pnl_months:
+        print(f"pnl_rollup filled: {pnl_months} unit-months computed")
 
 
 def init_scheduler(app):
+    from utils.job_queue import job_queue
+    from utils.sync_scheduler import CALENDAR_SYNC_TICK_SECONDS
+
     scheduler.init_app(app)
     scheduler.start()
 
-    # Schedule the sync task to run every day at 2 AM
-    scheduler.add_job(func=sync_all_calendars, trigger='cron', hour=2, id='sync_calendars')
-    ## Schedule the sync task to run every minute
-    # scheduler.add_job(
-    #    func=sync_all_calendars,
-    #    trigger='interval',
-    #    minutes=1,
-    #    id='sync_calendars'
-    # )
+    # Run queued ICS imports/refreshes on a worker pool, polling for leftovers
+    job_queue.init_app(app, scheduler)
+
+    # Sync each calendar when it is due instead of all at once at 2 AM
+    scheduler.add_job(
+        func=sync_due_calendars,
+        trigger='interval',
+        seconds=app.config.get('CALENDAR_SYNC_TICK_SECONDS', CALENDAR_SYNC_TICK_SECONDS),
+        id='sync_calendars',
+        max_instances=1,
+        coalesce=True
+    )
 
 
 # Import and register blueprints
@@ -530,6 +574,7 @@ with app.app_context():
     db.create_all()
     create_default_data()
     create_account_types()
+    fill_derived_tables()
     init_scheduler(app)
 
 if __name__ == '__main__':
@@ -0,0 +1,53 @@
+"""
+Compare the two access filtering modes of utils/access_control.py.
+
+For 50, 500 and 5,000 units this times get_accessible_bookings_query().count()
+for a Manager and a Staff user in 'in_list' mode (materialized IN (...) bind
+list, including the unit ID lookup) and 'subquery' mode (restriction compiled
+into SQL).
+"""
+
+import os
+
+from common import create_bench_app, seed_company, timed
+
+from models import db
+from utils.access_control import (
+    FILTER_MODE_IN_LIST,
+    FILTER_MODE_SUBQUERY,
+    access_cache,
+    clear_access_context,
+    get_accessible_bookings_query
+)
+
+
+UNIT_COUNTS = [50, 500, 5000]
+
+
+def run_query(user, mode):
+    # Drop cached contexts so the in_list mode pays for its unit lookup every time
+    access_cache.clear()
+    clear_access_context()
+    return get_accessible_bookings_query(user=user, mode=mode).count()
+
+
+def main():
+    app, db_path = create_bench_app()
+    try:
+        with app.app_context():
+            print(f"{'units':>6} {'role':>8} {'in_list ms':>11} {'subquery ms':>12} {'rows':>8}")
+            for unit_count in UNIT_COUNTS:
+                company, manager, staff = seed_company(unit_count)
+                for label, user in [('Manager', manager), ('Staff', staff)]:
+                    in_list_time, in_list_rows = timed(lambda: run_query(user, FILTER_MODE_IN_LIST))
+                    subquery_time, subquery_rows = timed(lambda: run_query(user, FILTER_MODE_SUBQUERY))
+                    assert in_list_rows == subquery_rows, (in_list_rows, subquery_rows)
+                    print(f"{unit_count:>6} {label:>8} {in_list_time * 1000:>11.2f} "
+                          f"{subquery_time * 1000:>12.2f} {subquery_rows:>8}")
+            db.session.remove()
+    finally:
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Time the multi-unit availability search in utils/availability.py.
+
+Searches 1,000 units for a 30-night window, once against a cold index (every
+unit loaded from the database) and then warm, against the 50 ms target.
+"""
+
+import os
+from datetime import date
+
+from common import create_bench_app, seed_company, timed
+
+from models import db, Unit
+from utils.availability import availability_index, search_available_units
+
+
+UNIT_COUNT = 1000
+CHECK_IN = date(2024, 2, 10)
+CHECK_OUT = date(2024, 3, 11)
+TARGET_MS = 50
+
+
+def run_search(company, min_pax=None):
+    return search_available_units(Unit.query.filter(Unit.company_id == company.id),
+                                  CHECK_IN, CHECK_OUT, min_pax=min_pax)
+
+
+def main():
+    app, db_path = create_bench_app()
+    try:
+        with app.app_context():
+            company, manager, staff = seed_company(UNIT_COUNT)
+
+            def cold_search():
+                availability_index.clear()
+                return run_search(company)
+
+            cold_time, cold_units = timed(cold_search)
+            warm_time, warm_units = timed(lambda: run_search(company))
+            pax_time, pax_units = timed(lambda: run_search(company, min_pax=4))
+            assert [unit.id for unit in cold_units] == [unit.id for unit in warm_units]
+
+            print(f"{'search':>16} {'ms':>8} {'free units':>11}")
+            print(f"{'cold index':>16} {cold_time * 1000:>8.2f} {len(cold_units):>11}")
+            print(f"{'warm index':>16} {warm_time * 1000:>8.2f} {len(warm_units):>11}")
+            print(f"{'warm, min_pax=4':>16} {pax_time * 1000:>8.2f} {len(pax_units):>11}")
+            print(f"target: {TARGET_MS} ms for {UNIT_COUNT} units over "
+                  f"{(CHECK_OUT - CHECK_IN).days} nights ({'met' if warm_time * 1000 < TARGET_MS else 'missed'})")
+            db.session.remove()
+    finally:
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Exercise utils/calendar_sync.py against a local HTTP stub server.
+
+Serves one Airbnb-style ICS feed per unit with a fixed upstream latency, plus
+a feed that hangs past the read timeout and one that returns 503 once before
+succeeding. It then syncs every source sequentially (1 worker) and
+concurrently, and prints the per-source report of the concurrent run.
+"""
+
+import os
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common import create_bench_app, seed_company
+
+from models import db, CalendarSource, Unit
+from utils.calendar_sync import CalendarSyncEngine
+
+
+SOURCE_COUNT = 40
+UPSTREAM_LATENCY_SECONDS = 0.2
+HANG_SECONDS = 5
+READ_TIMEOUT_SECONDS = 1
+
+
+def build_feed(unit_index, event_count=20, start=date(2030, 1, 1)):
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Bench//Stub//EN']
+    check_in = start
+    for event_index in range(event_count):
+        check_out = check_in + timedelta(days=3)
+        lines += [
+            'BEGIN:VEVENT',
+            f'DTSTART;VALUE=DATE:{check_in:%Y%m%d}',
+            f'DTEND;VALUE=DATE:{check_out:%Y%m%d}',
+            'SUMMARY:Reserved',
+            f'DESCRIPTION:Reservation URL: https://www.airbnb.com/hosting/reservations/details/'
+            f'HM{unit_index:04d}{event_index:04d}',
+            f'UID:{unit_index}-{event_index}@bench',
+            'END:VEVENT',
+        ]
+        check_in = check_out + timedelta(days=1)
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(lines).encode('utf-8')
+
+
+class StubFeedHandler(BaseHTTPRequestHandler):
+    flaky_hits = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        if self.path == '/hang.ics':
+            time.sleep(HANG_SECONDS)
+        elif self.path == '/flaky.ics':
+            with StubFeedHandler.lock:
+                StubFeedHandler.flaky_hits += 1
+                first_hit = StubFeedHandler.flaky_hits % 2 == 1
+            if first_hit:
+                self.send_response(503)
+                self.send_header('Retry-After', '0')
+                self.end_headers()
+                return
+
+        time.sleep(UPSTREAM_LATENCY_SECONDS)
+        unit_index = int(self.path.strip('/').split('.')[0]) if self.path[1:2].isdigit() else 0
+        body = build_feed(unit_index)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/calendar')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def add_sources(company, base_url):
+    units = Unit.query.filter_by(company_id=company.id).order_by(Unit.id).all()
+    paths = [f'/{index}.ics' for index in range(len(units) - 2)] + ['/hang.ics', '/flaky.ics']
+    for unit, path in zip(units, paths):
+        db.session.add(CalendarSource(unit_id=unit.id, source_name='Airbnb',
+                                      source_identifier=f'Airbnb {path}',
+                                      source_url=f'{base_url}{path}', is_active=True))
+    db.session.commit()
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubFeedHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+
+    app, db_path = create_bench_app()
+    try:
+        with app.app_context():
+            company, manager, staff = seed_company(SOURCE_COUNT, bookings_per_unit=1)
+            add_sources(company, base_url)
+
+            # All feeds share one host here, so per-host spacing is disabled
+            for workers in [1, 8]:
+                engine = CalendarSyncEngine(max_workers=workers, read_timeout=READ_TIMEOUT_SECONDS,
+                                            max_retries=1, backoff_seconds=0.1, host_interval=0)
+                started = time.perf_counter()
+                results = engine.run()
+                elapsed = time.perf_counter() - started
+                failed = sum(1 for result in results if result.error)
+                print(f'{workers} worker(s): {len(results)} sources in {elapsed:.2f} s, {failed} failed')
+
+            print()
+            for result in sorted(results, key=lambda result: result.source_id):
+                print(result.summary())
+            db.session.remove()
+    finally:
+        server.shutdown()
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
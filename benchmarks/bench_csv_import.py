@@ -0,0 +1,96 @@
+"""
+Time the Airbnb CSV import pipeline in utils/booking_import.py.
+
+Seeds 20,000 bookings with confirmation codes, builds an Airbnb reservations
+export covering all of them (a quarter with a changed guest name) and compares
+one lookup query per row, as the old endpoints did, with the batched import
+reading the CSV as a stream. Both runs are rolled back.
+"""
+
+import csv
+import io
+import os
+
+from sqlalchemy import event
+
+from common import create_bench_app, seed_company, timed
+
+from models import db, BookingForm
+from utils.booking_import import AIRBNB_CSV_COLUMNS, import_airbnb_bookings, iter_airbnb_csv_rows
+
+
+UNIT_COUNT = 2000
+BOOKINGS_PER_UNIT = 10
+
+
+def build_export(bookings):
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=list(AIRBNB_CSV_COLUMNS))
+    writer.writeheader()
+    for index, booking in enumerate(bookings):
+        writer.writerow({
+            'Confirmation code': booking.confirmation_code,
+            'Status': 'Confirmed',
+            'Guest name': f'Guest {index}' if index % 4 == 0 else booking.guest_name,
+            'Contact': '',
+            '# of adults': '2',
+            '# of children': '0',
+            '# of infants': '0',
+            'Start date': booking.check_in_date.strftime('%m/%d/%Y'),
+            'End date': booking.check_out_date.strftime('%m/%d/%Y'),
+            '# of nights': str(booking.number_of_nights),
+            'Booked': booking.check_in_date.strftime('%b %d, %Y'),
+            'Listing': '',
+            'Earnings': f'RM{booking.price:,.2f}',
+        })
+    return output.getvalue().encode('utf-8')
+
+
+def per_row_lookups(export, company_id):
+    for booking_data in iter_airbnb_csv_rows(io.BytesIO(export)):
+        BookingForm.query.filter_by(
+            confirmation_code=booking_data['confirmation_code'],
+            company_id=company_id
+        ).first()
+
+
+def main():
+    app, db_path = create_bench_app()
+    try:
+        with app.app_context():
+            company, manager, staff = seed_company(UNIT_COUNT, BOOKINGS_PER_UNIT)
+            company_id = company.id
+            db.session.execute(
+                BookingForm.__table__.update().values(confirmation_code='HM' + BookingForm.id.cast(db.String))
+            )
+            db.session.commit()
+
+            bookings = BookingForm.query.order_by(BookingForm.id).all()
+            export = build_export(bookings)
+            db.session.expunge_all()
+
+            statements = []
+            event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(1))
+
+            def run_baseline():
+                per_row_lookups(export, company_id)
+                db.session.rollback()
+
+            def run_batched():
+                result = import_airbnb_bookings(iter_airbnb_csv_rows(io.BytesIO(export)), company_id)
+                db.session.rollback()
+                return result
+
+            for label, func in [('per-row lookups', run_baseline), ('batched import', run_batched)]:
+                statements.clear()
+                seconds, result = timed(func, repeat=1)
+                print(f'{label:>16}: {seconds * 1000:>8.1f} ms, {len(statements)} statements')
+
+            print(f'{result.processed} rows, {result.updated} updated, {result.errors} errors')
+            db.session.remove()
+    finally:
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Count the statements saving the expenses grid takes.
+
+Saves a month for 150 units the way POST /api/expenses used to (an ownership
+lookup and a row lookup per unit), then through the batched pipeline in
+utils/expenses.py with a full payload, the same payload again, a five-cell
+diff and remarks. Checks that resaving wrote nothing and that the diff left
+the other cells alone.
+"""
+
+import os
+import sys
+from decimal import Decimal
+
+from sqlalchemy import event
+
+from common import create_bench_app, seed_company, timed
+
+from models import db, ExpenseData, ExpenseRemark, Unit
+from utils.expenses import EXPENSE_FIELDS, owned_unit_ids, upsert_expense_remarks, upsert_expenses
+
+
+UNIT_COUNT = 150
+YEAR, MONTH = 2024, 6
+
+
+def per_unit_save(company_id, amounts_by_unit):
+    for unit_id, amounts in amounts_by_unit.items():
+        if not Unit.query.filter_by(id=unit_id, company_id=company_id).first():
+            continue
+        expense = ExpenseData.query.filter_by(company_id=company_id, unit_id=unit_id, year=YEAR, month=MONTH).first()
+        if expense is None:
+            expense = ExpenseData(company_id=company_id, unit_id=unit_id, year=YEAR, month=MONTH)
+            db.session.add(expense)
+        for name, amount in amounts.items():
+            setattr(expense, name, amount)
+    db.session.commit()
+
+
+def batched_save(company_id, amounts_by_unit):
+    owned = owned_unit_ids(company_id, list(amounts_by_unit))
+    saved = upsert_expenses(company_id, YEAR, MONTH,
+                            {unit_id: amounts for unit_id, amounts in amounts_by_unit.items() if unit_id in owned})
+    db.session.commit()
+    return saved
+
+
+def main():
+    app, db_path = create_bench_app()
+    correct = True
+    try:
+        with app.app_context():
+            company, manager, staff = seed_company(UNIT_COUNT, bookings_per_unit=0)
+            company_id = company.id
+            unit_ids = [unit_id for (unit_id,) in db.session.query(Unit.id).order_by(Unit.id)]
+            full = {unit_id: {name: Decimal(unit_id % 9 + 1) * 100 for name in EXPENSE_FIELDS} for unit_id in unit_ids}
+
+            statements = []
+            event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(1))
+
+            def run(label, func, *args):
+                statements.clear()
+                seconds, result = timed(lambda: func(company_id, *args), repeat=1)
+                print(f'{label:<22} {seconds * 1000:>7.1f} ms, {len(statements):>4} statements')
+                return result
+
+            run('per-unit save', per_unit_save, full)
+            db.session.query(ExpenseData).delete()
+            db.session.commit()
+
+            correct &= run('batched, new rows', batched_save, full) == UNIT_COUNT
+            # Existing rows: nothing to write, then only the changed cells
+            correct &= run('batched, unchanged', batched_save, full) == 0
+            diff = {unit_id: {'electricity': Decimal('12.34')} for unit_id in unit_ids[:5]}
+            saved = run('batched, 5-cell diff', batched_save, diff)
+            correct &= saved == 5
+
+            run('remarks', lambda company_id: (upsert_expense_remarks(company_id, YEAR, MONTH, {
+                unit_id: {'repair': 'Aircon compressor', 'other': 'Keys cut'} for unit_id in unit_ids
+            }), db.session.commit()))
+
+            row = ExpenseData.query.filter_by(unit_id=unit_ids[0], year=YEAR, month=MONTH).one()
+            correct &= row.electricity == Decimal('12.34') and row.sales == full[unit_ids[0]]['sales']
+            correct &= ExpenseRemark.query.count() == 2 * UNIT_COUNT
+            print('diff kept the other cells' if correct else 'MISMATCH')
+            db.session.remove()
+    finally:
+        os.remove(db_path)
+
+    sys.exit(0 if correct else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Count the statements the holiday resolver in utils/holidays.py issues.
+
+Seeds 40 recurring system holidays (one on 29 February), 200 one-off holidays
+spread over ten years and a few company deletion markers, then resolves ranges
+of 1, 5 and 20 years. A cold resolve must read the holidays in one query
+whatever the range; a warm one must not touch the database.
+"""
+
+import os
+import sys
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from common import create_bench_app, seed_company, timed
+
+from models import db, Holiday
+from utils.holidays import HOLIDAY_TYPES, holiday_cache, holiday_types, resolve_holidays
+
+
+START_YEAR = 2020
+
+
+def seed_holidays(company_id):
+    # Create every holiday type first: adding one resets the type cache, which
+    # would otherwise happen inside the first timed resolve
+    for key in HOLIDAY_TYPES:
+        holiday_types.get(key)
+    holiday_types.all()
+
+    public = holiday_types.get('public')
+    school = holiday_types.get('school')
+    rows = [
+        {'name': f'Recurring {index}', 'date': date(START_YEAR, 1 + index % 12, 1 + index % 28),
+         'holiday_type_id': public.id, 'company_id': None, 'is_recurring': True, 'is_deleted': False}
+        for index in range(40)
+    ]
+    rows.append({'name': 'Leap day', 'date': date(START_YEAR, 2, 29), 'holiday_type_id': public.id,
+                 'company_id': None, 'is_recurring': True, 'is_deleted': False})
+    rows.extend(
+        {'name': f'School break {index}', 'date': date(START_YEAR, 1, 1) + timedelta(days=index * 18),
+         'holiday_type_id': school.id, 'company_id': None, 'is_recurring': False, 'is_deleted': False}
+        for index in range(200)
+    )
+    # The company removed two occurrences of the first recurring holiday
+    rows.extend(
+        {'name': 'Recurring 0', 'date': date(year, 1, 1), 'holiday_type_id': public.id,
+         'company_id': company_id, 'is_recurring': False, 'is_deleted': True}
+        for year in (2022, 2025)
+    )
+    db.session.execute(db.insert(Holiday), rows)
+    db.session.commit()
+
+
+def main():
+    app, db_path = create_bench_app()
+    correct = True
+    try:
+        with app.app_context():
+            company, manager, staff = seed_company(1, bookings_per_unit=0)
+            company_id = company.id
+            seed_holidays(company_id)
+
+            statements = []
+            event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(1))
+
+            for years in (1, 5, 20):
+                start, end = date(START_YEAR, 1, 1), date(START_YEAR + years - 1, 12, 31)
+                holiday_cache.clear()
+                for label in ('cold', 'warm'):
+                    statements.clear()
+                    seconds, holidays = timed(lambda: resolve_holidays(company_id, start, end), repeat=1)
+                    print(f'{years:>2} years {label}: {seconds * 1000:>7.2f} ms, '
+                          f'{len(statements)} statements, {len(holidays)} holidays')
+                    correct &= len(statements) <= (1 if label == 'cold' else 0)
+
+            leap_days = [holiday.date for holiday in resolve_holidays(company_id, date(2023, 1, 1), date(2024, 12, 31))
+                         if holiday.name == 'Leap day']
+            print(f'leap day occurrences: {", ".join(day.isoformat() for day in leap_days)}')
+            correct &= leap_days == [date(2023, 2, 28), date(2024, 2, 29)]
+
+            removed = [holiday.date.year for holiday in resolve_holidays(company_id, date(2021, 1, 1), date(2026, 12, 31))
+                       if holiday.name == 'Recurring 0']
+            print(f'Recurring 0 shown in: {removed}')
+            correct &= removed == [2021, 2023, 2024, 2026]
+            db.session.remove()
+    finally:
+        os.remove(db_path)
+
+    sys.exit(0 if correct else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Compare utils/ics_parser.py with a full icalendar parse.
+
+Builds Airbnb- and Booking.com-style feeds with 10,000 events each (folded
+DESCRIPTION lines, VALUE=DATE, UTC and TZID date forms) and reports the best
+time and peak traced memory of both parsers, checking they return the same events.
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.ics_parser import _icalendar_events, iter_vevents
+
+
+EVENT_COUNT = 10000
+
+
+def fold(line):
+    """Fold a content line at 75 octets as RFC 5545 requires"""
+    chunks = [line[:75]]
+    line = line[75:]
+    while line:
+        chunks.append(' ' + line[:74])
+        line = line[74:]
+    return chunks
+
+
+def build_feed(style, event_count=EVENT_COUNT, start=date(2024, 1, 1)):
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:-//Bench//{style}//EN']
+    check_in = start
+    for index in range(event_count):
+        check_out = check_in + timedelta(days=1 + index % 4)
+        lines.append('BEGIN:VEVENT')
+        if style == 'airbnb':
+            lines += [
+                f'DTSTART;VALUE=DATE:{check_in:%Y%m%d}',
+                f'DTEND;VALUE=DATE:{check_out:%Y%m%d}',
+                'SUMMARY:Reserved',
+            ]
+            lines += fold(f'DESCRIPTION:Reservation URL: https://www.airbnb.com/hosting/reservations/'
+                          f'details/HM{index:08d}\\nPhone Number (Last 4 Digits): {index % 10000:04d}')
+        else:
+            lines += [
+                f'DTSTART;TZID=Asia/Kuala_Lumpur:{check_in:%Y%m%d}T150000',
+                f'DTEND:{check_out:%Y%m%d}T040000Z',
+                f'SUMMARY:Guest {index}\\, CLOSED - Not available',
+                f'DESCRIPTION:Booking ID: {4000000000 + index}',
+            ]
+        lines += [f'UID:{style}-{index}@bench', 'END:VEVENT']
+        check_in = check_out
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def measure(func, data, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(data)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    func(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def main():
+    print(f"{'feed':>8} {'parser':>10} {'ms':>9} {'peak MiB':>9} {'events':>7}")
+    for style in ['airbnb', 'booking']:
+        data = build_feed(style)
+        streaming = measure(lambda feed: list(iter_vevents(feed)), data)
+        full = measure(_icalendar_events, data)
+        assert streaming[2] == full[2], f'{style}: parsers disagree'
+
+        for label, (seconds, peak, events) in [('streaming', streaming), ('icalendar', full)]:
+            print(f"{style:>8} {label:>10} {seconds * 1000:>9.1f} {peak / 2 ** 20:>9.1f} {len(events):>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Time the dashboard's issue heatmap for 300 units and 7 categories.
+
+Compares one COUNT per unit and category, as the dashboard used to run, with
+issue_heatmap() cold and cached. Then adds an issue through the ORM and
+recategorizes issues with a Query.update(), checking after each commit that
+the cached matrix was dropped and matches the per-cell counts.
+"""
+
+import os
+import sys
+
+from sqlalchemy import event
+
+from common import create_bench_app, seed_company, timed
+
+from models import db, Category, Issue, Unit
+from utils.issue_heatmap import issue_heatmap
+
+
+UNIT_COUNT = 300
+CATEGORY_NAMES = ['Building Issue', 'Cleaning', 'Check-in', 'Aircon', 'Plumbing', 'Electrical', 'Other']
+
+
+def per_cell_counts(company_id, unit_ids, category_ids):
+    return {
+        (unit_id, category_id): Issue.query.filter(
+            Issue.company_id == company_id,
+            Issue.unit_id == unit_id,
+            Issue.category_id == category_id
+        ).count()
+        for unit_id in unit_ids for category_id in category_ids
+    }
+
+
+def matches(company_id, unit_ids, category_ids):
+    expected = per_cell_counts(company_id, unit_ids, category_ids)
+    heatmap = issue_heatmap(company_id, unit_ids)
+    width = len(heatmap.category_ids)
+    return all(
+        heatmap.counts[row * width + column] == expected[(unit_id, category_id)]
+        for row, unit_id in enumerate(heatmap.unit_ids)
+        for column, category_id in enumerate(heatmap.category_ids)
+    )
+
+
+def main():
+    app, db_path = create_bench_app()
+    correct = True
+    try:
+        with app.app_context():
+            company, manager, staff = seed_company(UNIT_COUNT, bookings_per_unit=0)
+            categories = [Category(name=name) for name in CATEGORY_NAMES]
+            db.session.add_all(categories)
+            db.session.commit()
+            # Plain IDs: ORM objects expire on commit and would reload inside the timings
+            company_id, manager_id = company.id, manager.id
+            category_ids = [category.id for category in categories]
+            units = db.session.query(Unit.id, Unit.unit_number).order_by(Unit.id).all()
+            unit_ids = [unit.id for unit in units]
+
+            db.session.execute(db.insert(Issue), [
+                {'description': 'Reported by guest', 'unit': unit.unit_number, 'unit_id': unit.id,
+                 'category_id': category_ids[(unit.id + index) % len(category_ids)],
+                 'user_id': manager_id, 'company_id': company_id}
+                for unit in units for index in range(unit.id % 9)
+            ])
+            db.session.commit()
+
+            statements = []
+            event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(1))
+
+            def run(label, func, repeat=1):
+                statements.clear()
+                seconds, result = timed(func, repeat=repeat)
+                print(f'{label:<18} {seconds * 1000:>8.2f} ms, {len(statements) // repeat:>5} statements')
+                return result
+
+            run('per-cell counts', lambda: per_cell_counts(company_id, unit_ids, category_ids))
+            run('heatmap, cold', lambda: issue_heatmap(company_id, unit_ids))
+            run('heatmap, cached', lambda: issue_heatmap(company_id, unit_ids), repeat=5)
+            correct &= matches(company_id, unit_ids, category_ids)
+
+            db.session.add(Issue(description='Leaking tap', unit=units[0].unit_number, unit_id=units[0].id,
+                                 category_id=category_ids[4], user_id=manager_id, company_id=company_id))
+            db.session.commit()
+            correct &= matches(company_id, unit_ids, category_ids)
+
+            Issue.query.filter(Issue.unit_id.in_(unit_ids[:50])).update(
+                {Issue.category_id: category_ids[0]}, synchronize_session=False)
+            db.session.commit()
+            correct &= matches(company_id, unit_ids, category_ids)
+
+            print('heatmap follows issue changes' if correct else 'STALE HEATMAP')
+            db.session.remove()
+    finally:
+        os.remove(db_path)
+
+    sys.exit(0 if correct else 1)
+
+
+if __name__ == '__main__':
+    main()
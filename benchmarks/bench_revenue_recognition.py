@@ -0,0 +1,79 @@
+"""
+Time a 12-month booking revenue report for 500 units.
+
+Compares prorating the bookings of each month in Python, one query per month
+as /api/bookings/monthly_revenue used to, with one recognize_revenue() pass
+over the year aggregated to months. The two must agree to the cent.
+"""
+
+import os
+import sys
+from datetime import date
+
+from sqlalchemy import event, or_
+
+from common import create_bench_app, seed_company, timed
+
+from models import db, BookingForm, Unit
+from utils.revenue import recognize_revenue
+
+
+UNIT_COUNT = 500
+YEAR = 2024
+
+
+def per_month_proration(company_id, unit_ids):
+    report = {}
+    for month in range(1, 13):
+        start = date(YEAR, month, 1)
+        end = date(YEAR + 1, 1, 1) if month == 12 else date(YEAR, month + 1, 1)
+        revenues = {}
+        for booking in BookingForm.query.filter(
+            BookingForm.company_id == company_id,
+            BookingForm.unit_id.in_(unit_ids),
+            BookingForm.check_in_date < end,
+            BookingForm.check_out_date > start,
+            or_(BookingForm.is_cancelled == False, BookingForm.is_cancelled.is_(None))
+        ):
+            nights = (booking.check_out_date - booking.check_in_date).days
+            if nights <= 0 or not booking.price:
+                continue
+            in_month = (min(booking.check_out_date, end) - max(booking.check_in_date, start)).days
+            revenues[booking.unit_id] = revenues.get(booking.unit_id, 0) + float(booking.price) / nights * in_month
+        report[start] = revenues
+    return report
+
+
+def main():
+    app, db_path = create_bench_app()
+    correct = True
+    try:
+        with app.app_context():
+            company, manager, staff = seed_company(UNIT_COUNT, bookings_per_unit=95, start=date(YEAR - 1, 12, 28))
+            unit_ids = [unit_id for (unit_id,) in db.session.query(Unit.id).order_by(Unit.id)]
+
+            statements = []
+            event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(1))
+
+            statements.clear()
+            baseline, expected = timed(lambda: per_month_proration(company.id, unit_ids), repeat=1)
+            print(f'per-month proration  {baseline * 1000:>8.1f} ms, {len(statements)} statements')
+
+            statements.clear()
+            seconds, report = timed(lambda: recognize_revenue(company.id, unit_ids, date(YEAR, 1, 1),
+                                                              date(YEAR + 1, 1, 1)).aggregate('month'), repeat=3)
+            print(f'recognize_revenue    {seconds * 1000:>8.1f} ms, {len(statements) // 3} statement')
+
+            for period, revenues in expected.items():
+                for unit_id, amount in revenues.items():
+                    correct &= abs(report[period].get(unit_id, 0) - amount) < 0.005
+            print('monthly totals match' if correct else 'MISMATCH')
+            db.session.remove()
+    finally:
+        os.remove(db_path)
+
+    sys.exit(0 if correct else 1)
+
+
+if __name__ == '__main__':
+    main()
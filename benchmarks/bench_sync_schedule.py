@@ -0,0 +1,93 @@
+"""
+Simulate a day of utils/sync_scheduler.py ticks on a simulated clock.
+
+Feeds are not downloaded: a stub engine reports each due source as changed or
+unchanged (a few "busy" feeds change often, the rest rarely) and records when
+it was synced. Prints sources synced per tick and the median/p95 staleness of
+the calendars over the second half of the day, next to the old 02:00 cron.
+"""
+
+import os
+import random
+import statistics
+from datetime import date, datetime, timedelta
+
+from common import create_bench_app, seed_company
+
+from models import db, CalendarSource, Unit
+from utils.calendar_sync import OUTCOME_SYNCED, OUTCOME_UNCHANGED, SyncResult
+from utils.sync_scheduler import sync_due_calendars
+
+
+SOURCE_COUNT = 200
+BUSY_SHARE = 0.1
+TICK_SECONDS = 60
+SIMULATED_HOURS = 24
+START = datetime(2030, 1, 1, 0, 0)
+
+
+class SimulatedEngine:
+    def __init__(self, busy_ids):
+        self.busy_ids = busy_ids
+        self.last_synced = {}
+        self.now = None
+
+    def run(self, source_ids):
+        results = []
+        for source_id in source_ids:
+            change_rate = 0.3 if source_id in self.busy_ids else 0.01
+            outcome = OUTCOME_SYNCED if random.random() < change_rate else OUTCOME_UNCHANGED
+            results.append(SyncResult(source_id=source_id, source_identifier=None,
+                                      unit_number='', outcome=outcome))
+            self.last_synced[source_id] = self.now
+        return results
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    random.seed(1)
+    app, db_path = create_bench_app()
+    try:
+        with app.app_context():
+            # Bookings start on day 2, so a slice of units has check-ins within 48 hours
+            seed_company(SOURCE_COUNT, bookings_per_unit=3, start=date(2030, 1, 2))
+            units = Unit.query.order_by(Unit.id).all()
+            sources = [CalendarSource(unit_id=unit.id, source_name='Airbnb',
+                                      source_url=f'https://example.invalid/{unit.id}.ics',
+                                      is_active=True)
+                       for unit in units]
+            db.session.add_all(sources)
+            db.session.commit()
+
+            source_ids = [source.id for source in sources]
+            engine = SimulatedEngine(set(random.sample(source_ids, int(len(source_ids) * BUSY_SHARE))))
+
+            per_tick = []
+            staleness = []
+            tick_count = SIMULATED_HOURS * 3600 // TICK_SECONDS
+            for tick in range(tick_count):
+                now = START + timedelta(seconds=tick * TICK_SECONDS)
+                engine.now = now
+                per_tick.append(len(sync_due_calendars(engine=engine, now=now)))
+
+                if tick >= tick_count // 2:
+                    staleness.extend((now - synced).total_seconds() / 60
+                                     for synced in engine.last_synced.values())
+
+            print(f'{SOURCE_COUNT} sources, {SIMULATED_HOURS} h of {TICK_SECONDS} s ticks')
+            print(f'adaptive: {sum(per_tick)} syncs, max {max(per_tick)} per tick, '
+                  f'median staleness {statistics.median(staleness):.0f} min, '
+                  f'p95 {percentile(staleness, 0.95):.0f} min')
+            print(f'02:00 cron: {SOURCE_COUNT} syncs, max {SOURCE_COUNT} per tick, '
+                  f'median staleness {12 * 60} min, p95 {int(0.95 * 24 * 60)} min')
+            db.session.remove()
+    finally:
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Time the yearly expense matrix behind /api/expenses/yearly.
+
+Seeds a year of ExpenseData for a varying share of 500 units and compares one
+query per unit and month, as the endpoint used to run, with
+yearly_expense_matrix(). The columnar JSON size should follow the number of
+rows present, not units x 12.
+"""
+
+import json
+import os
+
+from sqlalchemy import event
+
+from common import create_bench_app, seed_company, timed
+
+from models import db, ExpenseData, Unit
+from utils.expenses import EXPENSE_FIELDS, yearly_expense_matrix
+
+
+UNIT_COUNT = 500
+YEAR = 2024
+
+
+def per_cell_queries(company_id, unit_ids):
+    for unit_id in unit_ids:
+        for month in range(1, 13):
+            ExpenseData.query.filter_by(company_id=company_id, unit_id=unit_id, year=YEAR, month=month).first()
+
+
+def main():
+    app, db_path = create_bench_app()
+    try:
+        with app.app_context():
+            company, manager, staff = seed_company(UNIT_COUNT, bookings_per_unit=0)
+            company_id = company.id
+            unit_ids = [unit_id for (unit_id,) in db.session.query(Unit.id).order_by(Unit.id)]
+
+            statements = []
+            event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(1))
+
+            # Fill the first 10%, then 50%, then all units with twelve months each
+            filled = 0
+            for share in (0.1, 0.5, 1.0):
+                target = int(UNIT_COUNT * share)
+                db.session.execute(db.insert(ExpenseData), [
+                    dict({name: (unit_id % 7 + 1) * 10.5 for name in EXPENSE_FIELDS},
+                         company_id=company_id, unit_id=unit_id, year=YEAR, month=month)
+                    for unit_id in unit_ids[filled:target] for month in range(1, 13)
+                ])
+                db.session.commit()
+                filled = target
+
+                statements.clear()
+                baseline, _ = timed(lambda: per_cell_queries(company_id, unit_ids), repeat=1)
+                baseline_statements = len(statements)
+
+                statements.clear()
+                seconds, matrix = timed(lambda: yearly_expense_matrix(company_id, unit_ids, YEAR), repeat=3)
+                size = len(json.dumps(matrix.to_dict()))
+
+                print(f'{len(matrix):>5} rows: per-cell {baseline * 1000:>7.1f} ms / {baseline_statements} statements, '
+                      f'matrix {seconds * 1000:>6.1f} ms / {len(statements) // 3} statement, {size / 1024:.0f} KiB JSON')
+            db.session.remove()
+    finally:
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Check that unit_day_occupancy follows BookingForm through every write path.
+
+Seeds bookings with a bulk insert, then edits them through the ORM (move,
+cancel, delete, add), the ICS import's insert_bookings(), the CSV import's bulk
+UPDATE and a Query.delete(). After each step the table is compared against a
+rebuild, which must find nothing to repair. Exits 1 on drift.
+"""
+
+import os
+import sys
+from datetime import date, timedelta
+
+from common import create_bench_app, seed_company, timed
+
+from models import db, BookingForm, Unit, UnitDayOccupancy
+from utils.booking_import import insert_bookings
+from utils.daily_occupancy import occupied_units_subquery, rebuild_unit_day_occupancy
+
+
+def check(step):
+    inserted, deleted = rebuild_unit_day_occupancy()
+    db.session.rollback()
+    status = 'ok' if inserted == deleted == 0 else f'DRIFT: {inserted} missing, {deleted} stale'
+    print(f'{step:<28} {UnitDayOccupancy.query.count():>7} rows  {status}')
+    return inserted == deleted == 0
+
+
+def main():
+    app, db_path = create_bench_app()
+    clean = True
+    try:
+        with app.app_context():
+            company, manager, staff = seed_company(200, bookings_per_unit=20, start=date(2030, 1, 1))
+
+            # The seed uses a Core insert, which no event sees: build the table once
+            seconds, _ = timed(rebuild_unit_day_occupancy, repeat=1)
+            db.session.commit()
+            print(f'initial rebuild: {seconds * 1000:.0f} ms')
+            clean &= check('after rebuild')
+
+            bookings = BookingForm.query.order_by(BookingForm.id).limit(4).all()
+            units = Unit.query.order_by(Unit.id).limit(2).all()
+            bookings[0].unit_id = units[1].id
+            bookings[1].check_out_date += timedelta(days=2)
+            bookings[2].is_cancelled = True
+            db.session.delete(bookings[3])
+            db.session.commit()
+            clean &= check('ORM move/extend/cancel/delete')
+
+            template = {column: getattr(bookings[1], column) for column in [
+                'guest_name', 'contact_number', 'property_name', 'number_of_guests', 'price',
+                'booking_source', 'payment_status', 'company_id', 'user_id']}
+            insert_bookings([dict(template, unit_id=units[0].id, check_in_date=date(2031, 1, day),
+                                  check_out_date=date(2031, 1, day + 2), number_of_nights=2)
+                             for day in range(1, 20, 3)])
+            db.session.commit()
+            clean &= check('insert_bookings()')
+
+            ids = [booking_id for (booking_id,) in db.session.query(BookingForm.id).limit(50)]
+            db.session.execute(db.update(BookingForm), [
+                {'id': booking_id, 'is_cancelled': booking_id % 2 == 0} for booking_id in ids])
+            db.session.commit()
+            clean &= check('bulk UPDATE by id')
+
+            BookingForm.query.filter_by(unit_id=units[1].id).delete()
+            db.session.commit()
+            clean &= check('Query.delete()')
+
+            occupied = db.session.query(
+                occupied_units_subquery(date(2030, 1, 10), [unit.id for unit in Unit.query])).scalar()
+            print(f'occupied units on 2030-01-10: {occupied}')
+            db.session.remove()
+    finally:
+        os.remove(db_path)
+
+    sys.exit(0 if clean else 1)
+
+
+if __name__ == '__main__':
+    main()
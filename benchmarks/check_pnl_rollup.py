@@ -0,0 +1,120 @@
+"""
+Check that pnl_rollup follows its source tables through every write path.
+
+Seeds bookings, expenses and repair/replace issues, builds the rollup, then
+edits the sources through the ORM (booking move/cancel/delete, expense edit,
+issue cost and date), the expenses upsert, the CSV import's bulk UPDATE and a
+Query.delete(). After each step the rollup is compared with a full rebuild.
+Finally times a month-over-month comparison read from the rollup. Exits 1 on
+drift.
+"""
+
+import os
+import sys
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import event
+
+from common import create_bench_app, seed_company, timed
+
+from models import db, BookingForm, ExpenseData, Issue, PnlRollup, Type, Unit
+from utils.expenses import upsert_expenses
+from utils.pnl_rollup import pnl_totals, rebuild_pnl_rollup
+
+
+def snapshot():
+    return set(db.session.query(PnlRollup.company_id, PnlRollup.unit_id, PnlRollup.year, PnlRollup.month,
+                                PnlRollup.day, PnlRollup.category, PnlRollup.amount))
+
+
+def check(step):
+    before = snapshot()
+    rebuild_pnl_rollup()
+    after = snapshot()
+    db.session.rollback()
+    status = 'ok' if before == after else f'DRIFT: {len(after - before)} missing, {len(before - after)} stale'
+    print(f'{step:<30} {len(before):>7} rows  {status}')
+    return before == after
+
+
+def main():
+    app, db_path = create_bench_app()
+    clean = True
+    try:
+        with app.app_context():
+            company, manager, staff = seed_company(100, bookings_per_unit=12, start=date(2030, 1, 1))
+            units = Unit.query.order_by(Unit.id).all()
+            repair, replace = Type(name='Repair'), Type(name='Replace')
+            db.session.add_all([repair, replace])
+            db.session.flush()
+
+            db.session.execute(db.insert(ExpenseData), [
+                {'company_id': company.id, 'unit_id': unit.id, 'year': 2030, 'month': month,
+                 'sales': Decimal('3000'), 'rental': Decimal('1200'), 'electricity': Decimal('180.50')}
+                for unit in units for month in range(1, 7)
+            ])
+            db.session.execute(db.insert(Issue), [
+                {'description': 'Aircon leaking', 'unit': unit.unit_number, 'unit_id': unit.id,
+                 'date_added': datetime(2030, 2, 1 + index % 28, 10), 'cost': Decimal('150'),
+                 'type_id': (repair if index % 2 else replace).id, 'user_id': manager.id, 'company_id': company.id}
+                for index, unit in enumerate(units)
+            ])
+
+            # The seed uses Core inserts, which no event sees: build the rollup once
+            seconds, refreshed = timed(rebuild_pnl_rollup, repeat=1)
+            db.session.commit()
+            print(f'initial rebuild: {refreshed} unit-months in {seconds * 1000:.0f} ms')
+            clean &= check('after rebuild')
+
+            bookings = BookingForm.query.order_by(BookingForm.id).limit(3).all()
+            bookings[0].unit_id = units[1].id
+            bookings[1].is_cancelled = True
+            db.session.delete(bookings[2])
+            db.session.commit()
+            clean &= check('ORM booking move/cancel/delete')
+
+            expense = ExpenseData.query.filter_by(unit_id=units[0].id, month=3).one()
+            expense.month = 9
+            expense.water = Decimal('45')
+            issue = Issue.query.order_by(Issue.id).first()
+            issue.cost = Decimal('999')
+            issue.date_added += timedelta(days=40)
+            db.session.commit()
+            clean &= check('ORM expense/issue edits')
+
+            upsert_expenses(company.id, 2030, 4, {unit.id: {'repair': Decimal('80')} for unit in units[:20]})
+            db.session.commit()
+            clean &= check('expenses upsert')
+
+            ids = [booking_id for (booking_id,) in db.session.query(BookingForm.id).limit(40)]
+            db.session.execute(db.update(BookingForm), [
+                {'id': booking_id, 'price': Decimal('321.00')} for booking_id in ids])
+            db.session.commit()
+            clean &= check('bulk UPDATE by id')
+
+            BookingForm.query.filter_by(unit_id=units[5].id).delete()
+            ExpenseData.query.filter_by(unit_id=units[5].id).delete()
+            db.session.commit()
+            clean &= check('Query.delete()')
+
+            statements = []
+            event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(1))
+            unit_ids = [unit.id for unit in units]
+
+            def month_over_month():
+                return (pnl_totals(company.id, date(2030, 2, 1), date(2030, 2, 28), 'month', unit_ids),
+                        pnl_totals(company.id, date(2030, 1, 1), date(2030, 1, 31), 'month', unit_ids))
+
+            seconds, (current, previous) = timed(month_over_month)
+            print(f'month over month: {seconds * 1000:.1f} ms, {len(statements) // 5} statements, '
+                  f'booking revenue {current.get("booking_revenue", 0):,.0f} vs {previous.get("booking_revenue", 0):,.0f}')
+            db.session.remove()
+    finally:
+        os.remove(db_path)
+
+    sys.exit(0 if clean else 1)
+
+
+if __name__ == '__main__':
+    main()
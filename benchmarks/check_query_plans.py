@@ -0,0 +1,146 @@
+"""
+Check that the hot queries in routes/ are served by indexes.
+
+Runs EXPLAIN QUERY PLAN for each query below against a fresh SQLite schema built
+from models.py and exits with status 1 if any of them falls back to a full table
+scan. Add a query here whenever a new filter shows up on a hot path.
+
+Run from the repository root:
+    python benchmarks/check_query_plans.py
+"""
+
+import os
+import re
+import sys
+from datetime import date, datetime
+
+from common import create_bench_app
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects import sqlite
+
+from models import db, Unit, BookingForm, Issue, Holiday, CalendarSource, ExpenseData, BookingCalendarSource
+
+
+COMPANY_ID = 1
+UNIT_ID = 1
+TODAY = date(2025, 6, 15)
+MONTH_START = date(2025, 6, 1)
+MONTH_END = date(2025, 6, 30)
+
+# "SCAN booking_form" (or "SCAN TABLE booking_form" on older SQLite) without an index
+FULL_SCAN_PATTERN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+
+def hot_queries():
+    """(name, statement) pairs mirroring the filters used in routes/"""
+    return [
+        ('bookings page (routes/bookings.py)',
+         select(BookingForm.id).where(BookingForm.company_id == COMPANY_ID)
+         .order_by(BookingForm.date_added.desc(), BookingForm.id.desc()).limit(51)),
+        ('booking counters (utils/booking_stats.py)',
+         select(BookingForm.id).where(BookingForm.company_id == COMPANY_ID,
+                                      BookingForm.check_in_date <= TODAY,
+                                      BookingForm.check_out_date >= TODAY)),
+        ('unit availability (routes/bookings.py)',
+         select(BookingForm.id).where(BookingForm.unit_id == UNIT_ID,
+                                      BookingForm.check_in_date < MONTH_END,
+                                      BookingForm.check_out_date > MONTH_START)),
+        ('import by confirmation code (routes/bookings.py, routes/calendar.py)',
+         select(BookingForm.id).where(BookingForm.confirmation_code == 'HM123',
+                                      BookingForm.company_id == COMPANY_ID)),
+        ('calendar mapping by confirmation code (routes/calendar.py)',
+         select(BookingForm.id).where(BookingForm.confirmation_code == 'HM123',
+                                      BookingForm.unit_id == UNIT_ID)),
+        ('calendar reconciliation (routes/calendar.py)',
+         select(BookingForm.id).where(BookingForm.unit_id == UNIT_ID,
+                                      BookingForm.booking_source == 'Airbnb')),
+        ('monthly occupancy (routes/occupancy.py)',
+         select(BookingForm.id).where(BookingForm.company_id == COMPANY_ID,
+                                      BookingForm.check_in_date <= MONTH_END,
+                                      BookingForm.check_out_date >= MONTH_START)),
+        ('checkouts tomorrow (routes/cleaners.py)',
+         select(BookingForm.id).where(BookingForm.check_out_date == TODAY,
+                                      BookingForm.company_id == COMPANY_ID)),
+        ('monthly revenue (routes/dashboard.py)',
+         select(BookingForm.id).where(BookingForm.company_id == COMPANY_ID,
+                                      BookingForm.check_in_date >= MONTH_START,
+                                      BookingForm.check_in_date <= MONTH_END)),
+        ('issue list (routes/issues.py, routes/cleaners.py)',
+         select(Issue.id).where(Issue.company_id == COMPANY_ID).order_by(Issue.date_added.desc())),
+        ('issue heatmap (routes/dashboard.py)',
+         select(Issue.id).where(Issue.company_id == COMPANY_ID,
+                                Issue.unit_id == UNIT_ID,
+                                Issue.category_id == 1)),
+        ('issue costs (routes/expenses.py)',
+         select(Issue.id).where(Issue.company_id == COMPANY_ID,
+                                Issue.date_added >= datetime(2025, 6, 1),
+                                Issue.date_added < datetime(2025, 7, 1),
+                                Issue.cost.isnot(None))),
+        ('unit issues (routes/units.py)',
+         select(Issue.id).where(Issue.unit_id == UNIT_ID).order_by(Issue.date_added.desc()).limit(10)),
+        ('company holidays (routes/occupancy.py)',
+         select(Holiday.id).where(Holiday.holiday_type_id == 1,
+                                  Holiday.company_id == COMPANY_ID,
+                                  Holiday.is_deleted == False,
+                                  Holiday.date.between(MONTH_START, MONTH_END))),
+        ('system holidays (routes/occupancy.py)',
+         select(Holiday.id).where(Holiday.holiday_type_id == 1,
+                                  Holiday.company_id == None,
+                                  Holiday.date.between(MONTH_START, MONTH_END))),
+        ('unit calendar sources (routes/calendar.py)',
+         select(CalendarSource.id).where(CalendarSource.unit_id == UNIT_ID,
+                                         CalendarSource.is_active == True)),
+        ('scheduled calendar sync (app.py)',
+         select(CalendarSource.id).where(CalendarSource.source_url.isnot(None),
+                                         CalendarSource.is_active == True)),
+        ('bookings for calendar source (routes/calendar.py)',
+         select(BookingCalendarSource.id).where(BookingCalendarSource.calendar_source_id == 1)),
+        ('monthly expenses (routes/expenses.py)',
+         select(ExpenseData.id).where(ExpenseData.company_id == COMPANY_ID,
+                                      ExpenseData.year == 2025,
+                                      ExpenseData.month == 6)),
+        ('yearly expenses (routes/dashboard.py)',
+         select(ExpenseData.id).where(ExpenseData.company_id == COMPANY_ID,
+                                      ExpenseData.year == 2025)),
+        ('accessible units (utils/access_control.py)',
+         select(Unit.id).where(Unit.company_id == COMPANY_ID)),
+    ]
+
+
+def explain(statement):
+    """Return the EXPLAIN QUERY PLAN detail lines for a statement"""
+    sql = str(statement.compile(dialect=sqlite.dialect(), compile_kwargs={'literal_binds': True}))
+    rows = db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')).fetchall()
+    return [row[3] for row in rows]
+
+
+def main():
+    app, db_path = create_bench_app()
+    failures = []
+
+    try:
+        with app.app_context():
+            for name, statement in hot_queries():
+                details = explain(statement)
+                full_scans = [detail for detail in details if FULL_SCAN_PATTERN.match(detail)]
+                status = 'FAIL' if full_scans else 'ok'
+                print(f'[{status:>4}] {name}')
+                for detail in details:
+                    print(f'         {detail}')
+                if full_scans:
+                    failures.append(name)
+    finally:
+        os.remove(db_path)
+
+    if failures:
+        print(f'\n{len(failures)} hot queries use a full table scan:')
+        for name in failures:
+            print(f'  - {name}')
+        sys.exit(1)
+
+    print('\nAll hot queries are served by an index')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Shared helpers for the benchmark scripts in this directory.
+
+The scripts build their own Flask app on a throwaway SQLite database instead of
+importing app.py, so they never touch propertyhub.db or start the scheduler.
+
+Run from the repository root, e.g.:
+    python benchmarks/bench_access_filter.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from models import db, Company, Role, User, Unit, BookingForm
+
+
+def create_bench_app(db_path=None):
+    """Create a minimal app bound to a temporary SQLite database"""
+    if db_path is None:
+        handle, db_path = tempfile.mkstemp(suffix='.db', prefix='bench_')
+        os.close(handle)
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = 'benchmark'
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+
+    return app, db_path
+
+
+def seed_company(unit_count, bookings_per_unit=10, start=date(2024, 1, 1)):
+    """
+    Seed one company with a Manager and a Staff user, `unit_count` units and
+    back-to-back bookings for each unit. Returns (company, manager, staff).
+
+    The Staff user is assigned every other unit.
+    """
+    company = Company(name=f'Bench Company {unit_count}', max_units=unit_count)
+    db.session.add(company)
+
+    roles = {}
+    for name in ['Manager', 'Staff']:
+        role = Role.query.filter_by(name=name).first()
+        if not role:
+            role = Role(name=name, can_view_bookings=True, can_view_issues=True)
+            db.session.add(role)
+        roles[name] = role
+    db.session.flush()
+
+    manager = User(name='Manager', email=f'manager{company.id}@bench.local', password='x',
+                   company_id=company.id, role_id=roles['Manager'].id)
+    staff = User(name='Staff', email=f'staff{company.id}@bench.local', password='x',
+                 company_id=company.id, role_id=roles['Staff'].id)
+    db.session.add_all([manager, staff])
+    db.session.flush()
+
+    units = []
+    for index in range(unit_count):
+        units.append(Unit(unit_number=f'U-{index:05d}', building=f'Block {index % 10}',
+                          floor=index % 30, company_id=company.id,
+                          max_pax=2 + index % 6, bedrooms=1 + index % 4))
+    db.session.add_all(units)
+    db.session.flush()
+
+    staff.assigned_staff_units = units[::2]
+
+    bookings = []
+    for unit in units:
+        check_in = start + timedelta(days=unit.id % 7)
+        for _ in range(bookings_per_unit):
+            nights = 1 + (unit.id + len(bookings)) % 5
+            check_out = check_in + timedelta(days=nights)
+            bookings.append({
+                'guest_name': 'Guest',
+                'contact_number': '',
+                'check_in_date': check_in,
+                'check_out_date': check_out,
+                'property_name': unit.building,
+                'unit_id': unit.id,
+                'number_of_nights': nights,
+                'number_of_guests': 2,
+                'price': 100 * nights,
+                'booking_source': 'Airbnb',
+                'payment_status': 'Paid',
+                'is_cancelled': False,
+                'company_id': company.id,
+                'user_id': manager.id,
+            })
+            check_in = check_out + timedelta(days=1)
+    if bookings:
+        db.session.execute(BookingForm.__table__.insert(), bookings)
+    db.session.commit()
+
+    return company, manager, staff
+
+
+def timed(func, repeat=5):
+    """Run func `repeat` times and return (best seconds, last result)"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
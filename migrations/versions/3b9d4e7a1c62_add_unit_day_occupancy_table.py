@@ -0,0 +1,78 @@
+"""Add unit day occupancy table
+
+Revision ID: 3b9d4e7a1c62
+Revises: e81f3a6c29b5
+Create Date: 2026-10-17 13:41:19.668214
+
+"""
+from datetime import timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9d4e7a1c62'
+down_revision = 'e81f3a6c29b5'
+branch_labels = None
+depends_on = None
+
+
+# Rows inserted per statement while filling the table
+FILL_BATCH_SIZE = 5000
+
+
+def upgrade():
+    op.create_table('unit_day_occupancy',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('unit_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('booking_id', sa.Integer(), nullable=False),
+    sa.Column('is_checkin', sa.Boolean(), nullable=False),
+    sa.Column('is_checkout', sa.Boolean(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('booking_id', 'date', name='_booking_date_uc')
+    )
+    with op.batch_alter_table('unit_day_occupancy', schema=None) as batch_op:
+        batch_op.create_index('ix_unit_day_occupancy_unit_date', ['unit_id', 'date'], unique=False)
+        batch_op.create_index('ix_unit_day_occupancy_date_unit', ['date', 'unit_id'], unique=False)
+
+    # One row per day from check-in to check-out inclusive for every active
+    # booking, as utils.daily_occupancy.expand_booking_days() writes them
+    connection = op.get_bind()
+    booking_form = sa.table('booking_form', sa.column('id', sa.Integer), sa.column('unit_id', sa.Integer),
+                            sa.column('check_in_date', sa.Date), sa.column('check_out_date', sa.Date),
+                            sa.column('is_cancelled', sa.Boolean))
+    occupancy = sa.table('unit_day_occupancy', sa.column('unit_id', sa.Integer), sa.column('date', sa.Date),
+                         sa.column('booking_id', sa.Integer), sa.column('is_checkin', sa.Boolean),
+                         sa.column('is_checkout', sa.Boolean))
+
+    bookings = connection.execute(
+        sa.select(booking_form.c.id, booking_form.c.unit_id, booking_form.c.check_in_date,
+                  booking_form.c.check_out_date)
+        .where(booking_form.c.unit_id.isnot(None),
+               booking_form.c.check_in_date.isnot(None),
+               booking_form.c.check_out_date.isnot(None),
+               sa.or_(booking_form.c.is_cancelled == False, booking_form.c.is_cancelled.is_(None)))
+    ).all()
+
+    rows = []
+    for booking_id, unit_id, check_in_date, check_out_date in bookings:
+        day = check_in_date
+        while day <= check_out_date:
+            rows.append({'unit_id': unit_id, 'date': day, 'booking_id': booking_id,
+                         'is_checkin': day == check_in_date, 'is_checkout': day == check_out_date})
+            day += timedelta(days=1)
+        if len(rows) >= FILL_BATCH_SIZE:
+            connection.execute(occupancy.insert(), rows)
+            rows = []
+    if rows:
+        connection.execute(occupancy.insert(), rows)
+
+
+def downgrade():
+    with op.batch_alter_table('unit_day_occupancy', schema=None) as batch_op:
+        batch_op.drop_index('ix_unit_day_occupancy_date_unit')
+        batch_op.drop_index('ix_unit_day_occupancy_unit_date')
+
+    op.drop_table('unit_day_occupancy')
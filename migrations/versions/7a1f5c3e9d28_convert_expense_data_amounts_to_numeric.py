@@ -0,0 +1,108 @@
+"""Convert expense data amounts to numeric
+
+Revision ID: 7a1f5c3e9d28
+Revises: 3b9d4e7a1c62
+Create Date: 2026-10-17 15:02:44.318406
+
+"""
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a1f5c3e9d28'
+down_revision = '3b9d4e7a1c62'
+branch_labels = None
+depends_on = None
+
+
+AMOUNT_COLUMNS = ['sales', 'rental', 'electricity', 'water', 'sewage', 'internet', 'cleaner',
+                  'laundry', 'supplies', 'repair', 'replace', 'other']
+MAX_AMOUNT = Decimal('9999999999.99')
+
+
+def clean_amount(raw):
+    """Normalized amount string, None for an empty value; ValueError if it isn't a number"""
+    text = raw.strip().upper().replace('RM', '').replace(',', '').replace(' ', '')
+    if text in ('', '-'):
+        return None
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(raw)
+    if not amount.is_finite() or abs(amount) > MAX_AMOUNT:
+        raise ValueError(raw)
+    return str(amount.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+
+
+def upgrade():
+    op.create_table('expense_data_rejection',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('expense_data_id', sa.Integer(), nullable=False),
+    sa.Column('column_name', sa.String(length=50), nullable=False),
+    sa.Column('raw_value', sa.String(length=50), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('expense_data_rejection', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_expense_data_rejection_expense_data_id'), ['expense_data_id'], unique=False)
+
+    # Clean the stored strings while the columns are still text: values that
+    # aren't numbers are recorded in expense_data_rejection and emptied
+    connection = op.get_bind()
+    expense_data = sa.table('expense_data', sa.column('id', sa.Integer),
+                            *[sa.column(name, sa.String) for name in AMOUNT_COLUMNS])
+    rejection = sa.table('expense_data_rejection', sa.column('expense_data_id', sa.Integer),
+                         sa.column('column_name', sa.String), sa.column('raw_value', sa.String),
+                         sa.column('created_at', sa.DateTime))
+
+    now = datetime.utcnow()
+    rejected = []
+    for row in connection.execute(sa.select(expense_data)).mappings().all():
+        changes = {}
+        for name in AMOUNT_COLUMNS:
+            raw = row[name]
+            if raw is None:
+                continue
+            try:
+                cleaned = clean_amount(raw)
+            except ValueError:
+                cleaned = None
+                rejected.append({'expense_data_id': row['id'], 'column_name': name,
+                                 'raw_value': raw, 'created_at': now})
+            if cleaned != raw:
+                changes[name] = cleaned
+        if changes:
+            connection.execute(expense_data.update().where(expense_data.c.id == row['id']).values(**changes))
+
+    if rejected:
+        connection.execute(rejection.insert(), rejected)
+        print(f'expense_data: {len(rejected)} amounts were not numbers and were emptied, '
+              f'see the expense_data_rejection table')
+
+    with op.batch_alter_table('expense_data', schema=None) as batch_op:
+        for name in AMOUNT_COLUMNS:
+            batch_op.alter_column(name,
+                                  existing_type=sa.String(length=50),
+                                  type_=sa.Numeric(precision=12, scale=2),
+                                  existing_nullable=True,
+                                  postgresql_using=f'"{name}"::numeric(12, 2)')
+
+
+def downgrade():
+    # Amounts rejected by the upgrade are not restored
+    with op.batch_alter_table('expense_data', schema=None) as batch_op:
+        for name in AMOUNT_COLUMNS:
+            batch_op.alter_column(name,
+                                  existing_type=sa.Numeric(precision=12, scale=2),
+                                  type_=sa.String(length=50),
+                                  existing_nullable=True,
+                                  postgresql_using=f'"{name}"::varchar(50)')
+
+    with op.batch_alter_table('expense_data_rejection', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_expense_data_rejection_expense_data_id'))
+
+    op.drop_table('expense_data_rejection')
@@ -0,0 +1,30 @@
+"""Add feed validators to calendar source
+
+Revision ID: a784a92b69c4
+Revises: dda47f4bb54e
+Create Date: 2026-10-17 10:04:27.551930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a784a92b69c4'
+down_revision = 'dda47f4bb54e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('calendar_source', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('etag', sa.String(length=200), nullable=True))
+        batch_op.add_column(sa.Column('last_modified', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('calendar_source', schema=None) as batch_op:
+        batch_op.drop_column('content_hash')
+        batch_op.drop_column('last_modified')
+        batch_op.drop_column('etag')
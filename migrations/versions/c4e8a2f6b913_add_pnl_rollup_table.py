@@ -0,0 +1,127 @@
+"""Add pnl rollup table
+
+Revision ID: c4e8a2f6b913
+Revises: 7a1f5c3e9d28
+Create Date: 2026-10-17 16:20:37.904152
+
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a2f6b913'
+down_revision = '7a1f5c3e9d28'
+branch_labels = None
+depends_on = None
+
+
+# Rows inserted per statement while filling the table
+FILL_BATCH_SIZE = 5000
+
+# ExpenseData money columns at the time of this revision; sales is the revenue
+EXPENSE_FIELDS = ['sales', 'rental', 'electricity', 'water', 'sewage', 'internet', 'cleaner',
+                  'laundry', 'supplies', 'repair', 'replace', 'other']
+ISSUE_COST_CATEGORIES = {'Repair': 'repair_cost', 'Replace': 'replace_cost'}
+
+
+def upgrade():
+    op.create_table('pnl_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('company_id', sa.Integer(), nullable=False),
+    sa.Column('unit_id', sa.Integer(), nullable=False),
+    sa.Column('year', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Integer(), nullable=False),
+    sa.Column('category', sa.String(length=30), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('company_id', 'unit_id', 'year', 'month', 'day', 'category', name='_pnl_rollup_uc')
+    )
+    with op.batch_alter_table('pnl_rollup', schema=None) as batch_op:
+        batch_op.create_index('ix_pnl_rollup_company_year_month', ['company_id', 'year', 'month'], unique=False)
+        batch_op.create_index('ix_pnl_rollup_unit_year_month', ['unit_id', 'year', 'month'], unique=False)
+
+    # Fill it the way utils.pnl_rollup._refresh_month() computes a month:
+    # monthly amounts on day 0, every booked night with its share of the price,
+    # repair/replace issue costs on the day they were logged
+    connection = op.get_bind()
+    expense_data = sa.table('expense_data', sa.column('company_id', sa.Integer), sa.column('unit_id', sa.Integer),
+                            sa.column('year', sa.Integer), sa.column('month', sa.Integer),
+                            *[sa.column(name, sa.Numeric(12, 2)) for name in EXPENSE_FIELDS])
+    booking_form = sa.table('booking_form', sa.column('company_id', sa.Integer), sa.column('unit_id', sa.Integer),
+                            sa.column('check_in_date', sa.Date), sa.column('check_out_date', sa.Date),
+                            sa.column('price', sa.Numeric(10, 2)), sa.column('is_cancelled', sa.Boolean))
+    issue = sa.table('issue', sa.column('company_id', sa.Integer), sa.column('unit_id', sa.Integer),
+                     sa.column('date_added', sa.DateTime), sa.column('cost', sa.Numeric(10, 2)),
+                     sa.column('type_id', sa.Integer))
+    issue_type = sa.table('type', sa.column('id', sa.Integer), sa.column('name', sa.String))
+    pnl_rollup = sa.table('pnl_rollup', sa.column('company_id', sa.Integer), sa.column('unit_id', sa.Integer),
+                          sa.column('year', sa.Integer), sa.column('month', sa.Integer),
+                          sa.column('day', sa.Integer), sa.column('category', sa.String),
+                          sa.column('amount', sa.Numeric(14, 2)))
+
+    amounts = defaultdict(Decimal)
+
+    for row in connection.execute(
+        sa.select(expense_data.c.company_id, expense_data.c.unit_id, expense_data.c.year, expense_data.c.month,
+                  *[expense_data.c[name] for name in EXPENSE_FIELDS])
+        .where(expense_data.c.company_id.isnot(None), expense_data.c.unit_id.isnot(None))
+    ):
+        company_id, unit_id, year, month = row[:4]
+        for name, value in zip(EXPENSE_FIELDS, row[4:]):
+            if value:
+                amounts[(company_id, unit_id, year, month, 0, name)] += Decimal(str(value))
+
+    for company_id, unit_id, check_in, check_out, price in connection.execute(
+        sa.select(booking_form.c.company_id, booking_form.c.unit_id, booking_form.c.check_in_date,
+                  booking_form.c.check_out_date, booking_form.c.price)
+        .where(booking_form.c.company_id.isnot(None),
+               booking_form.c.unit_id.isnot(None),
+               booking_form.c.check_in_date.isnot(None),
+               booking_form.c.check_out_date.isnot(None),
+               sa.or_(booking_form.c.is_cancelled == False, booking_form.c.is_cancelled.is_(None)))
+    ):
+        nights = (check_out - check_in).days
+        rate = Decimal(str(price)) / nights if nights > 0 and price else Decimal(0)
+        night = check_in
+        while night < check_out:
+            amounts[(company_id, unit_id, night.year, night.month, night.day, 'booked_nights')] += 1
+            if rate:
+                amounts[(company_id, unit_id, night.year, night.month, night.day, 'booking_revenue')] += rate
+            night += timedelta(days=1)
+
+    for company_id, unit_id, date_added, cost, type_name in connection.execute(
+        sa.select(issue.c.company_id, issue.c.unit_id, issue.c.date_added, issue.c.cost, issue_type.c.name)
+        .select_from(issue.join(issue_type, issue.c.type_id == issue_type.c.id))
+        .where(issue.c.company_id.isnot(None), issue.c.unit_id.isnot(None), issue.c.cost.isnot(None),
+               issue.c.date_added.isnot(None), issue_type.c.name.in_(ISSUE_COST_CATEGORIES))
+    ):
+        amounts[(company_id, unit_id, date_added.year, date_added.month, date_added.day,
+                 ISSUE_COST_CATEGORIES[type_name])] += Decimal(str(cost))
+
+    rows = []
+    for (company_id, unit_id, year, month, day, category), amount in amounts.items():
+        # Nightly revenue shares carry more decimals than the column keeps
+        amount = amount.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        if not amount:
+            continue
+        rows.append({'company_id': company_id, 'unit_id': unit_id, 'year': year, 'month': month,
+                     'day': day, 'category': category, 'amount': amount})
+        if len(rows) >= FILL_BATCH_SIZE:
+            connection.execute(pnl_rollup.insert(), rows)
+            rows = []
+    if rows:
+        connection.execute(pnl_rollup.insert(), rows)
+
+
+def downgrade():
+    with op.batch_alter_table('pnl_rollup', schema=None) as batch_op:
+        batch_op.drop_index('ix_pnl_rollup_unit_year_month')
+        batch_op.drop_index('ix_pnl_rollup_company_year_month')
+
+    op.drop_table('pnl_rollup')
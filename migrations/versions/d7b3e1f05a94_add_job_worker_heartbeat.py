@@ -0,0 +1,28 @@
+"""Add worker and heartbeat to background job
+
+Revision ID: d7b3e1f05a94
+Revises: c4e8a2f6b913
+Create Date: 2026-10-17 16:05:41.338120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7b3e1f05a94'
+down_revision = 'c4e8a2f6b913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('background_job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('worker_id', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('background_job', schema=None) as batch_op:
+        batch_op.drop_column('heartbeat_at')
+        batch_op.drop_column('worker_id')
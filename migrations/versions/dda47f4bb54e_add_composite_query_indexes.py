@@ -0,0 +1,80 @@
+"""Add composite query indexes
+
+Revision ID: dda47f4bb54e
+Revises: 9f5499018bb7
+Create Date: 2026-10-17 09:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'dda47f4bb54e'
+down_revision = '9f5499018bb7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('unit', schema=None) as batch_op:
+        batch_op.create_index('ix_unit_company_id', ['company_id'], unique=False)
+
+    with op.batch_alter_table('booking_form', schema=None) as batch_op:
+        batch_op.create_index('ix_booking_form_company_check_in', ['company_id', 'check_in_date'], unique=False)
+        batch_op.create_index('ix_booking_form_company_check_out', ['company_id', 'check_out_date'], unique=False)
+        batch_op.create_index('ix_booking_form_company_date_added', ['company_id', 'date_added', 'id'], unique=False)
+        batch_op.create_index('ix_booking_form_unit_dates', ['unit_id', 'check_in_date', 'check_out_date'], unique=False)
+        batch_op.create_index('ix_booking_form_unit_source', ['unit_id', 'booking_source'], unique=False)
+        batch_op.create_index('ix_booking_form_confirmation_code', ['confirmation_code', 'company_id'], unique=False)
+
+    with op.batch_alter_table('issue', schema=None) as batch_op:
+        batch_op.create_index('ix_issue_company_date_added', ['company_id', 'date_added'], unique=False)
+        batch_op.create_index('ix_issue_company_unit_category', ['company_id', 'unit_id', 'category_id'], unique=False)
+        batch_op.create_index('ix_issue_company_status', ['company_id', 'status_id'], unique=False)
+        batch_op.create_index('ix_issue_unit_date_added', ['unit_id', 'date_added'], unique=False)
+
+    with op.batch_alter_table('calendar_source', schema=None) as batch_op:
+        batch_op.create_index('ix_calendar_source_unit_active', ['unit_id', 'is_active'], unique=False)
+        batch_op.create_index('ix_calendar_source_active', ['is_active'], unique=False)
+
+    with op.batch_alter_table('expense_data', schema=None) as batch_op:
+        batch_op.create_index('ix_expense_data_company_year_month', ['company_id', 'year', 'month'], unique=False)
+
+    with op.batch_alter_table('holiday', schema=None) as batch_op:
+        batch_op.create_index('ix_holiday_type_company_date', ['holiday_type_id', 'company_id', 'date'], unique=False)
+
+    with op.batch_alter_table('booking_calendar_source', schema=None) as batch_op:
+        batch_op.create_index('ix_booking_calendar_source_source_id', ['calendar_source_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('booking_calendar_source', schema=None) as batch_op:
+        batch_op.drop_index('ix_booking_calendar_source_source_id')
+
+    with op.batch_alter_table('holiday', schema=None) as batch_op:
+        batch_op.drop_index('ix_holiday_type_company_date')
+
+    with op.batch_alter_table('expense_data', schema=None) as batch_op:
+        batch_op.drop_index('ix_expense_data_company_year_month')
+
+    with op.batch_alter_table('calendar_source', schema=None) as batch_op:
+        batch_op.drop_index('ix_calendar_source_active')
+        batch_op.drop_index('ix_calendar_source_unit_active')
+
+    with op.batch_alter_table('issue', schema=None) as batch_op:
+        batch_op.drop_index('ix_issue_unit_date_added')
+        batch_op.drop_index('ix_issue_company_status')
+        batch_op.drop_index('ix_issue_company_unit_category')
+        batch_op.drop_index('ix_issue_company_date_added')
+
+    with op.batch_alter_table('booking_form', schema=None) as batch_op:
+        batch_op.drop_index('ix_booking_form_confirmation_code')
+        batch_op.drop_index('ix_booking_form_unit_source')
+        batch_op.drop_index('ix_booking_form_unit_dates')
+        batch_op.drop_index('ix_booking_form_company_date_added')
+        batch_op.drop_index('ix_booking_form_company_check_out')
+        batch_op.drop_index('ix_booking_form_company_check_in')
+
+    with op.batch_alter_table('unit', schema=None) as batch_op:
+        batch_op.drop_index('ix_unit_company_id')
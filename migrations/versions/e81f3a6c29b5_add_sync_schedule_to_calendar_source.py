@@ -0,0 +1,34 @@
+"""Add sync schedule to calendar source
+
+Revision ID: e81f3a6c29b5
+Revises: 5c2e8b1d7f40
+Create Date: 2026-10-17 12:18:45.903127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e81f3a6c29b5'
+down_revision = '5c2e8b1d7f40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('calendar_source', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('next_sync_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('sync_interval', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('last_changed_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('sync_failures', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index('ix_calendar_source_active_next_sync', ['is_active', 'next_sync_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('calendar_source', schema=None) as batch_op:
+        batch_op.drop_index('ix_calendar_source_active_next_sync')
+        batch_op.drop_column('sync_failures')
+        batch_op.drop_column('last_changed_at')
+        batch_op.drop_column('sync_interval')
+        batch_op.drop_column('next_sync_at')
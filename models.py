@@ -185,29 +185,15 @@ class User(db.Model, UserMixin):
 
     def get_accessible_unit_ids(self):
         """Get IDs of units that this user can access"""
-        return [unit.id for unit in self.get_accessible_units()]
+        from utils.access_control import get_access_context
+        return list(get_access_context(self).unit_id_list)
 
 
     def can_access_unit(self, unit_id):
         """Check if user can access a specific unit"""
-        # Convert unit_id to int to handle form data (strings)
-        try:
-            unit_id = int(unit_id)
-        except (ValueError, TypeError):
-            return False
-
-        if self.role.name in ['Admin', 'Manager'] or self.is_admin:
-            # Admins and Managers can access all units in their company
-            unit = Unit.query.get(unit_id)
-            return unit and unit.company_id == self.company_id
-        elif self.role.name == 'Staff':
-            # Staff can only access assigned units
-            return unit_id in self.get_accessible_unit_ids()
-        elif self.role.name == 'Cleaner':
-            # Cleaners can access units assigned for cleaning
-            return unit_id in [unit.id for unit in self.assigned_units]
-        else:
-            return False
+        # Resolved once per request from the cached access context
+        from utils.access_control import get_access_context
+        return get_access_context(self).can_access_unit(unit_id)
 
     @property
     def is_admin(self):
@@ -215,35 +201,10 @@ class User(db.Model, UserMixin):
 
     def has_permission(self, permission):
         """Check if user has a specific permission, considering custom overrides and role defaults"""
-
-        # Admin users have all permissions
-        if self.role.is_admin:
-            return True
-
-        # Managers get their role permissions by default
-        if self.role.name == 'Manager':
-            return getattr(self.role, permission, False)
-
-        # For Staff and Cleaner roles, check custom permissions first
-        # If no custom permissions exist, deny by default (managers control access explicitly)
-        if self.role.name in ['Staff', 'Cleaner']:
-            custom_perms = CustomUserPermission.query.filter_by(
-                user_id=self.id,
-                company_id=self.company_id
-            ).first()
-
-            if custom_perms:
-                # If custom permissions exist, check the custom value
-                custom_value = getattr(custom_perms, permission, None)
-                if custom_value is not None:  # explicit True or False
-                    return custom_value
-
-            # If no custom permissions exist for Staff/Cleaner, deny by default
-            return False
-
-        # For any other roles, use role defaults
-        role_permission = getattr(self.role, permission, False)
-        return role_permission
+        # Admins get everything, Managers use role defaults and Staff/Cleaners only get
+        # explicit custom overrides; the effective map is resolved once per request
+        from utils.access_control import get_access_context
+        return get_access_context(self).has_permission(permission)
 
     def __repr__(self):
         return f"User('{self.name}', '{self.email}', '{self.company.name}', '{self.role.name}')"
@@ -284,7 +245,10 @@ class Unit(db.Model):
     replacements = db.relationship('Replacement', backref='unit_details', lazy=True)
 
     # Add a composite unique constraint for unit_number and company_id
-    __table_args__ = (db.UniqueConstraint('unit_number', 'company_id', name='_unit_company_uc'),)
+    __table_args__ = (
+        db.UniqueConstraint('unit_number', 'company_id', name='_unit_company_uc'),
+        db.Index('ix_unit_company_id', 'company_id'),
+    )
 
     def __repr__(self):
         return f"Unit('{self.unit_number}', Building: '{self.building}')"
@@ -395,6 +359,14 @@ class Issue(db.Model):
     issue_item = db.relationship('IssueItem', backref='issues')  # New relationship
     company = db.relationship('Company', backref='issues')
 
+    # Indexes for the issue list, dashboard heatmap and cost reports
+    __table_args__ = (
+        db.Index('ix_issue_company_date_added', 'company_id', 'date_added'),
+        db.Index('ix_issue_company_unit_category', 'company_id', 'unit_id', 'category_id'),
+        db.Index('ix_issue_company_status', 'company_id', 'status_id'),
+        db.Index('ix_issue_unit_date_added', 'unit_id', 'date_added'),
+    )
+
     def __repr__(self):
         return f"Issue('{self.description}', '{self.unit}')"
 
@@ -471,6 +443,16 @@ class BookingForm(db.Model):
     author = db.relationship('User', backref='bookings')
     date_added = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
+    # Indexes for date range lookups, availability checks and calendar imports
+    __table_args__ = (
+        db.Index('ix_booking_form_company_check_in', 'company_id', 'check_in_date'),
+        db.Index('ix_booking_form_company_check_out', 'company_id', 'check_out_date'),
+        db.Index('ix_booking_form_company_date_added', 'company_id', 'date_added', 'id'),
+        db.Index('ix_booking_form_unit_dates', 'unit_id', 'check_in_date', 'check_out_date'),
+        db.Index('ix_booking_form_unit_source', 'unit_id', 'booking_source'),
+        db.Index('ix_booking_form_confirmation_code', 'confirmation_code', 'company_id'),
+    )
+
     def __repr__(self):
         return f"Booking('{self.guest_name}', '{self.unit.unit_number}', Check-in: '{self.check_in_date}')"
 
@@ -484,8 +466,26 @@ class CalendarSource(db.Model):
     last_updated = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)  # New field: to enable/disable sources
 
+    # Validators of the last download, sent back as If-None-Match/If-Modified-Since
+    etag = db.Column(db.String(200), nullable=True)
+    last_modified = db.Column(db.String(100), nullable=True)
+    # SHA-256 of the last successfully processed feed body
+    content_hash = db.Column(db.String(64), nullable=True)
+
+    # Per-source schedule kept by utils/sync_scheduler.py
+    next_sync_at = db.Column(db.DateTime, nullable=True)  # None = not scheduled yet
+    sync_interval = db.Column(db.Integer, nullable=True)  # Seconds between syncs
+    last_changed_at = db.Column(db.DateTime, nullable=True)  # Last sync that changed bookings
+    sync_failures = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     unit = db.relationship('Unit', backref='calendar_sources')
 
+    __table_args__ = (
+        db.Index('ix_calendar_source_unit_active', 'unit_id', 'is_active'),
+        db.Index('ix_calendar_source_active', 'is_active'),
+        db.Index('ix_calendar_source_active_next_sync', 'is_active', 'next_sync_at'),
+    )
+
     def __repr__(self):
         identifier = self.source_identifier or self.source_name
         return f"CalendarSource('{identifier}', '{self.unit.unit_number}')"
@@ -519,20 +519,20 @@ class ExpenseData(db.Model):
     month = db.Column(db.Integer, nullable=False)
 
     # Revenue
-    sales = db.Column(db.String(50), nullable=True)
+    sales = db.Column(db.Numeric(12, 2), nullable=True)
 
     # Expenses
-    rental = db.Column(db.String(50), nullable=True)
-    electricity = db.Column(db.String(50), nullable=True)
-    water = db.Column(db.String(50), nullable=True)
-    sewage = db.Column(db.String(50), nullable=True)
-    internet = db.Column(db.String(50), nullable=True)
-    cleaner = db.Column(db.String(50), nullable=True)
-    laundry = db.Column(db.String(50), nullable=True)
-    supplies = db.Column(db.String(50), nullable=True)
-    repair = db.Column(db.String(50), nullable=True)
-    replace = db.Column(db.String(50), nullable=True)
-    other = db.Column(db.String(50), nullable=True)
+    rental = db.Column(db.Numeric(12, 2), nullable=True)
+    electricity = db.Column(db.Numeric(12, 2), nullable=True)
+    water = db.Column(db.Numeric(12, 2), nullable=True)
+    sewage = db.Column(db.Numeric(12, 2), nullable=True)
+    internet = db.Column(db.Numeric(12, 2), nullable=True)
+    cleaner = db.Column(db.Numeric(12, 2), nullable=True)
+    laundry = db.Column(db.Numeric(12, 2), nullable=True)
+    supplies = db.Column(db.Numeric(12, 2), nullable=True)
+    repair = db.Column(db.Numeric(12, 2), nullable=True)
+    replace = db.Column(db.Numeric(12, 2), nullable=True)
+    other = db.Column(db.Numeric(12, 2), nullable=True)
 
     # Timestamps
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -545,12 +545,25 @@ class ExpenseData(db.Model):
     # Composite unique constraint to ensure only one record per unit per month
     __table_args__ = (
         db.UniqueConstraint('company_id', 'unit_id', 'year', 'month', name='unique_unit_expense_monthly'),
+        db.Index('ix_expense_data_company_year_month', 'company_id', 'year', 'month'),
     )
 
     def __repr__(self):
         return f"ExpenseData(Unit: {self.unit_id}, {self.month}/{self.year})"
 
 
+class ExpenseDataRejection(db.Model):
+    """An ExpenseData amount the Numeric migration couldn't convert; the column was left empty"""
+    id = db.Column(db.Integer, primary_key=True)
+    expense_data_id = db.Column(db.Integer, nullable=False, index=True)
+    column_name = db.Column(db.String(50), nullable=False)
+    raw_value = db.Column(db.String(50), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"ExpenseDataRejection(ExpenseData: {self.expense_data_id}, {self.column_name}={self.raw_value!r})"
+
+
 # Add this to your models.py file
 class ExpenseRemark(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -597,6 +610,10 @@ class Holiday(db.Model):
     holiday_type = db.relationship('HolidayType', backref='holidays')
     company = db.relationship('Company', backref='holidays')
 
+    __table_args__ = (
+        db.Index('ix_holiday_type_company_date', 'holiday_type_id', 'company_id', 'date'),
+    )
+
 
 # Add this new model to your models.py
 class BookingCalendarSource(db.Model):
@@ -611,9 +628,60 @@ class BookingCalendarSource(db.Model):
     calendar_source = db.relationship('CalendarSource', backref='bookings')
 
     # Ensure one booking can only be linked to one calendar source
-    __table_args__ = (db.UniqueConstraint('booking_id', 'calendar_source_id', name='_booking_source_uc'),)
+    __table_args__ = (
+        db.UniqueConstraint('booking_id', 'calendar_source_id', name='_booking_source_uc'),
+        db.Index('ix_booking_calendar_source_source_id', 'calendar_source_id'),
+    )
+
+
+class UnitDayOccupancy(db.Model):
+    """
+    One row per booking per day from check-in to check-out (inclusive), kept in
+    sync with BookingForm by utils/daily_occupancy.py. Cancelled bookings have no rows.
+    Derived data: no foreign keys, and `flask rebuild-occupancy` repairs drift.
+    """
+    __tablename__ = 'unit_day_occupancy'
+
+    id = db.Column(db.Integer, primary_key=True)
+    unit_id = db.Column(db.Integer, nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    booking_id = db.Column(db.Integer, nullable=False)
+    is_checkin = db.Column(db.Boolean, nullable=False, default=False)
+    # The check-out day is not an occupied night
+    is_checkout = db.Column(db.Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('booking_id', 'date', name='_booking_date_uc'),
+        db.Index('ix_unit_day_occupancy_unit_date', 'unit_id', 'date'),
+        db.Index('ix_unit_day_occupancy_date_unit', 'date', 'unit_id'),
+    )
+
 
 
+class PnlRollup(db.Model):
+    """
+    Monthly P&L rollup per unit and category, kept in sync with ExpenseData,
+    BookingForm and Issue by utils/pnl_rollup.py. `day` is 0 for amounts entered
+    per month (ExpenseData) and the day of the month for bookings and issue costs.
+    Derived data: no foreign keys, and `flask rebuild-pnl` repairs drift.
+    """
+    __tablename__ = 'pnl_rollup'
+
+    id = db.Column(db.Integer, primary_key=True)
+    company_id = db.Column(db.Integer, nullable=False)
+    unit_id = db.Column(db.Integer, nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Integer, nullable=False, default=0)
+    category = db.Column(db.String(30), nullable=False)
+    amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('company_id', 'unit_id', 'year', 'month', 'day', 'category', name='_pnl_rollup_uc'),
+        db.Index('ix_pnl_rollup_company_year_month', 'company_id', 'year', 'month'),
+        db.Index('ix_pnl_rollup_unit_year_month', 'unit_id', 'year', 'month'),
+    )
+
 class CustomUserPermission(db.Model):
     """Custom permissions for individual users, allowing managers to override role permissions"""
     id = db.Column(db.Integer, primary_key=True)
@@ -678,3 +746,34 @@ class CustomUserPermission(db.Model):
     def __repr__(self):
         return f"CustomUserPermission(user_id={self.user_id}, company_id={self.company_id})"
 
+
+
+class BackgroundJob(db.Model):
+    """A unit of work run by the in-process job queue (utils/job_queue.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)  # e.g. "ics_import", "calendar_refresh"
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    payload = db.Column(db.Text, nullable=True)  # JSON arguments for the handler
+    result = db.Column(db.Text, nullable=True)  # JSON returned by the handler
+    error = db.Column(db.Text, nullable=True)
+    progress = db.Column(db.Integer, nullable=False, default=0)  # 0-100
+    progress_message = db.Column(db.String(200), nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+
+    company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    # Process running the job, and when it last reported being alive
+    worker_id = db.Column(db.String(100), nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_background_job_status_created_at', 'status', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f"BackgroundJob({self.id}, '{self.job_type}', '{self.status}')"
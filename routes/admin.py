@@ -1,9 +1,10 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from functools import wraps
 from models import db, User, Company, Role, Complaint, Repair, Replacement, Unit, Issue, AccountType,  Holiday, HolidayType
 from app import bcrypt
 from datetime import datetime
+from utils.access_control import get_access_cache_stats
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -568,6 +569,14 @@ def admin_replacements():
     return render_template('admin/replacements.html', replacements=replacements)
 
 
+@admin_bp.route('/api/access_cache_stats')
+@login_required
+@admin_required
+def access_cache_stats():
+    """Hit/miss counters of the access-control cache for this worker process"""
+    return jsonify(get_access_cache_stats())
+
+
 # Holiday management routes for admin.py
 
 @admin_bp.route('/holidays')
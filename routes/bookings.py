@@ -2,6 +2,11 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
 from functools import wraps
+import base64
+import csv
+import json
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload
 from models import db, BookingForm, Unit
 from utils.access_control import (
     filter_query_by_accessible_units,
@@ -11,6 +16,9 @@ from utils.access_control import (
     check_unit_access,
     require_unit_access
 )
+from utils.availability import availability_index, has_overlapping_booking, search_available_units
+from utils.booking_import import import_airbnb_bookings, iter_airbnb_csv_rows
+from utils.booking_stats import BookingStats, compute_booking_stats
 
 
 bookings_bp = Blueprint('bookings', __name__)
@@ -36,135 +44,211 @@ def check_unit_availability(unit_id, check_in_date, check_out_date, exclude_book
     Check if a unit is available for the given date range
     Returns True if available, False if there's a conflict
     """
-    # Find conflicting bookings, allowing same-day turnover
-    query = BookingForm.query.filter(
-        BookingForm.unit_id == unit_id,
-        BookingForm.check_in_date < check_out_date,
-        BookingForm.check_out_date > check_in_date
-    )
+    # Guards booking writes, so ask the database rather than the cached index.
+    # Cancelled bookings don't block the unit, and a stay checking out on the
+    # new check-in date is allowed (same-day turnover)
+    # Convert unit_id to int to handle form data (strings)
+    return not has_overlapping_booking(int(unit_id), check_in_date, check_out_date, exclude_booking_id)
+
+
+# Bookings list pagination
+BOOKINGS_PAGE_SIZE = 50
+MAX_BOOKINGS_PAGE_SIZE = 200
+
+# Columns the bookings list can be sorted on; the booking ID breaks ties so the
+# (sort value, id) pair is unique and can be used as a keyset cursor
+BOOKING_SORT_COLUMNS = {
+    'date_added': BookingForm.date_added,
+    'check_in_date': BookingForm.check_in_date,
+    'check_out_date': BookingForm.check_out_date
+}
+
+
+def encode_booking_cursor(sort, booking):
+    """Encode the position after `booking` in the given sort order as an opaque cursor"""
+    value = getattr(booking, sort)
+    payload = json.dumps([value.isoformat(), booking.id])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_booking_cursor(sort, cursor):
+    """Decode a cursor produced by encode_booking_cursor, raising ValueError if invalid"""
+    try:
+        value, booking_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        # Valid JSON can still hold the wrong types, e.g. [1, 2] or [null, "x"]
+        if sort == 'date_added':
+            value = datetime.fromisoformat(value)
+        else:
+            value = datetime.strptime(value, '%Y-%m-%d').date()
+        return value, int(booking_id)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f'Invalid cursor: {e}')
+
+
+def parse_date_arg(name):
+    """Parse an optional YYYY-MM-DD query string argument"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
 
-    # We'll exclude bookings where the check-out date exactly equals the new check-in date
-    # This allows same-day turnover
-    query = query.filter(BookingForm.check_out_date != check_in_date)
 
-    # Exclude the current booking if we're updating
-    if exclude_booking_id:
-        query = query.filter(BookingForm.id != exclude_booking_id)
+def apply_booking_list_filters(query):
+    """Apply the unit, source, payment, date range and cancellation filters from the query string"""
+    unit_id = request.args.get('unit_id', type=int)
+    if unit_id:
+        query = query.filter(BookingForm.unit_id == unit_id)
+
+    source = request.args.get('source')
+    if source:
+        query = query.filter(BookingForm.booking_source == source)
+
+    payment_status = request.args.get('payment_status')
+    if payment_status == 'Paid':
+        # 'Fully Paid' is shown as Paid throughout the UI
+        query = query.filter(BookingForm.payment_status.in_(['Paid', 'Fully Paid']))
+    elif payment_status:
+        query = query.filter(BookingForm.payment_status == payment_status)
+
+    # Stays overlapping [start, end)
+    start = parse_date_arg('start')
+    end = parse_date_arg('end')
+    if start:
+        query = query.filter(BookingForm.check_out_date > start)
+    if end:
+        query = query.filter(BookingForm.check_in_date < end)
+
+    # Inclusive ranges on individual dates
+    for column_name in ['check_in_date', 'check_out_date', 'booking_date']:
+        column = getattr(BookingForm, column_name)
+        range_start = parse_date_arg(f'{column_name}_from')
+        range_end = parse_date_arg(f'{column_name}_to')
+        if range_start:
+            query = query.filter(column >= range_start)
+        if range_end:
+            query = query.filter(column <= range_end)
+
+    cancelled = request.args.get('cancelled', 'include')
+    if cancelled == 'exclude':
+        query = query.filter(or_(BookingForm.is_cancelled == False, BookingForm.is_cancelled.is_(None)))
+    elif cancelled == 'only':
+        query = query.filter(BookingForm.is_cancelled == True)
+
+    return query
+
+
+def get_bookings_page(query, sort='date_added', direction='desc', cursor=None, limit=BOOKINGS_PAGE_SIZE):
+    """
+    Fetch one page of bookings using keyset pagination on (sort column, id)
+
+    Returns:
+        (bookings, next_cursor) where next_cursor is None on the last page
+    """
+    column = BOOKING_SORT_COLUMNS[sort]
+    descending = direction == 'desc'
+
+    if cursor:
+        value, booking_id = decode_booking_cursor(sort, cursor)
+        if descending:
+            query = query.filter(or_(column < value, and_(column == value, BookingForm.id < booking_id)))
+        else:
+            query = query.filter(or_(column > value, and_(column == value, BookingForm.id > booking_id)))
+
+    if descending:
+        query = query.order_by(column.desc(), BookingForm.id.desc())
+    else:
+        query = query.order_by(column.asc(), BookingForm.id.asc())
 
-    # If any booking exists in this range (that's not a same-day turnover), the unit is not available
-    return query.count() == 0
+    # Fetch one extra row to know whether another page exists
+    rows = query.options(joinedload(BookingForm.unit)).limit(limit + 1).all()
+    bookings_page = rows[:limit]
+    next_cursor = encode_booking_cursor(sort, bookings_page[-1]) if len(rows) > limit else None
+    return bookings_page, next_cursor
+
+
+def serialize_booking_row(booking):
+    """Booking fields needed to render a row of the bookings table"""
+    return {
+        'id': booking.id,
+        'guest_name': booking.guest_name,
+        'contact_number': booking.contact_number,
+        'unit_id': booking.unit_id,
+        'unit_number': booking.unit.unit_number if booking.unit else '',
+        'check_in_date': booking.check_in_date.isoformat(),
+        'check_out_date': booking.check_out_date.isoformat(),
+        'number_of_nights': booking.number_of_nights,
+        'number_of_guests': booking.number_of_guests,
+        'confirmation_code': booking.confirmation_code or '',
+        'adults': booking.adults,
+        'children': booking.children,
+        'infants': booking.infants,
+        'booking_date': booking.booking_date.isoformat() if booking.booking_date else '',
+        'price': str(booking.price) if booking.price is not None else '',
+        'booking_source': booking.booking_source,
+        'payment_status': booking.payment_status,
+        'notes': booking.notes or '',
+        'is_cancelled': bool(booking.is_cancelled),
+        'date_added': booking.date_added.isoformat()
+    }
 
 
 @bookings_bp.route('/bookings')
 @login_required
 @permission_required('can_view_bookings')
 def bookings():
-    # Filter bookings to only show those for accessible units
-    bookings_list = get_accessible_bookings_query().order_by(
-        BookingForm.date_added.desc()).all()
+    # Only the newest page is rendered; the rest is fetched lazily from /api/bookings
+    bookings_list, next_cursor = get_bookings_page(get_accessible_bookings_query())
 
     # Get accessible units for this user for the form
     units = get_accessible_units_query().all()
 
     # Calculate analytics for the dashboard using accessible units only
-    today = datetime.now().date()
-    tomorrow = today + timedelta(days=1)
+    stats = compute_booking_stats().for_bookings_page()
 
-    # Get accessible unit IDs for filtering
-    accessible_unit_ids = [unit.id for unit in units]
-
-    if not accessible_unit_ids:
-        # If no accessible units, return zero stats
-        stats = {
-            'unit_total': 0,
-            'occupancy_current': 0,
-            'occupancy_tomorrow': 0,
-            'check_ins_today': 0,
-            'revenue_today': '0.00',
-            'revenue_tomorrow': '0.00',
-            'check_ins_tomorrow': 0,
-            'check_outs_today': 0,
-            'check_outs_tomorrow': 0
-        }
-        return render_template('bookings.html', bookings=bookings_list, units=units, stats=stats, active_filter=None)
-
-    # Calculate total accessible units
-    unit_total = len(accessible_unit_ids)
-
-    # Calculate occupancy today (units where check-in <= today < check-out)
-    occupancy_current = BookingForm.query.filter(
-        BookingForm.company_id == current_user.company_id,
-        BookingForm.unit_id.in_(accessible_unit_ids),
-        BookingForm.check_in_date <= today,
-        BookingForm.check_out_date > today
-    ).count()
-
-    # Calculate occupancy tomorrow (units where check-in <= tomorrow < check-out)
-    occupancy_tomorrow = BookingForm.query.filter(
-        BookingForm.company_id == current_user.company_id,
-        BookingForm.unit_id.in_(accessible_unit_ids),
-        BookingForm.check_in_date <= tomorrow,
-        BookingForm.check_out_date > tomorrow
-    ).count()
-
-    # Calculate check-ins today
-    check_ins_today = BookingForm.query.filter(
-        BookingForm.company_id == current_user.company_id,
-        BookingForm.unit_id.in_(accessible_unit_ids),
-        BookingForm.check_in_date == today
-    ).count()
-
-    # Calculate revenue today (total price of bookings with check-in today)
-    today_check_ins = BookingForm.query.filter(
-        BookingForm.company_id == current_user.company_id,
-        BookingForm.unit_id.in_(accessible_unit_ids),
-        BookingForm.check_in_date == today
-    ).all()
-    revenue_today = sum(float(booking.price) for booking in today_check_ins if booking.price)
-
-    # Calculate revenue tomorrow (total price of bookings with check-in tomorrow)
-    tomorrow_check_ins = BookingForm.query.filter(
-        BookingForm.company_id == current_user.company_id,
-        BookingForm.unit_id.in_(accessible_unit_ids),
-        BookingForm.check_in_date == tomorrow
-    ).all()
-    revenue_tomorrow = sum(float(booking.price) for booking in tomorrow_check_ins if booking.price)
-
-    # Calculate check-ins tomorrow
-    check_ins_tomorrow = BookingForm.query.filter(
-        BookingForm.company_id == current_user.company_id,
-        BookingForm.unit_id.in_(accessible_unit_ids),
-        BookingForm.check_in_date == tomorrow
-    ).count()
-
-    # Calculate check-outs today
-    check_outs_today = BookingForm.query.filter(
-        BookingForm.company_id == current_user.company_id,
-        BookingForm.unit_id.in_(accessible_unit_ids),
-        BookingForm.check_out_date == today
-    ).count()
-
-    # Calculate check-outs tomorrow
-    check_outs_tomorrow = BookingForm.query.filter(
-        BookingForm.company_id == current_user.company_id,
-        BookingForm.unit_id.in_(accessible_unit_ids),
-        BookingForm.check_out_date == tomorrow
-    ).count()
-
-    # Create stats dictionary
-    stats = {
-        'unit_total': unit_total,
-        'occupancy_current': occupancy_current,
-        'occupancy_tomorrow': occupancy_tomorrow,
-        'check_ins_today': check_ins_today,
-        'revenue_today': '{:,.2f}'.format(revenue_today),
-        'revenue_tomorrow': '{:,.2f}'.format(revenue_tomorrow),
-        'check_ins_tomorrow': check_ins_tomorrow,
-        'check_outs_today': check_outs_today,
-        'check_outs_tomorrow': check_outs_tomorrow
-    }
+    return render_template('bookings.html', bookings=bookings_list, units=units, stats=stats, active_filter=None,
+                           next_cursor=next_cursor, page_size=BOOKINGS_PAGE_SIZE)
 
-    return render_template('bookings.html', bookings=bookings_list, units=units, stats=stats, active_filter=None)
+
+@bookings_bp.route('/api/bookings')
+@login_required
+@permission_required('can_view_bookings')
+def list_bookings():
+    """
+    Paginated bookings list for accessible units
+
+    Query parameters:
+        cursor: opaque cursor from a previous response's next_cursor
+        limit: page size (default 50, max 200)
+        sort: date_added, check_in_date or check_out_date (default date_added)
+        direction: asc or desc (default desc)
+        unit_id, source, payment_status: exact-match filters
+        start, end: stays overlapping [start, end)
+        check_in_date_from/_to, check_out_date_from/_to, booking_date_from/_to: inclusive date ranges
+        cancelled: include, exclude or only (default include)
+    """
+    sort = request.args.get('sort', 'date_added')
+    if sort not in BOOKING_SORT_COLUMNS:
+        return jsonify({'error': f'Invalid sort column: {sort}'}), 400
+
+    direction = request.args.get('direction', 'desc')
+    if direction not in ['asc', 'desc']:
+        return jsonify({'error': f'Invalid sort direction: {direction}'}), 400
+
+    limit = request.args.get('limit', BOOKINGS_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_BOOKINGS_PAGE_SIZE))
+
+    try:
+        query = apply_booking_list_filters(get_accessible_bookings_query())
+        bookings_page, next_cursor = get_bookings_page(
+            query, sort, direction, request.args.get('cursor'), limit
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'bookings': [serialize_booking_row(booking) for booking in bookings_page],
+        'next_cursor': next_cursor
+    })
 
 
 # Replace the existing bookings_filter() function with this updated version:
@@ -174,92 +258,25 @@ def bookings():
 def bookings_filter(filter_type):
     # Get accessible units for this user
     units = get_accessible_units_query().all()
-    accessible_unit_ids = [unit.id for unit in units]
 
     # Calculate analytics for the dashboard
     today = datetime.now().date()
     tomorrow = today + timedelta(days=1)
 
-    if not accessible_unit_ids:
+    if not units:
         # If no accessible units, return empty results
-        stats = {
-            'unit_total': 0,
-            'occupancy_current': 0,
-            'occupancy_tomorrow': 0,
-            'check_ins_today': 0,
-            'revenue_today': '0.00',
-            'revenue_tomorrow': '0.00',
-            'check_ins_tomorrow': 0,
-            'check_outs_today': 0,
-            'check_outs_tomorrow': 0
-        }
         return render_template('bookings.html',
                                bookings=[],
                                units=units,
-                               stats=stats,
+                               stats=BookingStats().for_bookings_page(),
                                filter_message="No accessible units",
                                active_filter=filter_type)
 
     # Calculate all the stats (same as in regular bookings route but filtered)
-    unit_total = len(accessible_unit_ids)
-
-    occupancy_current = BookingForm.query.filter(
-        BookingForm.company_id == current_user.company_id,
-        BookingForm.unit_id.in_(accessible_unit_ids),
-        BookingForm.check_in_date <= today,
-        BookingForm.check_out_date > today
-    ).count()
-
-    occupancy_tomorrow = BookingForm.query.filter(
-        BookingForm.company_id == current_user.company_id,
-        BookingForm.unit_id.in_(accessible_unit_ids),
-        BookingForm.check_in_date <= tomorrow,
-        BookingForm.check_out_date > tomorrow
-    ).count()
-
-    check_ins_today = BookingForm.query.filter(
-        BookingForm.company_id == current_user.company_id,
-        BookingForm.unit_id.in_(accessible_unit_ids),
-        BookingForm.check_in_date == today
-    ).count()
-
-    today_check_ins = BookingForm.query.filter(
-        BookingForm.company_id == current_user.company_id,
-        BookingForm.unit_id.in_(accessible_unit_ids),
-        BookingForm.check_in_date == today
-    ).all()
-    revenue_today = sum(float(booking.price) for booking in today_check_ins if booking.price)
-
-    tomorrow_check_ins = BookingForm.query.filter(
-        BookingForm.company_id == current_user.company_id,
-        BookingForm.unit_id.in_(accessible_unit_ids),
-        BookingForm.check_in_date == tomorrow
-    ).all()
-    revenue_tomorrow = sum(float(booking.price) for booking in tomorrow_check_ins if booking.price)
-
-    check_ins_tomorrow = BookingForm.query.filter(
-        BookingForm.company_id == current_user.company_id,
-        BookingForm.unit_id.in_(accessible_unit_ids),
-        BookingForm.check_in_date == tomorrow
-    ).count()
-
-    check_outs_today = BookingForm.query.filter(
-        BookingForm.company_id == current_user.company_id,
-        BookingForm.unit_id.in_(accessible_unit_ids),
-        BookingForm.check_out_date == today
-    ).count()
-
-    check_outs_tomorrow = BookingForm.query.filter(
-        BookingForm.company_id == current_user.company_id,
-        BookingForm.unit_id.in_(accessible_unit_ids),
-        BookingForm.check_out_date == tomorrow
-    ).count()
+    stats = compute_booking_stats(today).for_bookings_page()
 
     # Apply specific filter based on filter_type (all filtered by accessible units)
-    base_query = BookingForm.query.filter(
-        BookingForm.company_id == current_user.company_id,
-        BookingForm.unit_id.in_(accessible_unit_ids)
-    )
+    base_query = get_accessible_bookings_query()
 
     if filter_type == 'occupancy_current':
         bookings_list = base_query.filter(
@@ -316,19 +333,6 @@ def bookings_filter(filter_type):
         bookings_list = base_query.all()
         filter_message = None
 
-    # Create stats dictionary
-    stats = {
-        'unit_total': unit_total,
-        'occupancy_current': occupancy_current,
-        'occupancy_tomorrow': occupancy_tomorrow,
-        'check_ins_today': check_ins_today,
-        'revenue_today': '{:,.2f}'.format(revenue_today),
-        'revenue_tomorrow': '{:,.2f}'.format(revenue_tomorrow),
-        'check_ins_tomorrow': check_ins_tomorrow,
-        'check_outs_today': check_outs_today,
-        'check_outs_tomorrow': check_outs_tomorrow
-    }
-
     return render_template('bookings.html',
                            bookings=bookings_list,
                            units=units,
@@ -663,33 +667,21 @@ def check_availability():
                 'error': 'Check-out date must be after check-in date'
             })
 
-        # Check availability
-        is_available = check_unit_availability(unit_id, check_in_date, check_out_date, booking_id)
+        # Find the conflicting bookings and the availability in one pass
+        conflicts = availability_index.conflicts(unit_id, check_in_date, check_out_date, booking_id)
 
-        # If not available, find the conflicting bookings
+        # Format the conflicts
         conflicting_bookings = []
-        if not is_available:
-            conflicts = BookingForm.query.filter(
-                BookingForm.unit_id == unit_id,
-                BookingForm.check_in_date < check_out_date,
-                BookingForm.check_out_date > check_in_date
-            )
-
-            # Exclude the current booking if we're updating
-            if booking_id:
-                conflicts = conflicts.filter(BookingForm.id != booking_id)
-
-            # Format the conflicts
-            for booking in conflicts:
-                conflicting_bookings.append({
-                    'id': booking.id,
-                    'check_in_date': booking.check_in_date.isoformat(),
-                    'check_out_date': booking.check_out_date.isoformat(),
-                    'guest_name': booking.guest_name
-                })
+        for stay in conflicts:
+            conflicting_bookings.append({
+                'id': stay.booking_id,
+                'check_in_date': stay.check_in_date.isoformat(),
+                'check_out_date': stay.check_out_date.isoformat(),
+                'guest_name': stay.guest_name
+            })
 
         return jsonify({
-            'available': is_available,
+            'available': not conflicts,
             'unit_id': unit_id,
             'check_in_date': check_in,
             'check_out_date': check_out,
@@ -699,6 +691,58 @@ def check_availability():
         return jsonify({'available': False, 'error': str(e)})
 
 
+@bookings_bp.route('/api/availability/search')
+# Kept as an alias for clients of the earlier free-units endpoint
+@bookings_bp.route('/api/availability/free_units', endpoint='free_units')
+@login_required
+def search_availability():
+    """
+    Search all accessible units that are free for [check_in, check_out), best fit first
+
+    Query args:
+        check_in, check_out: YYYY-MM-DD
+        min_pax: minimum guest capacity (optional)
+        building: exact building name (optional)
+    """
+    try:
+        check_in_date = parse_date_arg('check_in')
+        check_out_date = parse_date_arg('check_out')
+    except ValueError:
+        return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+
+    if not check_in_date or not check_out_date:
+        return jsonify({'error': 'Missing parameters'}), 400
+    if check_out_date <= check_in_date:
+        return jsonify({'error': 'Check-out date must be after check-in date'}), 400
+
+    min_pax = request.args.get('min_pax', type=int)
+    building = request.args.get('building', '').strip() or None
+
+    units = search_available_units(
+        get_accessible_units_query(),
+        check_in_date,
+        check_out_date,
+        min_pax=min_pax,
+        building=building
+    )
+
+    return jsonify({
+        'check_in_date': check_in_date.isoformat(),
+        'check_out_date': check_out_date.isoformat(),
+        'number_of_nights': (check_out_date - check_in_date).days,
+        'units': [
+            {
+                'id': unit.id,
+                'unit_number': unit.unit_number,
+                'building': unit.building,
+                'max_pax': unit.max_pax,
+                'bedrooms': unit.bedrooms
+            }
+            for unit in units
+        ]
+    })
+
+
 # FIXED: Return the session variable as a list
 @bookings_bp.route('/api/get_highlighted_bookings')
 @login_required
@@ -722,169 +766,34 @@ def get_highlighted_bookings():
 @login_required
 @permission_required('can_manage_bookings')
 def import_airbnb_csv():
-    # Get the bookings data from the request
-    if not request.is_json:
-        return jsonify({'success': False, 'message': 'Invalid request format. JSON expected.'}), 400
-
-    data = request.json
-    bookings = data.get('bookings', [])
-
-    if not bookings:
-        return jsonify({'success': False, 'message': 'No booking data provided.'}), 400
-
-    # Get the user's company ID
-    company_id = current_user.company_id
-
-    # Counters for tracking what happened
-    created_count = 0
-    updated_count = 0
-    error_count = 0
-
-    # FIXED: Collect only booking IDs that actually had changes
-    updated_booking_ids = []
-
-    for booking_data in bookings:
-        try:
-            # Check if confirmation code exists
-            confirmation_code = booking_data.get('confirmation_code')
-            if not confirmation_code:
-                error_count += 1
-                continue
-
-            # Check if we already have this booking in our database
-            existing_booking = BookingForm.query.filter_by(
-                confirmation_code=confirmation_code,
-                company_id=company_id
-            ).first()
-
-            # If booking exists, check if it needs updating
-            if existing_booking:
-                # Track if any changes were actually made
-                has_changes = False
-
-                # Convert date strings to date objects
-                try:
-                    check_in_date = datetime.strptime(booking_data.get('check_in_date', ''), '%Y-%m-%d').date()
-                    check_out_date = datetime.strptime(booking_data.get('check_out_date', ''), '%Y-%m-%d').date()
-                except (ValueError, TypeError):
-                    # Try different date format (like MM/DD/YYYY)
-                    try:
-                        check_in_date = datetime.strptime(booking_data.get('check_in_date', ''), '%m/%d/%Y').date()
-                        check_out_date = datetime.strptime(booking_data.get('check_out_date', ''), '%m/%d/%Y').date()
-                    except (ValueError, TypeError):
-                        # Keep existing dates if parsing fails
-                        check_in_date = existing_booking.check_in_date
-                        check_out_date = existing_booking.check_out_date
-
-                # Try to parse booking date
-                booking_date = None
-                if booking_data.get('booking_date'):
-                    parsed_date = parse_date(booking_data.get('booking_date'))
-                    if parsed_date and parsed_date != existing_booking.booking_date:
-                        existing_booking.booking_date = parsed_date
-                        has_changes = True
-
-                # Check and update guest name if it changed
-                new_guest_name = booking_data.get('guest_name')
-                if new_guest_name and new_guest_name != existing_booking.guest_name:
-                    existing_booking.guest_name = new_guest_name
-                    has_changes = True
-
-                # Check and update contact number if it changed
-                new_contact_number = booking_data.get('contact_number')
-                if new_contact_number and new_contact_number != existing_booking.contact_number:
-                    existing_booking.contact_number = new_contact_number
-                    has_changes = True
-
-                # Check and update dates if they changed
-                if (check_in_date and check_out_date and check_in_date < check_out_date and
-                    (check_in_date != existing_booking.check_in_date or
-                     check_out_date != existing_booking.check_out_date)):
-                    existing_booking.check_in_date = check_in_date
-                    existing_booking.check_out_date = check_out_date
-                    # Calculate nights from the dates
-                    new_nights = (check_out_date - check_in_date).days
-                    if new_nights != existing_booking.number_of_nights:
-                        existing_booking.number_of_nights = new_nights
-                        has_changes = True
-                    else:
-                        has_changes = True  # Dates changed even if nights stayed same
-
-                # Check and update price if it changed
-                if booking_data.get('price'):
-                    try:
-                        # Handle price as string, removing any non-numeric characters except periods
-                        price_str = str(booking_data.get('price'))
-                        # Remove any remaining 'RM' if it wasn't caught by JavaScript
-                        price_str = price_str.replace('RM', '').replace(',', '').strip()
-                        price_value = float(price_str)
-
-                        if price_value > 0 and abs(float(existing_booking.price or 0) - price_value) > 0.01:
-                            existing_booking.price = price_value
-                            has_changes = True
-                    except (ValueError, TypeError) as e:
-                        print(f"Failed to convert price: {booking_data.get('price')} - Error: {e}")
-
-                # Check and update payment status if it changed
-                new_payment_status = booking_data.get('payment_status')
-                if new_payment_status and new_payment_status != existing_booking.payment_status:
-                    existing_booking.payment_status = new_payment_status
-                    has_changes = True
-
-                # Check and update guest counts if they changed
-                new_adults = booking_data.get('adults', 0)
-                new_children = booking_data.get('children', 0)
-                new_infants = booking_data.get('infants', 0)
-
-                if (new_adults > 0 and new_adults != (existing_booking.adults or 0)):
-                    existing_booking.adults = new_adults
-                    has_changes = True
-
-                if (new_children > 0 and new_children != (existing_booking.children or 0)):
-                    existing_booking.children = new_children
-                    has_changes = True
-
-                if (new_infants > 0 and new_infants != (existing_booking.infants or 0)):
-                    existing_booking.infants = new_infants
-                    has_changes = True
-
-                # Update total number of guests if guest counts changed
-                new_total_guests = (
-                    (existing_booking.adults or 0) +
-                    (existing_booking.children or 0) +
-                    (existing_booking.infants or 0)
-                )
-                if new_total_guests != existing_booking.number_of_guests:
-                    existing_booking.number_of_guests = new_total_guests
-                    has_changes = True
-
-                # FIXED: Only add to highlight list if there were actual changes
-                if has_changes:
-                    updated_booking_ids.append(existing_booking.id)
-                    updated_count += 1
-            else:
-                # This is a new booking - we would normally create it, but
-                # in this case we'll skip it since we want to focus on updating existing bookings
-                pass
-
-        except Exception as e:
-            error_count += 1
-            print(f"Error processing booking: {e}")
+    # Accept the rows as JSON, or the raw export as a multipart upload that is read row by row
+    if request.is_json:
+        bookings = (request.json or {}).get('bookings', [])
+        if not bookings:
+            return jsonify({'success': False, 'message': 'No booking data provided.'}), 400
+    elif 'csv_file' in request.files and request.files['csv_file'].filename:
+        bookings = iter_airbnb_csv_rows(request.files['csv_file'].stream)
+    else:
+        return jsonify({'success': False, 'message': 'Invalid request format. JSON or a CSV file expected.'}), 400
 
-    # Commit all changes
-    db.session.commit()
+    try:
+        result = import_airbnb_bookings(bookings, current_user.company_id)
+        db.session.commit()
+    except (UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Could not read the CSV file: {str(e)}'}), 400
 
-    # FIXED: Store only booking IDs that actually had changes in session for highlighting
-    if updated_booking_ids:
-        session['highlight_booking_ids'] = updated_booking_ids
+    # Store only booking IDs that actually had changes in session for highlighting
+    if result.updated_booking_ids:
+        session['highlight_booking_ids'] = result.updated_booking_ids
 
     # Return the result
     return jsonify({
         'success': True,
-        'message': f"Successfully processed bookings. Updated: {updated_count}, No changes: {len(bookings) - updated_count - error_count}, Errors: {error_count}",
-        'updated': updated_count,
-        'created': created_count,
-        'errors': error_count
+        'message': f"Successfully processed bookings. Updated: {result.updated}, No changes: {result.processed - result.updated - result.errors}, Errors: {result.errors}",
+        'updated': result.updated,
+        'created': 0,
+        'errors': result.errors
     })
 
 
@@ -1,15 +1,24 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
 from functools import wraps
-from models import db, BookingForm, Unit, CalendarSource
-import requests
+from models import db, BookingForm, Unit, CalendarSource, BookingCalendarSource, BackgroundJob
+import csv
 import re
 from utils.access_control import (
     get_accessible_units_query,
     get_accessible_bookings_query,
     check_unit_access
 )
+from utils.booking_import import (
+    import_airbnb_bookings,
+    insert_bookings,
+    insert_calendar_mappings,
+    iter_airbnb_csv_rows
+)
+from utils.calendar_sync import build_feed_fetcher, feed_unchanged, save_feed_validators
+from utils.ics_parser import parse_ics_events
+from utils.job_queue import JobError, enqueue_job, register_job_handler, serialize_job
 
 calendar_bp = Blueprint('calendar', __name__)
 
@@ -95,25 +104,20 @@ def import_ics():
             ).count()
             source_identifier = f"{source} #{existing_count + 1}"
 
-        calendar_data = None
+        payload = {
+            'unit_id': int(unit_id),
+            'source': source,
+            'source_identifier': source_identifier
+        }
 
-        # Handle URL or file import (existing code)
+        # Handle URL or file import. URLs are downloaded by the job itself.
         if import_type == 'url':
             ics_url = request.form.get('ics_url')
             if not ics_url:
                 flash('Please enter an ICS URL', 'danger')
                 return redirect(url_for('calendar.import_ics'))
 
-            try:
-                response = requests.get(ics_url)
-                if response.status_code != 200:
-                    flash(f'Error downloading ICS file: {response.status_code}', 'danger')
-                    return redirect(url_for('calendar.import_ics'))
-
-                calendar_data = response.text
-            except Exception as e:
-                flash(f'Error downloading ICS file: {str(e)}', 'danger')
-                return redirect(url_for('calendar.import_ics'))
+            payload['ics_url'] = ics_url
 
         elif import_type == 'file':
             if 'ics_file' not in request.files:
@@ -126,52 +130,17 @@ def import_ics():
                 return redirect(url_for('calendar.import_ics'))
 
             try:
-                calendar_data = file.read().decode('utf-8')
-            except UnicodeDecodeError:
-                file.seek(0)
-                calendar_data = file.read()
+                payload['calendar_data'] = file.read().decode('utf-8', errors='replace')
             except Exception as e:
                 flash(f'Error reading file: {str(e)}', 'danger')
                 return redirect(url_for('calendar.import_ics'))
 
-        # Process the ICS data
-        if calendar_data:
-            try:
-                units_added, units_updated, bookings_cancelled, affected_booking_ids = process_ics_calendar(
-                    calendar_data, unit_id, source, source_identifier
-                )
-
-                # Update calendar source with the custom identifier
-                source_url = request.form.get('ics_url') if import_type == 'url' else None
-                update_calendar_source(unit_id, source, source_identifier, source_url)
-
-                # Build success message
-                message_parts = []
-                if units_added > 0:
-                    message_parts.append(f"{units_added} unit{'s' if units_added > 1 else ''} with new bookings")
-                if units_updated > 0:
-                    message_parts.append(f"{units_updated} unit{'s' if units_updated > 1 else ''} with updated bookings")
-                if bookings_cancelled > 0:
-                    message_parts.append(f"{bookings_cancelled} booking{'s' if bookings_cancelled > 1 else ''} marked as cancelled")
-
-                if message_parts:
-                    flash(f"Calendar '{source_identifier}' synchronized: {', '.join(message_parts)}", 'success')
-                else:
-                    flash(f"Calendar '{source_identifier}' synchronized: No changes detected", 'info')
-
-                # Store affected booking IDs in session
-                if affected_booking_ids:
-                    session['highlight_booking_ids'] = affected_booking_ids
-
-                # Redirect to bookings page
-                if affected_booking_ids:
-                    return redirect(url_for('bookings.bookings', highlight_ids=','.join(map(str, affected_booking_ids))))
-
-            except Exception as e:
-                flash(f'Error processing calendar: {str(e)}', 'danger')
-                return redirect(url_for('calendar.import_ics'))
+        else:
+            return redirect(url_for('bookings.bookings'))
 
-        return redirect(url_for('bookings.bookings'))
+        # Process the ICS data in the background
+        job = enqueue_job('ics_import', payload, company_id=current_user.company_id, user_id=current_user.id)
+        return job_queued_response(job, f"Calendar '{source_identifier}' import started")
 
     # GET request - show the import form
     # Get accessible units for current user
@@ -184,7 +153,8 @@ def import_ics():
         if sources:
             calendar_sources[unit.id] = sources
 
-    return render_template('import_ics.html', units=units, calendar_sources=calendar_sources)
+    return render_template('import_ics.html', units=units, calendar_sources=calendar_sources,
+                           job_id=request.args.get('job_id', type=int))
 
 
 @calendar_bp.route('/refresh_calendar/<int:source_id>')
@@ -208,50 +178,134 @@ def refresh_calendar(source_id):
         flash('This calendar source does not have a URL for refreshing', 'danger')
         return redirect(url_for('calendar.import_ics'))
 
-    # Rest of the function remains the same...
-    try:
-        # Download the ICS file
-        response = requests.get(calendar_source.source_url)
-        if response.status_code != 200:
-            flash(f'Error downloading ICS file: {response.status_code}', 'danger')
-            return redirect(url_for('calendar.import_ics'))
+    # ?force=1 re-downloads and re-processes the feed even if it looks unchanged
+    payload = {'source_id': calendar_source.id, 'force': request.args.get('force') == '1'}
 
-        calendar_data = response.text
+    job = enqueue_job('calendar_refresh', payload, company_id=current_user.company_id, user_id=current_user.id)
+    return job_queued_response(job, f"Calendar '{calendar_source.source_identifier or calendar_source.source_name}' refresh started")
 
-        # Process the calendar
-        units_added, units_updated, bookings_cancelled, affected_booking_ids = process_ics_calendar(
-            calendar_data,
-            calendar_source.unit_id,
-            calendar_source.source_name
-        )
 
-        # Update the last_updated timestamp
-        calendar_source.last_updated = datetime.utcnow()
+@calendar_bp.route('/api/jobs/<int:job_id>')
+@login_required
+def get_job_status(job_id):
+    """Progress and result of a background import/refresh job"""
+    job = BackgroundJob.query.get(job_id)
+    if not job or job.company_id != current_user.company_id:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return jsonify(serialize_job(job))
+
+
+def job_queued_response(job, message):
+    """Return the job ID to JSON clients, or send the browser to the import page to follow the job"""
+    if request.is_json or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({'job_id': job.id, 'status': job.status}), 202
+
+    flash(f"{message}. This page will update when it finishes.", 'info')
+    return redirect(url_for('calendar.import_ics', job_id=job.id))
+
+
+def build_sync_message(units_added, units_updated, bookings_cancelled, prefix):
+    """Build the flash message for a sync and its category"""
+    message_parts = []
+    if units_added > 0:
+        message_parts.append(f"{units_added} unit{'s' if units_added > 1 else ''} with new bookings")
+    if units_updated > 0:
+        message_parts.append(f"{units_updated} unit{'s' if units_updated > 1 else ''} with updated bookings")
+    if bookings_cancelled > 0:
+        message_parts.append(f"{bookings_cancelled} booking{'s' if bookings_cancelled > 1 else ''} marked as cancelled")
+
+    if message_parts:
+        return f"{prefix}: {', '.join(message_parts)}", 'success'
+    return f"{prefix}: No changes detected", 'info'
+
+
+def build_sync_result(units_added, units_updated, bookings_cancelled, affected_booking_ids, prefix):
+    message, category = build_sync_message(units_added, units_updated, bookings_cancelled, prefix)
+    return {
+        'message': message,
+        'category': category,
+        'units_added': units_added,
+        'units_updated': units_updated,
+        'bookings_cancelled': bookings_cancelled,
+        'affected_booking_ids': affected_booking_ids
+    }
+
+
+@register_job_handler('ics_import')
+def run_ics_import_job(job, payload):
+    """Import an uploaded ICS file or a feed URL for one unit"""
+    unit_id = payload['unit_id']
+    source = payload['source']
+    source_identifier = payload['source_identifier']
+    ics_url = payload.get('ics_url')
+
+    fetched = None
+    if ics_url:
+        job.report(10, 'Downloading calendar')
+        fetched = build_feed_fetcher().fetch(ics_url)
+        if fetched.body is None:
+            raise JobError(f'Error downloading ICS file: {fetched.error}')
+        calendar_data = fetched.body
+    else:
+        calendar_data = payload['calendar_data']
+
+    job.report(40, 'Processing bookings')
+    units_added, units_updated, bookings_cancelled, affected_booking_ids = process_ics_calendar(
+        calendar_data, unit_id, source, source_identifier, user_id=job.user_id
+    )
+
+    # Update calendar source with the custom identifier
+    calendar_source = update_calendar_source(unit_id, source, source_identifier, ics_url)
+    if fetched is not None:
+        save_feed_validators(calendar_source.id, fetched, processed=True)
         db.session.commit()
 
-        # Build message based on what actually happened
-        message_parts = []
-        if units_added > 0:
-            message_parts.append(f"{units_added} unit{'s' if units_added > 1 else ''} with new bookings")
-        if units_updated > 0:
-            message_parts.append(f"{units_updated} unit{'s' if units_updated > 1 else ''} with updated bookings")
-        if bookings_cancelled > 0:
-            message_parts.append(f"{bookings_cancelled} booking{'s' if bookings_cancelled > 1 else ''} marked as cancelled")
-
-        if message_parts:
-            flash(f"Calendar synchronized: {', '.join(message_parts)}", 'success')
-        else:
-            flash(f"Calendar synchronized: No changes detected", 'info')
+    return build_sync_result(units_added, units_updated, bookings_cancelled, affected_booking_ids,
+                             f"Calendar '{source_identifier}' synchronized")
 
-        # Store all affected booking IDs in the session
-        if affected_booking_ids:
-            session['highlight_booking_ids'] = affected_booking_ids
-            return redirect(url_for('bookings.bookings', highlight_ids=','.join(map(str, affected_booking_ids))))
 
-    except Exception as e:
-        flash(f'Error refreshing calendar: {str(e)}', 'danger')
+@register_job_handler('calendar_refresh')
+def run_calendar_refresh_job(job, payload):
+    """Re-download and process the feed of one calendar source"""
+    calendar_source = CalendarSource.query.get(payload['source_id'])
+    if not calendar_source or not calendar_source.source_url:
+        raise JobError('This calendar source does not have a URL for refreshing')
 
-    return redirect(url_for('calendar.import_ics'))
+    force = payload.get('force', False)
+
+    # Download the ICS file, conditionally unless forced
+    job.report(10, 'Downloading calendar')
+    fetched = build_feed_fetcher().fetch(
+        calendar_source.source_url,
+        etag=None if force else calendar_source.etag,
+        last_modified=None if force else calendar_source.last_modified
+    )
+
+    # Skip parsing and reconciliation if the feed hasn't changed since the last sync
+    if not force and feed_unchanged(fetched, calendar_source.content_hash):
+        save_feed_validators(calendar_source.id, fetched, processed=False)
+        db.session.commit()
+        return build_sync_result(0, 0, 0, [], 'Calendar synchronized')
+
+    if fetched.body is None:
+        raise JobError(f'Error downloading ICS file: {fetched.error}')
+
+    # Process the calendar
+    job.report(40, 'Processing bookings')
+    units_added, units_updated, bookings_cancelled, affected_booking_ids = process_ics_calendar(
+        fetched.body,
+        calendar_source.unit_id,
+        calendar_source.source_name,
+        user_id=job.user_id
+    )
+
+    # Update the last_updated timestamp and remember what was processed
+    save_feed_validators(calendar_source.id, fetched, processed=True)
+    db.session.commit()
+
+    return build_sync_result(units_added, units_updated, bookings_cancelled, affected_booking_ids,
+                             'Calendar synchronized')
 
 
 @calendar_bp.route('/delete_calendar_source/<int:source_id>')
@@ -282,138 +336,46 @@ def delete_calendar_source(source_id):
 @login_required
 @permission_required('can_manage_bookings')
 def import_airbnb_csv():
-    # Get the bookings data from the request
-    if not request.is_json:
-        return jsonify({'success': False, 'message': 'Invalid request format. JSON expected.'}), 400
-
-    data = request.json
-    bookings = data.get('bookings', [])
-
-    if not bookings:
-        return jsonify({'success': False, 'message': 'No booking data provided.'}), 400
-
-    # Get the user's company ID
-    company_id = current_user.company_id
-
-    # Counters for tracking what happened
-    created_count = 0
-    updated_count = 0
-    error_count = 0
-
-    for booking_data in bookings:
-        try:
-            # Check if confirmation code exists
-            confirmation_code = booking_data.get('confirmation_code')
-            if not confirmation_code:
-                error_count += 1
-                continue
-
-            # Check if we already have this booking in our database
-            existing_booking = BookingForm.query.filter_by(
-                confirmation_code=confirmation_code,
-                company_id=company_id
-            ).first()
-
-            # If booking exists, update it with new information
-            if existing_booking:
-                # Convert date strings to date objects
-                try:
-                    check_in_date = datetime.strptime(booking_data.get('check_in_date', ''), '%Y-%m-%d').date()
-                    check_out_date = datetime.strptime(booking_data.get('check_out_date', ''), '%Y-%m-%d').date()
-                except (ValueError, TypeError):
-                    # Try different date format (like MM/DD/YYYY)
-                    try:
-                        check_in_date = datetime.strptime(booking_data.get('check_in_date', ''), '%m/%d/%Y').date()
-                        check_out_date = datetime.strptime(booking_data.get('check_out_date', ''), '%m/%d/%Y').date()
-                    except (ValueError, TypeError):
-                        # Keep existing dates if parsing fails
-                        check_in_date = existing_booking.check_in_date
-                        check_out_date = existing_booking.check_out_date
-
-                # Try to parse booking date
-                booking_date = None
-                # Update booking date if provided
-                if booking_data.get('booking_date'):
-                    parsed_date = parse_date(booking_data.get('booking_date'))
-                    if parsed_date:
-                        existing_booking.booking_date = parsed_date
-
-                # Only update fields if they exist in the CSV
-                if booking_data.get('guest_name'):
-                    existing_booking.guest_name = booking_data.get('guest_name')
-                if booking_data.get('contact_number'):
-                    existing_booking.contact_number = booking_data.get('contact_number')
-
-                # Update dates only if valid
-                if check_in_date and check_out_date and check_in_date < check_out_date:
-                    existing_booking.check_in_date = check_in_date
-                    existing_booking.check_out_date = check_out_date
-                    # Calculate nights from the dates
-                    existing_booking.number_of_nights = (check_out_date - check_in_date).days
-
-                # Update other fields
-                if booking_data.get('price'):
-                    try:
-                        # Handle price as string, removing any non-numeric characters except periods
-                        price_str = str(booking_data.get('price'))
-                        # Remove any remaining 'RM' if it wasn't caught by JavaScript
-                        price_str = price_str.replace('RM', '').replace(',', '').strip()
-                        price_value = float(price_str)
-
-                        if price_value > 0:
-                            existing_booking.price = price_value
-                    except (ValueError, TypeError) as e:
-                        print(f"Failed to convert price: {booking_data.get('price')} - Error: {e}")
-
-                if booking_data.get('payment_status'):
-                    existing_booking.payment_status = booking_data.get('payment_status')
-
-                # Update guest counts
-                if 'adults' in booking_data and booking_data['adults'] > 0:
-                    existing_booking.adults = booking_data['adults']
-                if 'children' in booking_data and booking_data['children'] > 0:
-                    existing_booking.children = booking_data['children']
-                if 'infants' in booking_data and booking_data['infants'] > 0:
-                    existing_booking.infants = booking_data['infants']
-
-                # Update total number of guests
-                existing_booking.number_of_guests = (
-                        (existing_booking.adults or 0) +
-                        (existing_booking.children or 0) +
-                        (existing_booking.infants or 0)
-                )
-
-                updated_count += 1
-            else:
-                # This is a new booking - we would normally create it, but
-                # in this case we'll skip it since we want to focus on updating existing bookings
-                pass
-
-        except Exception as e:
-            error_count += 1
-            print(f"Error processing booking: {e}")
+    # Accept the rows as JSON, or the raw export as a multipart upload that is read row by row
+    if request.is_json:
+        bookings = (request.json or {}).get('bookings', [])
+        if not bookings:
+            return jsonify({'success': False, 'message': 'No booking data provided.'}), 400
+    elif 'csv_file' in request.files and request.files['csv_file'].filename:
+        bookings = iter_airbnb_csv_rows(request.files['csv_file'].stream)
+    else:
+        return jsonify({'success': False, 'message': 'Invalid request format. JSON or a CSV file expected.'}), 400
 
-    # Commit all changes
-    db.session.commit()
+    try:
+        result = import_airbnb_bookings(bookings, current_user.company_id)
+        db.session.commit()
+    except (UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Could not read the CSV file: {str(e)}'}), 400
 
     # Return the result
     return jsonify({
         'success': True,
-        'message': f"Successfully processed {updated_count} bookings. Updated: {updated_count}, Errors: {error_count}",
-        'updated': updated_count,
-        'created': created_count,
-        'errors': error_count
+        'message': f"Successfully processed bookings. Updated: {result.updated}, No changes: {result.processed - result.updated - result.errors}, Errors: {result.errors}",
+        'updated': result.updated,
+        'created': 0,
+        'errors': result.errors
     })
 
+
 # Helper function to process ICS calendars
-def process_ics_calendar(calendar_data, unit_id, source, source_identifier=None):
-    """Process ICS calendar data and handle bookings based on confirmation codes"""
-    from icalendar import Calendar
+def process_ics_calendar(calendar_data, unit_id, source, source_identifier=None, user_id=None):
+    """
+    Process ICS calendar data and handle bookings based on confirmation codes
+
+    New bookings are recorded under user_id, defaulting to the current user
+    (scheduled syncs run outside a request and must pass one).
+    """
     import re
 
     # Parse the ICS data
     try:
-        cal = Calendar.from_ical(calendar_data)
+        events = parse_ics_events(calendar_data)
     except Exception as e:
         print(f"Error parsing calendar: {str(e)}")
         return 0, 0, 0, []
@@ -422,6 +384,9 @@ def process_ics_calendar(calendar_data, unit_id, source, source_identifier=None)
     if not unit:
         return 0, 0, 0, []
 
+    if user_id is None:
+        user_id = current_user.id
+
     bookings_added = 0
     bookings_updated = 0
     bookings_cancelled = 0
@@ -433,59 +398,54 @@ def process_ics_calendar(calendar_data, unit_id, source, source_identifier=None)
     # Collect all confirmation codes and their details from the ICS calendar
     current_bookings = {}
 
-    for component in cal.walk():
-        if component.name == "VEVENT":
-            # Skip blocked dates or unavailable periods
-            summary = str(component.get('summary', 'Booking'))
-            if "blocked" in summary.lower() or "unavailable" in summary.lower():
-                continue
-
-            description = str(component.get('description', ''))
-
-            # Extract confirmation code from the description field
-            confirmation_code = ""
-
-            # For Airbnb: Extract from URL like https://www.airbnb.com/hosting/reservations/details/HMN8ZKWAQE
-            if source == "Airbnb":
-                url_match = re.search(r'reservations/details/([A-Z0-9]+)', description)
-                if url_match:
-                    confirmation_code = url_match.group(1)
-
-            # For other platforms - adapt as needed
-            elif source == "Booking.com":
-                booking_match = re.search(r'Booking ID:\s*(\d+)', description)
-                if booking_match:
-                    confirmation_code = booking_match.group(1)
-
-            # If no valid confirmation code found, skip this entry
-            if not confirmation_code:
-                continue
-
-            # Get start and end dates
-            start_date = component.get('dtstart').dt
-            end_date = component.get('dtend').dt
-
-            # Convert datetime objects to date objects if needed
-            if isinstance(start_date, datetime):
-                start_date = start_date.date()
-            if isinstance(end_date, datetime):
-                end_date = end_date.date()
-
-            # Calculate number of nights
-            nights = (end_date - start_date).days
-
-            # Extract guest name from summary or description
-            guest_name = extract_guest_name(summary, description)
-
-            # Store booking details
-            current_bookings[confirmation_code] = {
-                'check_in_date': start_date,
-                'check_out_date': end_date,
-                'number_of_nights': nights,
-                'guest_name': guest_name,
-                'description': description,
-                'source_identifier': source_identifier
-            }
+    for event in events:
+        # Skip blocked dates or unavailable periods
+        summary = event.summary
+        if "blocked" in summary.lower() or "unavailable" in summary.lower():
+            continue
+
+        description = event.description
+
+        # Extract confirmation code from the description field
+        confirmation_code = ""
+
+        # For Airbnb: Extract from URL like https://www.airbnb.com/hosting/reservations/details/HMN8ZKWAQE
+        if source == "Airbnb":
+            url_match = re.search(r'reservations/details/([A-Z0-9]+)', description)
+            if url_match:
+                confirmation_code = url_match.group(1)
+
+        # For other platforms - adapt as needed
+        elif source == "Booking.com":
+            booking_match = re.search(r'Booking ID:\s*(\d+)', description)
+            if booking_match:
+                confirmation_code = booking_match.group(1)
+
+        # If no valid confirmation code found, skip this entry
+        if not confirmation_code:
+            continue
+
+        # Get start and end dates
+        start_date = event.start
+        end_date = event.end
+        if start_date is None or end_date is None:
+            continue
+
+        # Calculate number of nights
+        nights = (end_date - start_date).days
+
+        # Extract guest name from summary or description
+        guest_name = extract_guest_name(summary, description)
+
+        # Store booking details
+        current_bookings[confirmation_code] = {
+            'check_in_date': start_date,
+            'check_out_date': end_date,
+            'number_of_nights': nights,
+            'guest_name': guest_name,
+            'description': description,
+            'source_identifier': source_identifier
+        }
 
     # Get existing bookings from database for this unit and source
     # FIXED: Only get bookings that were imported from THIS specific calendar source
@@ -520,6 +480,11 @@ def process_ics_calendar(calendar_data, unit_id, source, source_identifier=None)
     updated_units = set()
     added_units = set()
 
+    # Same unit and platform for every booking, so count the active sources once
+    active_source_count = None
+    if not source_identifier:
+        active_source_count = count_active_sources(unit_id, source)
+
     for booking in existing_bookings:
         if not booking.confirmation_code:
             continue
@@ -555,24 +520,26 @@ def process_ics_calendar(calendar_data, unit_id, source, source_identifier=None)
                 updated_units.add(unit.unit_number)
         else:
             # Only mark as cancelled if this booking was imported from THIS specific source
-            should_cancel = should_cancel_booking(booking, source, source_identifier, existing_bookings)
+            should_cancel = should_cancel_booking(booking, source, source_identifier, existing_bookings,
+                                                  active_source_count)
 
-            if should_cancel and booking.check_out_date >= datetime.utcnow().date():
+            if should_cancel and not booking.is_cancelled and booking.check_out_date >= datetime.utcnow().date():
                 # Set cancellation status but DON'T modify user's notes
                 booking.is_cancelled = True
                 bookings_cancelled += 1
                 affected_booking_ids.append(booking.id)
 
-    # Add new bookings
+    # Add new bookings in one bulk insert
+    new_rows = []
     for confirmation_code, details in current_bookings.items():
         if confirmation_code not in existing_codes:
-            new_booking = BookingForm(
+            new_rows.append(dict(
                 guest_name=details['guest_name'] or f"Guest from {source}",
                 contact_number="",
                 check_in_date=details['check_in_date'],
                 check_out_date=details['check_out_date'],
                 property_name=unit.building or "Property",
-                unit_id=unit_id,
+                unit_id=unit.id,
                 number_of_nights=details['number_of_nights'],
                 number_of_guests=2,  # Default value
                 price=0,  # Default value
@@ -580,15 +547,14 @@ def process_ics_calendar(calendar_data, unit_id, source, source_identifier=None)
                 payment_status="Paid",
                 notes="",  # LEAVE EMPTY for user input
                 company_id=unit.company_id,
-                user_id=current_user.id,
+                user_id=user_id,
                 confirmation_code=confirmation_code
-            )
+            ))
 
-            db.session.add(new_booking)
-            db.session.flush()
-            bookings_added += 1
-            affected_booking_ids.append(new_booking.id)
-            added_units.add(unit.unit_number)
+    if new_rows:
+        affected_booking_ids.extend(insert_bookings(new_rows))
+        bookings_added = len(new_rows)
+        added_units.add(unit.unit_number)
 
     # Commit all changes
     if bookings_added > 0 or bookings_updated > 0 or bookings_cancelled > 0:
@@ -619,9 +585,21 @@ def should_manage_booking(booking, source, source_identifier):
     return False
 
 
-def should_cancel_booking(booking, source, source_identifier, all_existing_bookings):
+def count_active_sources(unit_id, source):
+    """Count the active calendar sources of a platform for a unit"""
+    return CalendarSource.query.filter(
+        CalendarSource.unit_id == unit_id,
+        CalendarSource.source_name == source,
+        CalendarSource.is_active == True
+    ).count()
+
+
+def should_cancel_booking(booking, source, source_identifier, all_existing_bookings, active_source_count=None):
     """
     Determine if a booking should be cancelled when it's not found in the current ICS
+
+    Pass active_source_count (see count_active_sources) when checking many
+    bookings of one unit to avoid a count query per booking.
     """
     # Only cancel if we're confident this booking came from THIS specific source
 
@@ -631,11 +609,9 @@ def should_cancel_booking(booking, source, source_identifier, all_existing_booki
     else:
         # If no source identifier, be very conservative about cancelling
         # Only cancel if this is the only source for this platform
-        other_active_sources = CalendarSource.query.filter(
-            CalendarSource.unit_id == booking.unit_id,
-            CalendarSource.source_name == source,
-            CalendarSource.is_active == True
-        ).count()
+        if active_source_count is None:
+            active_source_count = count_active_sources(booking.unit_id, source)
+        other_active_sources = active_source_count
 
         # Only cancel if there's only one active source (this one)
         return other_active_sources <= 1
@@ -802,14 +778,13 @@ def toggle_calendar_source(source_id, action):
 
 
 # Updated process_ics_calendar function using the mapping table
-def process_ics_calendar_with_mapping(calendar_data, unit_id, source, source_identifier=None):
+def process_ics_calendar_with_mapping(calendar_data, unit_id, source, source_identifier=None, user_id=None):
     """Process ICS calendar data with proper source tracking"""
-    from icalendar import Calendar
     import re
 
     # Parse the ICS data
     try:
-        cal = Calendar.from_ical(calendar_data)
+        events = parse_ics_events(calendar_data)
     except Exception as e:
         print(f"Error parsing calendar: {str(e)}")
         return 0, 0, 0, []
@@ -818,6 +793,9 @@ def process_ics_calendar_with_mapping(calendar_data, unit_id, source, source_ide
     if not unit:
         return 0, 0, 0, []
 
+    if user_id is None:
+        user_id = current_user.id
+
     # Get or create the calendar source
     calendar_source = CalendarSource.query.filter_by(
         unit_id=unit_id,
@@ -843,58 +821,55 @@ def process_ics_calendar_with_mapping(calendar_data, unit_id, source, source_ide
     # Collect all confirmation codes from this specific ICS calendar
     current_bookings = {}
 
-    for component in cal.walk():
-        if component.name == "VEVENT":
-            # Skip blocked dates or unavailable periods
-            summary = str(component.get('summary', 'Booking'))
-            if "blocked" in summary.lower() or "unavailable" in summary.lower():
-                continue
-
-            description = str(component.get('description', ''))
-            confirmation_code = ""
-
-            # Extract confirmation code based on platform
-            if source == "Airbnb":
-                url_match = re.search(r'reservations/details/([A-Z0-9]+)', description)
-                if url_match:
-                    confirmation_code = url_match.group(1)
-            elif source == "Booking.com":
-                booking_match = re.search(r'Booking ID:\s*(\d+)', description)
-                if booking_match:
-                    confirmation_code = booking_match.group(1)
-
-            if not confirmation_code:
-                continue
-
-            # Process dates
-            start_date = component.get('dtstart').dt
-            end_date = component.get('dtend').dt
-
-            if isinstance(start_date, datetime):
-                start_date = start_date.date()
-            if isinstance(end_date, datetime):
-                end_date = end_date.date()
-
-            nights = (end_date - start_date).days
-            guest_name = extract_guest_name(summary, description)
-
-            current_bookings[confirmation_code] = {
-                'check_in_date': start_date,
-                'check_out_date': end_date,
-                'number_of_nights': nights,
-                'guest_name': guest_name,
-                'description': description
-            }
-
-    # Get existing bookings that were imported from THIS specific calendar source
-    existing_booking_mappings = BookingCalendarSource.query.filter_by(
-        calendar_source_id=calendar_source.id
+    for event in events:
+        # Skip blocked dates or unavailable periods
+        summary = event.summary
+        if "blocked" in summary.lower() or "unavailable" in summary.lower():
+            continue
+
+        description = event.description
+        confirmation_code = ""
+
+        # Extract confirmation code based on platform
+        if source == "Airbnb":
+            url_match = re.search(r'reservations/details/([A-Z0-9]+)', description)
+            if url_match:
+                confirmation_code = url_match.group(1)
+        elif source == "Booking.com":
+            booking_match = re.search(r'Booking ID:\s*(\d+)', description)
+            if booking_match:
+                confirmation_code = booking_match.group(1)
+
+        if not confirmation_code:
+            continue
+
+        # Process dates
+        start_date = event.start
+        end_date = event.end
+        if start_date is None or end_date is None:
+            continue
+
+        nights = (end_date - start_date).days
+        guest_name = extract_guest_name(summary, description)
+
+        current_bookings[confirmation_code] = {
+            'check_in_date': start_date,
+            'check_out_date': end_date,
+            'number_of_nights': nights,
+            'guest_name': guest_name,
+            'description': description
+        }
+
+    # Get existing bookings that were imported from THIS specific calendar source, in one query
+    mapped_bookings = BookingForm.query.join(
+        BookingCalendarSource, BookingCalendarSource.booking_id == BookingForm.id
+    ).filter(
+        BookingCalendarSource.calendar_source_id == calendar_source.id
     ).all()
 
     existing_bookings = {}
-    for mapping in existing_booking_mappings:
-        booking = mapping.booking
-        if booking and booking.confirmation_code:
+    for booking in mapped_bookings:
+        if booking.confirmation_code:
             existing_bookings[booking.confirmation_code] = booking
 
     # Process each booking from the current ICS
@@ -936,7 +911,7 @@ def process_ics_calendar_with_mapping(calendar_data, unit_id, source, source_ide
     # Cancel bookings that are no longer in THIS calendar source
     for confirmation_code in existing_codes - current_codes:
         booking = existing_bookings[confirmation_code]
-        if booking.check_out_date >= datetime.utcnow().date():
+        if not booking.is_cancelled and booking.check_out_date >= datetime.utcnow().date():
             cancel_note = f"Cancelled: No longer in {source}"
             if source_identifier:
                 cancel_note += f" ({source_identifier})"
@@ -951,61 +926,57 @@ def process_ics_calendar_with_mapping(calendar_data, unit_id, source, source_ide
             bookings_cancelled += 1
             affected_booking_ids.append(booking.id)
 
-    # Add new bookings
-    for confirmation_code in current_codes - existing_codes:
-        details = current_bookings[confirmation_code]
-
-        # Check if this confirmation code already exists from another source
-        existing_booking = BookingForm.query.filter_by(
-            confirmation_code=confirmation_code,
-            unit_id=unit_id
-        ).first()
+    new_codes = current_codes - existing_codes
 
-        if existing_booking:
-            # Create mapping to this calendar source as well
-            existing_mapping = BookingCalendarSource.query.filter_by(
-                booking_id=existing_booking.id,
-                calendar_source_id=calendar_source.id
-            ).first()
-
-            if not existing_mapping:
-                new_mapping = BookingCalendarSource(
-                    booking_id=existing_booking.id,
-                    calendar_source_id=calendar_source.id
-                )
-                db.session.add(new_mapping)
-        else:
-            # Create new booking
-            new_booking = BookingForm(
-                guest_name=details['guest_name'] or f"Guest from {source}",
-                contact_number="",
-                check_in_date=details['check_in_date'],
-                check_out_date=details['check_out_date'],
-                property_name=unit.building or "Property",
-                unit_id=unit_id,
-                number_of_nights=details['number_of_nights'],
-                number_of_guests=2,
-                price=0,
-                booking_source=source,
-                payment_status="Paid",
-                notes=f"Imported from {source}" + (f" ({source_identifier})" if source_identifier else ""),
-                company_id=unit.company_id,
-                user_id=current_user.id,
-                confirmation_code=confirmation_code
+    # Bookings with these codes imported from another source just get linked to this one
+    linked_bookings = {}
+    if new_codes:
+        linked_bookings = {
+            booking.confirmation_code: booking.id
+            for booking in db.session.query(BookingForm.id, BookingForm.confirmation_code).filter(
+                BookingForm.unit_id == unit_id,
+                BookingForm.confirmation_code.in_(new_codes)
             )
-
-            db.session.add(new_booking)
-            db.session.flush()
-
-            # Create mapping
-            mapping = BookingCalendarSource(
-                booking_id=new_booking.id,
-                calendar_source_id=calendar_source.id
+        }
+    mapped_booking_ids = set()
+    if linked_bookings:
+        mapped_booking_ids = {
+            row.booking_id for row in db.session.query(BookingCalendarSource.booking_id).filter(
+                BookingCalendarSource.calendar_source_id == calendar_source.id,
+                BookingCalendarSource.booking_id.in_(linked_bookings.values())
             )
-            db.session.add(mapping)
+        }
 
-            bookings_added += 1
-            affected_booking_ids.append(new_booking.id)
+    new_mapping_ids = [booking_id for booking_id in linked_bookings.values()
+                       if booking_id not in mapped_booking_ids]
+
+    # Create the remaining bookings in one bulk insert
+    new_rows = []
+    for confirmation_code in new_codes - set(linked_bookings):
+        details = current_bookings[confirmation_code]
+        new_rows.append(dict(
+            guest_name=details['guest_name'] or f"Guest from {source}",
+            contact_number="",
+            check_in_date=details['check_in_date'],
+            check_out_date=details['check_out_date'],
+            property_name=unit.building or "Property",
+            unit_id=unit.id,
+            number_of_nights=details['number_of_nights'],
+            number_of_guests=2,
+            price=0,
+            booking_source=source,
+            payment_status="Paid",
+            notes=f"Imported from {source}" + (f" ({source_identifier})" if source_identifier else ""),
+            company_id=unit.company_id,
+            user_id=user_id,
+            confirmation_code=confirmation_code
+        ))
+
+    new_booking_ids = insert_bookings(new_rows)
+    insert_calendar_mappings(calendar_source.id, new_mapping_ids + new_booking_ids)
+
+    bookings_added += len(new_booking_ids)
+    affected_booking_ids.extend(new_booking_ids)
 
     # Update calendar source timestamp
     calendar_source.last_updated = datetime.utcnow()
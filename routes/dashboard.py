@@ -2,18 +2,29 @@ from flask import Blueprint, render_template, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
 from sqlalchemy import func, and_, extract
-from models import (db, Issue, Unit, Category, Priority, Status, Type, ReportedBy,
-                    BookingForm, ExpenseData, IssueItem)
+from models import (db, Issue, Unit, Priority, Status, Type, ReportedBy,
+                    IssueItem)
 from flask import request
 import pytz
 from utils.access_control import (
-    get_accessible_units_query,
     get_accessible_bookings_query,
     get_accessible_issues_query
 )
+from utils.booking_stats import compute_booking_stats
+from utils.expenses import monthly_expense_totals, expense_breakdown as get_expense_breakdown
+from utils.issue_heatmap import issue_heatmap
+from utils.pnl_rollup import GRAINS, pnl_totals, query_pnl, rollup_expense_totals
+from utils.revenue import recognize_revenue
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+# Longest range /api/dashboard/pnl accepts for the day and week grains
+MAX_PNL_DAILY_RANGE_DAYS = 731
+# Longest range /api/dashboard/revenue accepts
+MAX_REVENUE_RANGE_DAYS = 731
+# Grains /api/dashboard/revenue aggregates to
+REVENUE_GRAINS = ('day', 'week', 'month')
+
 
 # Add template filters
 @dashboard_bp.app_template_filter('month_name')
@@ -46,7 +57,6 @@ def dashboard():
 
     # Get current date info
     today = datetime.now().date()
-    tomorrow = today + timedelta(days=1)
     current_month = datetime.now().month
     current_year = datetime.now().year
 
@@ -54,90 +64,8 @@ def dashboard():
     booking_stats = {}
 
     if current_user.has_permission('can_view_bookings'):
-        # Get accessible units for this user
-        accessible_units = get_accessible_units_query().all()
-        accessible_unit_ids = [unit.id for unit in accessible_units]
-
-        if accessible_unit_ids:
-            # Total accessible units
-            total_units = len(accessible_unit_ids)
-
-            # Current occupancy (check-in <= today < check-out) for accessible units
-            current_occupancy = BookingForm.query.filter(
-                BookingForm.company_id == user_company_id,
-                BookingForm.unit_id.in_(accessible_unit_ids),
-                BookingForm.check_in_date <= today,
-                BookingForm.check_out_date > today
-            ).count()
-
-            # Tomorrow occupancy for accessible units
-            tomorrow_occupancy = BookingForm.query.filter(
-                BookingForm.company_id == user_company_id,
-                BookingForm.unit_id.in_(accessible_unit_ids),
-                BookingForm.check_in_date <= tomorrow,
-                BookingForm.check_out_date > tomorrow
-            ).count()
-
-            # Revenue today (bookings checking in today) for accessible units
-            today_bookings = BookingForm.query.filter(
-                BookingForm.company_id == user_company_id,
-                BookingForm.unit_id.in_(accessible_unit_ids),
-                BookingForm.check_in_date == today
-            ).all()
-            revenue_today = sum(float(booking.price) for booking in today_bookings if booking.price)
-
-            # Revenue tomorrow for accessible units
-            tomorrow_bookings = BookingForm.query.filter(
-                BookingForm.company_id == user_company_id,
-                BookingForm.unit_id.in_(accessible_unit_ids),
-                BookingForm.check_in_date == tomorrow
-            ).all()
-            revenue_tomorrow = sum(float(booking.price) for booking in tomorrow_bookings if booking.price)
-
-            # Check-ins and check-outs for accessible units
-            checkins_today = len(today_bookings)
-            checkins_tomorrow = BookingForm.query.filter(
-                BookingForm.company_id == user_company_id,
-                BookingForm.unit_id.in_(accessible_unit_ids),
-                BookingForm.check_in_date == tomorrow
-            ).count()
-
-            checkouts_today = BookingForm.query.filter(
-                BookingForm.company_id == user_company_id,
-                BookingForm.unit_id.in_(accessible_unit_ids),
-                BookingForm.check_out_date == today
-            ).count()
-
-            checkouts_tomorrow = BookingForm.query.filter(
-                BookingForm.company_id == user_company_id,
-                BookingForm.unit_id.in_(accessible_unit_ids),
-                BookingForm.check_out_date == tomorrow
-            ).count()
-
-            booking_stats = {
-                'total_units': total_units,
-                'current_occupancy': current_occupancy,
-                'tomorrow_occupancy': tomorrow_occupancy,
-                'revenue_today': revenue_today,
-                'revenue_tomorrow': revenue_tomorrow,
-                'checkins_today': checkins_today,
-                'checkins_tomorrow': checkins_tomorrow,
-                'checkouts_today': checkouts_today,
-                'checkouts_tomorrow': checkouts_tomorrow
-            }
-        else:
-            # No accessible units
-            booking_stats = {
-                'total_units': 0,
-                'current_occupancy': 0,
-                'tomorrow_occupancy': 0,
-                'revenue_today': 0,
-                'revenue_tomorrow': 0,
-                'checkins_today': 0,
-                'checkins_tomorrow': 0,
-                'checkouts_today': 0,
-                'checkouts_tomorrow': 0
-            }
+        # Occupancy, check-in/out and revenue counters for accessible units in one query
+        booking_stats = compute_booking_stats(today).for_dashboard()
 
     # ============ ISSUE ANALYTICS ============
     issue_stats = {}
@@ -175,36 +103,17 @@ def dashboard():
             # Convert to list of tuples for JSON serialization
             top_issue_types = [(name, count) for name, count in top_issue_types_query]
 
-            # Issues by unit and category for heatmap (accessible units only)
-            accessible_units = get_accessible_units_query().all()
-            categories = Category.query.all()
-
-            heatmap_data = {}
-            for unit in accessible_units:
-                heatmap_data[unit.unit_number] = {}
-                for category in categories:
-                    count = Issue.query.filter(
-                        Issue.company_id == user_company_id,
-                        Issue.unit_id == unit.id,
-                        Issue.category_id == category.id
-                    ).count()
-                    heatmap_data[unit.unit_number][category.name] = count
+            # The unit x category heatmap is fetched from /api/dashboard/issue_heatmap
 
             issue_stats = {
                 'status_data': status_data,
-                'top_issue_types': top_issue_types,
-                'heatmap_data': heatmap_data,
-                'units': [unit.unit_number for unit in accessible_units],
-                'categories': [cat.name for cat in categories]
+                'top_issue_types': top_issue_types
             }
         else:
             # No accessible units
             issue_stats = {
                 'status_data': {},
-                'top_issue_types': [],
-                'heatmap_data': {},
-                'units': [],
-                'categories': []
+                'top_issue_types': []
             }
 
     # ============ EXPENSES ANALYTICS ============
@@ -214,79 +123,15 @@ def dashboard():
     accessible_unit_ids = current_user.get_accessible_unit_ids()
 
     if accessible_unit_ids:
-        # Get current month expenses for accessible units
-        current_month_expenses = ExpenseData.query.filter(
-            ExpenseData.company_id == user_company_id,
-            ExpenseData.unit_id.in_(accessible_unit_ids),
-            ExpenseData.year == current_year,
-            ExpenseData.month == current_month
-        ).all()
-
         # Get previous month for comparison
         prev_month = current_month - 1 if current_month > 1 else 12
         prev_year = current_year if current_month > 1 else current_year - 1
 
-        prev_month_expenses = ExpenseData.query.filter(
-            ExpenseData.company_id == user_company_id,
-            ExpenseData.unit_id.in_(accessible_unit_ids),
-            ExpenseData.year == prev_year,
-            ExpenseData.month == prev_month
-        ).all()
-
-        # Calculate totals (keep existing calculation logic)
-        def calculate_totals(expenses_list):
-            totals = {
-                'revenue': 0,
-                'total_expenses': 0,
-                'rental': 0,
-                'electricity': 0,
-                'water': 0,
-                'sewage': 0,
-                'internet': 0,
-                'cleaner': 0,
-                'laundry': 0,
-                'supplies': 0,
-                'repair': 0,
-                'replace': 0,
-                'other': 0
-            }
-
-            for expense in expenses_list:
-                sales = float(expense.sales or 0)
-                rental = float(expense.rental or 0)
-                electricity = float(expense.electricity or 0)
-                water = float(expense.water or 0)
-                sewage = float(expense.sewage or 0)
-                internet = float(expense.internet or 0)
-                cleaner = float(expense.cleaner or 0)
-                laundry = float(expense.laundry or 0)
-                supplies = float(expense.supplies or 0)
-                repair = float(expense.repair or 0)
-                replace = float(expense.replace or 0)
-                other = float(expense.other or 0)
-
-                totals['revenue'] += sales
-                totals['rental'] += rental
-                totals['electricity'] += electricity
-                totals['water'] += water
-                totals['sewage'] += sewage
-                totals['internet'] += internet
-                totals['cleaner'] += cleaner
-                totals['laundry'] += laundry
-                totals['supplies'] += supplies
-                totals['repair'] += repair
-                totals['replace'] += replace
-                totals['other'] += other
-
-                totals['total_expenses'] += (rental + electricity + water + sewage +
-                                             internet + cleaner + laundry + supplies +
-                                             repair + replace + other)
-
-            totals['net_income'] = totals['revenue'] - totals['total_expenses']
-            return totals
-
-        current_totals = calculate_totals(current_month_expenses)
-        prev_totals = calculate_totals(prev_month_expenses)
+        # Both months' totals summed in one query
+        monthly_totals = monthly_expense_totals(user_company_id, accessible_unit_ids,
+                                                [(current_year, current_month), (prev_year, prev_month)])
+        current_totals = monthly_totals[(current_year, current_month)]
+        prev_totals = monthly_totals[(prev_year, prev_month)]
 
         # Calculate percentage changes (keep existing logic)
         def calc_percentage_change(current, previous):
@@ -298,22 +143,8 @@ def dashboard():
         expense_change = calc_percentage_change(current_totals['total_expenses'], prev_totals['total_expenses'])
         income_change = calc_percentage_change(current_totals['net_income'], prev_totals['net_income'])
 
-        # Expense breakdown for pie chart (keep existing logic)
-        expense_breakdown = []
-        for category in ['rental', 'electricity', 'water', 'sewage', 'internet', 'cleaner', 'laundry', 'supplies',
-                         'repair',
-                         'replace', 'other']:
-            if current_totals[category] > 0:
-                percentage = (current_totals[category] / current_totals['total_expenses']) * 100 if current_totals[
-                                                                                                        'total_expenses'] > 0 else 0
-                expense_breakdown.append({
-                    'category': category.title(),
-                    'amount': current_totals[category],
-                    'percentage': percentage
-                })
-
-        # Sort by amount (highest first)
-        expense_breakdown.sort(key=lambda x: x['amount'], reverse=True)
+        # Expense breakdown for pie chart
+        expense_breakdown = get_expense_breakdown(current_totals)
 
         expense_stats = {
             'current_month': current_month,
@@ -467,6 +298,117 @@ def get_earnings_data():
     return jsonify(current_data)
 
 
+
+@dashboard_bp.route('/api/dashboard/issue_heatmap')
+@login_required
+def get_issue_heatmap():
+    """Issue counts per accessible unit and category, loaded by the dashboard after the page"""
+    if not current_user.has_permission('can_view_issues'):
+        return jsonify({'error': 'You do not have permission to view issues'}), 403
+
+    heatmap = issue_heatmap(current_user.company_id, current_user.get_accessible_unit_ids())
+    return jsonify(heatmap.to_dict())
+
+
+@dashboard_bp.route('/api/dashboard/pnl')
+@login_required
+def get_pnl_data():
+    """
+    P&L rollup sliced by time grain, building and unit set
+
+    Query parameters: start and end (YYYY-MM-DD, inclusive), grain (day, week,
+    month, quarter or year; default month), building, unit_ids and categories
+    (comma-separated) and by_unit=1 to split every period by unit.
+    """
+    try:
+        start = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d').date()
+        end = datetime.strptime(request.args.get('end', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'start and end are required as YYYY-MM-DD'}), 400
+
+    grain = request.args.get('grain', 'month')
+    if grain not in GRAINS:
+        return jsonify({'error': f'grain must be one of {", ".join(GRAINS)}'}), 400
+    if end < start:
+        return jsonify({'error': 'end must not be before start'}), 400
+    if grain in ('day', 'week') and (end - start).days > MAX_PNL_DAILY_RANGE_DAYS:
+        return jsonify({'error': f'Day and week grains cover at most {MAX_PNL_DAILY_RANGE_DAYS} days'}), 400
+
+    # Only units the user can access
+    unit_ids = set(current_user.get_accessible_unit_ids())
+    if request.args.get('unit_ids'):
+        try:
+            unit_ids &= {int(unit_id) for unit_id in request.args['unit_ids'].split(',')}
+        except ValueError:
+            return jsonify({'error': 'unit_ids must be comma-separated IDs'}), 400
+
+    categories = [category for category in request.args.get('categories', '').split(',') if category]
+    by_unit = request.args.get('by_unit') == '1'
+
+    result = query_pnl(current_user.company_id, start, end, grain, unit_ids=sorted(unit_ids),
+                       building=request.args.get('building'), categories=categories, by_unit=by_unit)
+
+    periods = []
+    for key, values in result.items():
+        period, unit_id = key if by_unit else (key, None)
+        entry = {'period': period.isoformat(), 'values': values}
+        if by_unit:
+            entry['unit_id'] = unit_id
+        periods.append(entry)
+
+    return jsonify({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'grain': grain,
+        'periods': periods
+    })
+
+
+@dashboard_bp.route('/api/dashboard/revenue')
+@login_required
+def get_revenue_report():
+    """
+    Booking revenue recognized per night, by unit and period
+
+    Query parameters: start and end (YYYY-MM-DD, inclusive), grain (day, week
+    or month; default month) and unit_ids (comma-separated).
+    """
+    try:
+        start = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d').date()
+        end = datetime.strptime(request.args.get('end', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'start and end are required as YYYY-MM-DD'}), 400
+
+    grain = request.args.get('grain', 'month')
+    if grain not in REVENUE_GRAINS:
+        return jsonify({'error': f'grain must be one of {", ".join(REVENUE_GRAINS)}'}), 400
+    if end < start:
+        return jsonify({'error': 'end must not be before start'}), 400
+    if (end - start).days > MAX_REVENUE_RANGE_DAYS:
+        return jsonify({'error': f'The range covers at most {MAX_REVENUE_RANGE_DAYS} days'}), 400
+
+    # Only units the user can access
+    unit_ids = set(current_user.get_accessible_unit_ids())
+    if request.args.get('unit_ids'):
+        try:
+            unit_ids &= {int(unit_id) for unit_id in request.args['unit_ids'].split(',')}
+        except ValueError:
+            return jsonify({'error': 'unit_ids must be comma-separated IDs'}), 400
+
+    schedule = recognize_revenue(current_user.company_id, sorted(unit_ids), start, end + timedelta(days=1))
+
+    return jsonify({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'grain': grain,
+        'periods': [
+            {'period': period.isoformat(), 'units': {str(unit_id): round(amount, 2) for unit_id, amount in units.items()}}
+            for period, units in schedule.aggregate(grain).items()
+        ],
+        'totals': {str(unit_id): round(amount, 2) for unit_id, amount in schedule.by_unit().items()}
+    })
+
+
 def calculate_percentage_change(old_value, new_value):
     """Calculate percentage change between two values"""
     if old_value == 0:
@@ -614,34 +556,16 @@ def calculate_date_range(time_filter, now_local):
 
 
 def calculate_daily_earnings(company_id, start_date, end_date, unit_ids):
-    """Calculate earnings for daily periods using bookings and issues with unit filtering"""
-
-    # Base query for bookings revenue
-    bookings_query = BookingForm.query.filter(
-        BookingForm.company_id == company_id,
-        BookingForm.unit_id.in_(unit_ids),
-        BookingForm.check_in_date >= start_date.date(),
-        BookingForm.check_in_date <= end_date.date()
-    )
-
-    bookings = bookings_query.all()
-    total_revenue = sum(float(booking.price) for booking in bookings if booking.price)
-
-    # Base query for issues costs
-    issues_query = Issue.query.filter(
-        Issue.company_id == company_id,
-        Issue.unit_id.in_(unit_ids),
-        Issue.date_added >= start_date,
-        Issue.date_added <= end_date,
-        Issue.cost.isnot(None)
-    )
-
-    issues_with_cost = issues_query.all()
-
-    total_repair_cost = sum(
-        float(issue.cost) for issue in issues_with_cost if issue.type and issue.type.name == 'Repair')
-    total_replace_cost = sum(
-        float(issue.cost) for issue in issues_with_cost if issue.type and issue.type.name == 'Replace')
+    """
+    Calculate earnings for daily periods: booking revenue recognized per night,
+    repair and replace costs from the P&L rollup
+    """
+    total_revenue = recognize_revenue(company_id, unit_ids, start_date.date(),
+                                      end_date.date() + timedelta(days=1)).total()
+    totals = pnl_totals(company_id, start_date.date(), end_date.date(), 'day', unit_ids=unit_ids,
+                        categories=['repair_cost', 'replace_cost'])
+    total_repair_cost = totals.get('repair_cost', 0.0)
+    total_replace_cost = totals.get('replace_cost', 0.0)
 
     # Create expense breakdown
     expense_breakdown = []
@@ -649,16 +573,14 @@ def calculate_daily_earnings(company_id, start_date, end_date, unit_ids):
         expense_breakdown.append({
             'category': 'Repair',
             'amount': total_repair_cost,
-            'percentage': 100 * total_repair_cost / (total_repair_cost + total_replace_cost) if (
-                                                                                                        total_repair_cost + total_replace_cost) > 0 else 0
+            'percentage': 100 * total_repair_cost / (total_repair_cost + total_replace_cost)
         })
 
     if total_replace_cost > 0:
         expense_breakdown.append({
             'category': 'Replace',
             'amount': total_replace_cost,
-            'percentage': 100 * total_replace_cost / (total_repair_cost + total_replace_cost) if (
-                                                                                                         total_repair_cost + total_replace_cost) > 0 else 0
+            'percentage': 100 * total_replace_cost / (total_repair_cost + total_replace_cost)
         })
 
     total_expenses = total_repair_cost + total_replace_cost
@@ -678,177 +600,22 @@ def calculate_weekly_earnings(company_id, start_date, end_date, unit_ids):
 
 
 def calculate_monthly_earnings(company_id, start_date, end_date, unit_ids):
-    """Calculate earnings for monthly periods using ExpenseData with unit filtering"""
-
-    year = start_date.year
-    month = start_date.month
-
-    # Base query for expense data
-    query = ExpenseData.query.filter(
-        ExpenseData.company_id == company_id,
-        ExpenseData.unit_id.in_(unit_ids),
-        ExpenseData.year == year,
-        ExpenseData.month == month
-    )
-
-    monthly_expenses = query.all()
-
-    # Calculate totals (keep existing calculation logic)
-    totals = {
-        'revenue': 0,
-        'total_expenses': 0,
-        'rental': 0,
-        'electricity': 0,
-        'water': 0,
-        'sewage': 0,
-        'internet': 0,
-        'cleaner': 0,
-        'laundry': 0,
-        'supplies': 0,
-        'repair': 0,
-        'replace': 0,
-        'other': 0
-    }
-
-    for expense in monthly_expenses:
-        sales = float(expense.sales or 0)
-        rental = float(expense.rental or 0)
-        electricity = float(expense.electricity or 0)
-        water = float(expense.water or 0)
-        sewage = float(expense.sewage or 0)
-        internet = float(expense.internet or 0)
-        cleaner = float(expense.cleaner or 0)
-        laundry = float(expense.laundry or 0)
-        supplies = float(expense.supplies or 0)
-        repair = float(expense.repair or 0)
-        replace = float(expense.replace or 0)
-        other = float(expense.other or 0)
-
-        totals['revenue'] += sales
-        totals['rental'] += rental
-        totals['electricity'] += electricity
-        totals['water'] += water
-        totals['sewage'] += sewage
-        totals['internet'] += internet
-        totals['cleaner'] += cleaner
-        totals['laundry'] += laundry
-        totals['supplies'] += supplies
-        totals['repair'] += repair
-        totals['replace'] += replace
-        totals['other'] += other
-
-        totals['total_expenses'] += (rental + electricity + water + sewage +
-                                     internet + cleaner + laundry + supplies +
-                                     repair + replace + other)
-
-    # Create expense breakdown
-    expense_breakdown = []
-    categories = ['rental', 'electricity', 'water', 'sewage', 'internet', 'cleaner',
-                  'laundry', 'supplies', 'repair', 'replace', 'other']
-
-    for category in categories:
-        if totals[category] > 0:
-            percentage = (totals[category] / totals['total_expenses']) * 100 if totals['total_expenses'] > 0 else 0
-            expense_breakdown.append({
-                'category': category.title(),
-                'amount': totals[category],
-                'percentage': percentage
-            })
-
-    # Sort by amount (highest first)
-    expense_breakdown.sort(key=lambda x: x['amount'], reverse=True)
-
+    """Calculate earnings for monthly periods from the ExpenseData figures in the P&L rollup"""
+    totals = rollup_expense_totals(company_id, unit_ids, start_date.date(), end_date.date())
     return {
         'revenue': totals['revenue'],
         'total_expenses': totals['total_expenses'],
-        'net_income': totals['revenue'] - totals['total_expenses'],
-        'expense_breakdown': expense_breakdown
+        'net_income': totals['net_income'],
+        'expense_breakdown': get_expense_breakdown(totals)
     }
 
 
 def calculate_yearly_earnings(company_id, start_date, end_date, unit_ids):
-    """Calculate earnings for yearly periods by aggregating monthly data with unit filtering"""
-
-    year = start_date.year
-
-    # Base query for all expense data for the year
-    query = ExpenseData.query.filter(
-        ExpenseData.company_id == company_id,
-        ExpenseData.unit_id.in_(unit_ids),
-        ExpenseData.year == year
-    )
-
-    yearly_expenses = query.all()
-
-    # Use the same calculation logic as monthly but for all months in the year
-    # (keep existing yearly calculation logic but filter by unit_ids)
-    totals = {
-        'revenue': 0,
-        'total_expenses': 0,
-        'rental': 0,
-        'electricity': 0,
-        'water': 0,
-        'sewage': 0,
-        'internet': 0,
-        'cleaner': 0,
-        'laundry': 0,
-        'supplies': 0,
-        'repair': 0,
-        'replace': 0,
-        'other': 0
-    }
-
-    for expense in yearly_expenses:
-        sales = float(expense.sales or 0)
-        rental = float(expense.rental or 0)
-        electricity = float(expense.electricity or 0)
-        water = float(expense.water or 0)
-        sewage = float(expense.sewage or 0)
-        internet = float(expense.internet or 0)
-        cleaner = float(expense.cleaner or 0)
-        laundry = float(expense.laundry or 0)
-        supplies = float(expense.supplies or 0)
-        repair = float(expense.repair or 0)
-        replace = float(expense.replace or 0)
-        other = float(expense.other or 0)
-
-        totals['revenue'] += sales
-        totals['rental'] += rental
-        totals['electricity'] += electricity
-        totals['water'] += water
-        totals['sewage'] += sewage
-        totals['internet'] += internet
-        totals['cleaner'] += cleaner
-        totals['laundry'] += laundry
-        totals['supplies'] += supplies
-        totals['repair'] += repair
-        totals['replace'] += replace
-        totals['other'] += other
-
-        totals['total_expenses'] += (rental + electricity + water + sewage +
-                                     internet + cleaner + laundry + supplies +
-                                     repair + replace + other)
-
-    # Create expense breakdown
-    expense_breakdown = []
-    categories = ['rental', 'electricity', 'water', 'sewage', 'internet', 'cleaner',
-                  'laundry', 'supplies', 'repair', 'replace', 'other']
-
-    for category in categories:
-        if totals[category] > 0:
-            percentage = (totals[category] / totals['total_expenses']) * 100 if totals['total_expenses'] > 0 else 0
-            expense_breakdown.append({
-                'category': category.title(),
-                'amount': totals[category],
-                'percentage': percentage
-            })
-
-    # Sort by amount (highest first)
-    expense_breakdown.sort(key=lambda x: x['amount'], reverse=True)
-
+    """Calculate earnings for yearly periods from the ExpenseData figures in the P&L rollup"""
+    totals = rollup_expense_totals(company_id, unit_ids, start_date.date(), end_date.date())
     return {
         'revenue': totals['revenue'],
         'total_expenses': totals['total_expenses'],
-        'net_income': totals['revenue'] - totals['total_expenses'],
-        'expense_breakdown': expense_breakdown
-    }
\ No newline at end of file
+        'net_income': totals['net_income'],
+        'expense_breakdown': get_expense_breakdown(totals)
+    }
@@ -1,7 +1,7 @@
 from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required, current_user
 from datetime import datetime
-from models import db, ExpenseData, Unit, BookingForm, Issue, Type, ExpenseRemark
+from models import db, ExpenseData, Unit, Issue, Type, ExpenseRemark
 import json
 from utils.access_control import (
     filter_query_by_accessible_units,
@@ -11,6 +11,16 @@ from utils.access_control import (
     check_unit_access,
     require_unit_access
 )
+from utils.expenses import (
+    EXPENSE_FIELDS,
+    format_amount,
+    owned_unit_ids,
+    parse_amount,
+    upsert_expense_remarks,
+    upsert_expenses,
+    yearly_expense_matrix
+)
+from utils.revenue import recognize_revenue
 
 expenses_bp = Blueprint('expenses', __name__)
 
@@ -78,18 +88,7 @@ def get_expenses():
         # Format expense data
         for expense in expenses:
             expenses_data[expense.unit_id] = {
-                'sales': expense.sales,
-                'rental': expense.rental,
-                'electricity': expense.electricity,
-                'water': expense.water,
-                'sewage': expense.sewage,
-                'internet': expense.internet,
-                'cleaner': expense.cleaner,
-                'laundry': expense.laundry,
-                'supplies': expense.supplies,
-                'repair': expense.repair,
-                'replace': expense.replace,
-                'other': expense.other
+                field: format_amount(getattr(expense, field)) for field in EXPENSE_FIELDS
             }
 
     return jsonify({
@@ -98,25 +97,44 @@ def get_expenses():
     })
 
 
+def _parse_year_month(data):
+    """(year, month) from a JSON payload, or None if either is invalid"""
+    try:
+        year, month = int(data['year']), int(data['month'])
+    except (TypeError, ValueError):
+        return None
+    return (year, month) if 1 <= month <= 12 else None
+
+
 # Replace the existing save_expenses() function with this updated version:
 @expenses_bp.route('/api/expenses', methods=['POST'])
 @login_required
 def save_expenses():
+    """
+    Save a month of expenses. 'expenses' holds every field of each unit, while
+    'changes' holds only the cells edited since the last save.
+    """
     # Get data from request
     data = request.json
 
-    if not data or 'year' not in data or 'month' not in data or 'expenses' not in data:
+    if not data or 'year' not in data or 'month' not in data or \
+            ('expenses' not in data and 'changes' not in data):
         return jsonify({'error': 'Invalid data format'}), 400
 
-    year = data['year']
-    month = data['month']
-    expenses_data = data['expenses']
+    period = _parse_year_month(data)
+    if period is None:
+        return jsonify({'error': 'Invalid year or month'}), 400
+    year, month = period
+
+    partial = 'changes' in data
+    expenses_data = data['changes'] if partial else data['expenses']
     company_id = current_user.company_id
 
     # Get accessible unit IDs for validation
     accessible_unit_ids = set(current_user.get_accessible_unit_ids())
 
-    # Process each unit's expense data
+    # Parse every amount before saving anything
+    amounts_by_unit = {}
     for unit_id, expense in expenses_data.items():
         # Convert unit_id to integer (it might be a string in JSON)
         unit_id = int(unit_id)
@@ -125,59 +143,22 @@ def save_expenses():
         if unit_id not in accessible_unit_ids:
             continue  # Skip if user doesn't have access to this unit
 
-        # Check if unit belongs to the company (additional security check)
-        unit = Unit.query.filter_by(id=unit_id, company_id=company_id).first()
-        if not unit:
-            continue  # Skip if unit doesn't belong to the company
-
-        # Check if expense record already exists
-        existing_expense = ExpenseData.query.filter_by(
-            company_id=company_id,
-            unit_id=unit_id,
-            year=year,
-            month=month
-        ).first()
-
-        if existing_expense:
-            # Update existing record
-            existing_expense.sales = expense.get('sales', '')
-            existing_expense.rental = expense.get('rental', '')
-            existing_expense.electricity = expense.get('electricity', '')
-            existing_expense.water = expense.get('water', '')
-            existing_expense.sewage = expense.get('sewage', '')
-            existing_expense.internet = expense.get('internet', '')
-            existing_expense.cleaner = expense.get('cleaner', '')
-            existing_expense.laundry = expense.get('laundry', '')
-            existing_expense.supplies = expense.get('supplies', '')
-            existing_expense.repair = expense.get('repair', '')
-            existing_expense.replace = expense.get('replace', '')
-            existing_expense.other = expense.get('other', '')
-        else:
-            # Create new record
-            new_expense = ExpenseData(
-                company_id=company_id,
-                unit_id=unit_id,
-                year=year,
-                month=month,
-                sales=expense.get('sales', ''),
-                rental=expense.get('rental', ''),
-                electricity=expense.get('electricity', ''),
-                water=expense.get('water', ''),
-                sewage=expense.get('sewage', ''),
-                internet=expense.get('internet', ''),
-                cleaner=expense.get('cleaner', ''),
-                laundry=expense.get('laundry', ''),
-                supplies=expense.get('supplies', ''),
-                repair=expense.get('repair', ''),
-                replace=expense.get('replace', ''),
-                other=expense.get('other', '')
-            )
-            db.session.add(new_expense)
+        fields = [field for field in EXPENSE_FIELDS if field in expense] if partial else EXPENSE_FIELDS
+        try:
+            amounts_by_unit[unit_id] = {field: parse_amount(expense.get(field)) for field in fields}
+        except ValueError as e:
+            return jsonify({'error': f'{e} (unit {unit_id})'}), 400
+
+    # Skip units that don't belong to the company (additional security check)
+    owned = owned_unit_ids(company_id, list(amounts_by_unit))
+    saved = upsert_expenses(company_id, year, month, {
+        unit_id: amounts for unit_id, amounts in amounts_by_unit.items() if unit_id in owned and amounts
+    })
 
     # Commit all changes
     db.session.commit()
 
-    return jsonify({'success': True, 'message': 'Expenses data saved successfully'})
+    return jsonify({'success': True, 'message': 'Expenses data saved successfully', 'saved': saved})
 
 
 # Replace the existing get_monthly_revenue() function with this updated version:
@@ -207,46 +188,8 @@ def get_monthly_revenue():
     else:
         end_date = datetime(year, month + 1, 1).date()
 
-    # Query bookings for the month, filtered by accessible units
-    bookings = BookingForm.query.filter(
-        BookingForm.company_id == company_id,
-        BookingForm.unit_id.in_(accessible_unit_ids),
-        (
-            # Check-in during the month
-                (BookingForm.check_in_date >= start_date) & (BookingForm.check_in_date < end_date) |
-                # Check-out during the month
-                (BookingForm.check_out_date > start_date) & (BookingForm.check_out_date <= end_date) |
-                # Spanning the entire month
-                (BookingForm.check_in_date <= start_date) & (BookingForm.check_out_date >= end_date)
-        )
-    ).all()
-
-    # Calculate revenue per accessible unit
-    revenues = {}
-    for booking in bookings:
-        unit_id = booking.unit_id
-        if unit_id not in revenues:
-            revenues[unit_id] = 0
-
-        # Calculate the portion of booking revenue to attribute to this month
-        total_nights = (booking.check_out_date - booking.check_in_date).days
-        if total_nights <= 0:
-            continue
-
-        # Determine the nights that fall within the selected month
-        night_start = max(booking.check_in_date, start_date)
-        night_end = min(booking.check_out_date, end_date)
-        nights_in_month = (night_end - night_start).days
-
-        # Calculate prorated revenue for the month
-        if total_nights > 0 and booking.price:
-            try:
-                daily_rate = float(booking.price) / total_nights
-                month_revenue = daily_rate * nights_in_month
-                revenues[unit_id] += month_revenue
-            except (ValueError, TypeError):
-                # Handle any conversion errors
-                pass
+    # Booking revenue earned on the nights within the month, per accessible unit
+    revenues = recognize_revenue(company_id, accessible_unit_ids, start_date, end_date).by_unit()
 
     return jsonify({'revenues': revenues})
 
@@ -344,62 +287,12 @@ def get_yearly_expenses():
     # Format unit data for the response
     units_data = [{'id': unit.id, 'unit_number': unit.unit_number, 'building': unit.building} for unit in units]
 
-    # Get expense data for all months in the specified year, filtered by accessible units
-    yearly_expenses = {}
-    accessible_unit_ids = [unit.id for unit in units]
-
-    # For each accessible unit
-    for unit in units:
-        unit_id = unit.id
-        yearly_expenses[unit_id] = {}
-
-        # For each month
-        for month in range(1, 13):
-            # Check if we have data for this month
-            expense_data = ExpenseData.query.filter_by(
-                company_id=company_id,
-                unit_id=unit_id,
-                year=year,
-                month=month
-            ).first()
-
-            if expense_data:
-                # If we have data, format it
-                yearly_expenses[unit_id][month] = {
-                    'sales': float(expense_data.sales or 0),
-                    'rental': float(expense_data.rental or 0),
-                    'electricity': float(expense_data.electricity or 0),
-                    'water': float(expense_data.water or 0),
-                    'sewage': float(expense_data.sewage or 0),
-                    'internet': float(expense_data.internet or 0),
-                    'cleaner': float(expense_data.cleaner or 0),
-                    'laundry': float(expense_data.laundry or 0),
-                    'supplies': float(expense_data.supplies or 0),
-                    'repair': float(expense_data.repair or 0),
-                    'replace': float(expense_data.replace or 0),
-                    'other': float(expense_data.other or 0)
-                }
-            else:
-                # If we don't have data, use empty values
-                yearly_expenses[unit_id][month] = {
-                    'sales': 0,
-                    'rental': 0,
-                    'electricity': 0,
-                    'water': 0,
-                    'sewage': 0,
-                    'internet': 0,
-                    'cleaner': 0,
-                    'laundry': 0,
-                    'supplies': 0,
-                    'repair': 0,
-                    'replace': 0,
-                    'other': 0
-                }
+    # Columnar: one entry per unit/month that has data, one float array per field
+    matrix = yearly_expense_matrix(company_id, [unit.id for unit in units], year)
 
-    return jsonify({
-        'units': units_data,
-        'expenses': yearly_expenses
-    })
+    response = matrix.to_dict()
+    response['units'] = units_data
+    return jsonify(response)
 
 
 # Replace the existing get_expense_years() function with this updated version:
@@ -487,65 +380,36 @@ def get_expense_remarks():
 @expenses_bp.route('/api/expenses/remarks', methods=['POST'])
 @login_required
 def save_expense_remarks():
+    """Save the given cell remarks; a null remark deletes it"""
     # Get data from request
     data = request.json
 
     if not data or 'year' not in data or 'month' not in data or 'remarks' not in data:
         return jsonify({'error': 'Invalid data format'}), 400
 
-    year = data['year']
-    month = data['month']
+    period = _parse_year_month(data)
+    if period is None:
+        return jsonify({'error': 'Invalid year or month'}), 400
+    year, month = period
+
     remarks_data = data['remarks']
     company_id = current_user.company_id
 
     # Get accessible unit IDs for validation
     accessible_unit_ids = set(current_user.get_accessible_unit_ids())
 
-    # Process each unit's remarks
-    for unit_id, columns in remarks_data.items():
-        # Convert unit_id to integer (it might be a string in JSON)
-        unit_id = int(unit_id)
-
-        # Check if user can access this unit
-        if unit_id not in accessible_unit_ids:
-            continue  # Skip if user doesn't have access to this unit
-
-        # Check if unit belongs to the company (additional security check)
-        unit = Unit.query.filter_by(id=unit_id, company_id=company_id).first()
-        if not unit:
-            continue  # Skip if unit doesn't belong to the company
-
-        # Process each column's remark
-        for column_name, remark_text in columns.items():
-            # Look for existing remark
-            existing_remark = ExpenseRemark.query.filter_by(
-                company_id=company_id,
-                unit_id=unit_id,
-                year=year,
-                month=month,
-                column_name=column_name
-            ).first()
-
-            if existing_remark:
-                # Update existing remark
-                existing_remark.remark = remark_text
-                existing_remark.updated_at = datetime.utcnow()
-            else:
-                # Create new remark
-                new_remark = ExpenseRemark(
-                    company_id=company_id,
-                    unit_id=unit_id,
-                    year=year,
-                    month=month,
-                    column_name=column_name,
-                    remark=remark_text
-                )
-                db.session.add(new_remark)
+    # Keep units the user can access and the company owns (checked in one query)
+    requested = {int(unit_id): columns for unit_id, columns in remarks_data.items()}
+    owned = owned_unit_ids(company_id, [unit_id for unit_id in requested if unit_id in accessible_unit_ids])
 
     # Commit changes
     try:
+        saved, deleted = upsert_expense_remarks(company_id, year, month, {
+            unit_id: columns for unit_id, columns in requested.items() if unit_id in owned
+        })
         db.session.commit()
-        return jsonify({'success': True, 'message': 'Remarks saved successfully'})
+        return jsonify({'success': True, 'message': 'Remarks saved successfully',
+                        'saved': saved, 'deleted': deleted})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
@@ -1,6 +1,6 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
-from models import db, Unit, BookingForm, Holiday, HolidayType
+from models import db, Unit, Holiday
 from datetime import datetime, timedelta, date
 import calendar
 from functools import wraps
@@ -9,6 +9,15 @@ from utils.access_control import (
     get_accessible_units_query,
     get_accessible_bookings_query
 )
+from utils.holidays import (
+    HOLIDAY_TYPES,
+    holiday_type_key,
+    holiday_types,
+    holiday_year_span,
+    holidays_by_day,
+    resolve_holidays
+)
+from utils.occupancy import MAX_OCCUPANCY_RANGE_DAYS, compute_occupancy
 
 occupancy_bp = Blueprint('occupancy', __name__)
 
@@ -91,111 +100,18 @@ def get_occupancy_data(year, month):
     else:
         last_day = date(year, month + 1, 1) - timedelta(days=1)
 
-    # Get bookings that overlap with this month for accessible units only
-    bookings = BookingForm.query.filter(
-        BookingForm.company_id == current_user.company_id,
-        BookingForm.unit_id.in_(accessible_unit_ids),
-        BookingForm.check_in_date <= last_day,
-        BookingForm.check_out_date >= first_day
-    ).all()
-
-    # Calculate occupancy for each day of the month
-    calendar_days = calendar.monthcalendar(year, month)
-    days_in_month = len([day for week in calendar_days for day in week if day != 0])
-
-    # Initialize occupancy data
-    occupancy_data = {day: 0 for day in range(1, days_in_month + 1)}
-
-    # Count occupied units for each day
-    for booking in bookings:
-        start_date = max(booking.check_in_date, first_day)
-        end_date = min(booking.check_out_date, last_day)
-
-        current_date = start_date
-        while current_date < end_date:  # Don't count checkout day
-            if current_date.month == month and current_date.year == year:
-                occupancy_data[current_date.day] += 1
-            current_date += timedelta(days=1)
+    # Occupied units per night of the month, cancelled bookings excluded
+    report = compute_occupancy(first_day, last_day + timedelta(days=1))
+    occupancy_data = {day.day: occupied for day, occupied in zip(report.days, report.occupied_units)}
 
     # Get total accessible units
     total_units = len(accessible_unit_ids)
 
-    # Get holidays for this month (existing holiday logic remains the same)
-    holiday_data = {}
-
-    # First get public and school holidays from the system
-    holiday_types = HolidayType.query.filter(
-        HolidayType.name.in_(["Malaysia Public Holiday", "Malaysia School Holiday", "Custom Holiday"])
-    ).all()
-
-    for holiday_type in holiday_types:
-        # Get deleted holiday dates for this company
-        deleted_holidays = Holiday.query.filter(
-            Holiday.holiday_type_id == holiday_type.id,
-            Holiday.company_id == current_user.company_id,
-            Holiday.is_deleted == True,
-            Holiday.date.between(first_day, last_day)
-        ).all()
-        deleted_dates = {h.date for h in deleted_holidays}
-
-        # Get company-specific additions
-        company_holidays = Holiday.query.filter(
-            Holiday.holiday_type_id == holiday_type.id,
-            Holiday.company_id == current_user.company_id,
-            Holiday.is_deleted == False,
-            Holiday.date.between(first_day, last_day)
-        ).all()
-
-        # Add company-specific holidays
-        for holiday in company_holidays:
-            day = holiday.date.day
-            if day not in holiday_data:
-                holiday_data[day] = []
-
-            # Determine holiday type for display
-            if "Public" in holiday_type.name:
-                type_class = "public"
-            elif "School" in holiday_type.name:
-                type_class = "school"
-            else:
-                type_class = "custom"
-
-            holiday_data[day].append({
-                "name": holiday.name,
-                "type": type_class,
-                "color": holiday_type.color
-            })
-
-        # If it's a system holiday type, add system holidays that aren't deleted by this company
-        if holiday_type.name != "Custom Holiday":
-            system_holidays = Holiday.query.filter(
-                Holiday.holiday_type_id == holiday_type.id,
-                Holiday.company_id == None,
-                Holiday.date.between(first_day, last_day)
-            ).all()
-
-            for holiday in system_holidays:
-                # Skip if this date is marked as deleted for this company
-                if holiday.date in deleted_dates:
-                    continue
-
-                day = holiday.date.day
-                if day not in holiday_data:
-                    holiday_data[day] = []
-
-                # Determine holiday type for display
-                if "Public" in holiday_type.name:
-                    type_class = "public"
-                elif "School" in holiday_type.name:
-                    type_class = "school"
-                else:
-                    type_class = "custom"
-
-                holiday_data[day].append({
-                    "name": holiday.name,
-                    "type": type_class,
-                    "color": holiday_type.color
-                })
+    # System holidays, company overrides and deletion markers, merged and cached per year
+    holiday_data = {
+        day.day: holidays
+        for day, holidays in holidays_by_day(current_user.company_id, first_day, last_day).items()
+    }
 
     return jsonify({
         "occupancy": occupancy_data,
@@ -204,6 +120,24 @@ def get_occupancy_data(year, month):
     })
 
 
+@occupancy_bp.route('/api/occupancy')
+@login_required
+def get_occupancy_range():
+    """Occupancy, per-unit rates and ADR for the nights in [start, end), e.g. a whole year"""
+    try:
+        start = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d').date()
+        end = datetime.strptime(request.args.get('end', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'start and end must be dates in YYYY-MM-DD format'}), 400
+
+    if end <= start:
+        return jsonify({'error': 'end must be after start'}), 400
+    if (end - start).days > MAX_OCCUPANCY_RANGE_DAYS:
+        return jsonify({'error': f'Date range cannot exceed {MAX_OCCUPANCY_RANGE_DAYS} days'}), 400
+
+    return jsonify(compute_occupancy(start, end).to_dict())
+
+
 @occupancy_bp.route('/add_custom_holiday', methods=['GET', 'POST'])
 @login_required
 def add_custom_holiday():
@@ -213,11 +147,7 @@ def add_custom_holiday():
         is_recurring = 'is_recurring' in request.form
 
         # Get the Custom Holiday type (or create it if it doesn't exist)
-        custom_type = HolidayType.query.filter_by(name="Custom Holiday").first()
-        if not custom_type:
-            custom_type = HolidayType(name="Custom Holiday", color="#9C27B0", is_system=True)
-            db.session.add(custom_type)
-            db.session.commit()
+        custom_type = holiday_types.get('custom')
 
         # Create the holiday
         holiday = Holiday(
@@ -250,76 +180,12 @@ def manage_holidays():
     if holiday_type not in ['public', 'school', 'custom']:
         holiday_type = 'public'
 
-    # Get appropriate holiday type ID
-    if holiday_type == 'public':
-        type_name = "Malaysia Public Holiday"
-    elif holiday_type == 'school':
-        type_name = "Malaysia School Holiday"
-    else:
-        type_name = "Custom Holiday"
-
-    # Get the holiday type object
-    holiday_type_obj = HolidayType.query.filter_by(name=type_name).first()
-
-    if not holiday_type_obj:
-        # Create the holiday type if it doesn't exist
-        if holiday_type == 'public':
-            color = "#4CAF50"  # Green
-        elif holiday_type == 'school':
-            color = "#2196F3"  # Blue
-        else:
-            color = "#9C27B0"  # Purple
-
-        holiday_type_obj = HolidayType(name=type_name, color=color, is_system=True)
-        db.session.add(holiday_type_obj)
-        db.session.commit()
-
-    # This is key: We need to get BOTH system holidays AND company-specific overrides
+    # System holidays merged with this company's additions and deletion markers
     holidays = []
-
-    if holiday_type == 'custom':
-        # Custom days are always company-specific
-        holidays = Holiday.query.filter_by(
-            holiday_type_id=holiday_type_obj.id,
-            company_id=current_user.company_id,
-            is_deleted=False  # Filter out deleted holidays
-        ).order_by(Holiday.date).all()
-    else:
-        # For public and school holidays, merge both lists
-        company_holidays = Holiday.query.filter_by(
-            holiday_type_id=holiday_type_obj.id,
-            company_id=current_user.company_id,
-            is_deleted=False  # Filter out deleted holidays
-        ).order_by(Holiday.date).all()
-
-        # Add the company-specific holidays first
-        holidays.extend(company_holidays)
-
-        # Create a set of dates for quick lookup
-        company_dates = {holiday.date for holiday in company_holidays}
-
-        # Check for deleted dates
-        deleted_dates = set()
-        deleted_holidays = Holiday.query.filter_by(
-            holiday_type_id=holiday_type_obj.id,
-            company_id=current_user.company_id,
-            is_deleted=True  # Find all deleted holidays
-        ).all()
-        for holiday in deleted_holidays:
-            deleted_dates.add(holiday.date)
-
-        # Only add system-wide holidays that aren't already added or deleted
-        system_holidays = Holiday.query.filter_by(
-            holiday_type_id=holiday_type_obj.id,
-            company_id=None
-        ).order_by(Holiday.date).all()
-
-        for holiday in system_holidays:
-            if holiday.date not in company_dates and holiday.date not in deleted_dates:
-                holidays.append(holiday)
-
-        # Sort all holidays by date
-        holidays.sort(key=lambda x: x.date)
+    span = holiday_year_span(current_user.company_id, holiday_type)
+    if span:
+        holidays = resolve_holidays(current_user.company_id, date(span[0], 1, 1), date(span[1], 12, 31),
+                                    type_key=holiday_type)
 
     return render_template('manage_holidays.html',
                            holiday_type=holiday_type,
@@ -338,27 +204,11 @@ def add_holiday():
         # Convert date string to date object
         holiday_date = datetime.strptime(date_str, '%Y-%m-%d').date()
 
-        # Determine the holiday type ID
-        if holiday_type == 'public':
-            type_name = "Malaysia Public Holiday"
-        elif holiday_type == 'school':
-            type_name = "Malaysia School Holiday"
-        else:
-            type_name = "Custom Holiday"
+        if holiday_type not in HOLIDAY_TYPES:
+            holiday_type = 'custom'
 
         # Get or create the holiday type
-        holiday_type_obj = HolidayType.query.filter_by(name=type_name).first()
-        if not holiday_type_obj:
-            if holiday_type == 'public':
-                color = "#4CAF50"  # Green
-            elif holiday_type == 'school':
-                color = "#2196F3"  # Blue
-            else:
-                color = "#9C27B0"  # Purple
-
-            holiday_type_obj = HolidayType(name=type_name, color=color, is_system=True)
-            db.session.add(holiday_type_obj)
-            db.session.commit()
+        holiday_type_obj = holiday_types.get(holiday_type)
 
         # Always create company-specific holidays
         company_id = current_user.company_id
@@ -404,20 +254,23 @@ def delete_holiday(id):
     holiday = Holiday.query.get_or_404(id)
 
     # Determine the holiday type for redirect
-    holiday_type_name = holiday.holiday_type.name
-    if "Public" in holiday_type_name:
-        redirect_type = 'public'
-    elif "School" in holiday_type_name:
-        redirect_type = 'school'
-    else:
-        redirect_type = 'custom'
+    redirect_type = holiday_type_key(holiday.holiday_type.name)
 
     # Special handling for system-wide holidays
     if holiday.company_id is None:
         # This is a system-wide holiday, so create a "deleted" marker for this company
+        # A recurring holiday is only removed for the occurrence that was clicked
+        marker_date = holiday.date
+        if holiday.is_recurring and request.form.get('date'):
+            try:
+                marker_date = datetime.strptime(request.form['date'], '%Y-%m-%d').date()
+            except ValueError:
+                flash('Invalid holiday date', 'danger')
+                return redirect(url_for('occupancy.manage_holidays', type=redirect_type))
+
         deleted_marker = Holiday(
             name=holiday.name,  # No DELETED_ prefix
-            date=holiday.date,
+            date=marker_date,
             holiday_type_id=holiday.holiday_type_id,
             company_id=current_user.company_id,
             is_recurring=False,
@@ -432,7 +285,7 @@ def delete_holiday(id):
             flash('You do not have permission to delete this holiday', 'danger')
             return redirect(url_for('occupancy.manage_holidays', type=redirect_type))
 
-        # Delete the holiday
+        # Delete the holiday (every occurrence, if it is recurring)
         db.session.delete(holiday)
         success_message = "Holiday deleted successfully"
 
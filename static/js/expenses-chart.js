@@ -497,35 +497,17 @@ function processExpensesData(apiData, unitId) {
         processedData.monthlyData[month]['net_earn'] = 0;
     }
 
-    // Filter for selected unit if not "all"
-    let unitsToProcess = processedData.units;
-    if (unitId !== 'all') {
-        unitsToProcess = processedData.units.filter(unit => unit.id == unitId);
-    }
-
-    // Process each unit's expense data
-    unitsToProcess.forEach(unit => {
-        const unitId = unit.id;
-        const unitExpenses = apiData.expenses[unitId] || {};
-
-        // For each month
-        for (let month = 1; month <= 12; month++) {
-            const monthData = unitExpenses[month] || {};
-
-            // Sum up each field across units
-            processedData.fields.forEach(field => {
-                const value = parseFloat(monthData[field] || 0);
-                processedData.monthlyData[month][field] += value;
-            });
+    // Sum each field across the selected unit(s); months without a row stay 0
+    forEachYearlyExpenseRow(apiData, (rowUnitId, month, row) => {
+        if (unitId !== 'all' && rowUnitId != unitId) return;
 
-            // Calculate net earn (sales minus all expenses)
-            const sales = parseFloat(monthData.sales || 0);
-            const expenses = processedData.fields
-                .filter(field => field !== 'sales')
-                .reduce((sum, field) => sum + parseFloat(monthData[field] || 0), 0);
+        const monthData = processedData.monthlyData[month];
+        processedData.fields.forEach(field => {
+            monthData[field] += apiData.columns[field][row];
+        });
 
-            processedData.monthlyData[month]['net_earn'] += (sales - expenses);
-        }
+        // Net earn is sales minus all expenses
+        monthData['net_earn'] += apiData.columns.sales[row] - yearlyExpenseRowCosts(apiData, row);
     });
 
     return processedData;
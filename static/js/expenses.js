@@ -96,6 +96,8 @@ class ExpensesManager {
                 // Store data
                 this.currentUnits = data.units || [];
                 this.currentExpenses = data.expenses || {};
+                // What the server has, so saving only sends the cells edited since
+                this.savedExpenses = JSON.parse(JSON.stringify(this.currentExpenses));
 
                 // Add any _formula fields from your server response if available
                 for (const unitId in this.currentExpenses) {
@@ -126,6 +128,7 @@ class ExpensesManager {
                     .then(units => {
                         this.currentUnits = units;
                         this.currentExpenses = {};
+                        this.savedExpenses = {};
 
                         // Render empty table
                         this.renderExpensesTable();
@@ -401,30 +404,50 @@ class ExpensesManager {
     }
 
     /**
-     * Save expenses data to the server
+     * Cells that differ from what the server has, as {unitId: {field: value}}
      */
-    saveExpensesData() {
-        this.showLoading(true);
+    collectExpenseChanges() {
+        const changes = {};
+        const saved = this.savedExpenses || {};
+
+        for (const unitId in this.currentExpenses) {
+            const savedUnit = saved[unitId] || {};
+            for (const field in this.currentExpenses[unitId]) {
+                // Formulas are only kept in the browser
+                if (field.endsWith('_formula')) continue;
+
+                const value = this.currentExpenses[unitId][field];
+                if (String(value ?? '') !== String(savedUnit[field] ?? '')) {
+                    changes[unitId] = changes[unitId] || {};
+                    changes[unitId][field] = value;
+                }
+            }
+        }
+        return changes;
+    }
 
+    /**
+     * Save the edited expense cells to the server
+     */
+    saveExpensesData() {
         // Get selected month-year
         const [year, month] = this.monthFilter.value.split('-');
 
-        // Prepare data for saving
+        const changes = this.collectExpenseChanges();
+        if (Object.keys(changes).length === 0) {
+            this.showSaveMessage('No changes to save');
+            return;
+        }
+
+        this.showLoading(true);
+
+        // Only the changed cells are sent; the rest of each row is left as it is
         const data = {
             year: year,
             month: month,
-            expenses: {}
+            changes: changes
         };
-
-        // Create a deep copy of the expenses object
-        for (const unitId in this.currentExpenses) {
-            data.expenses[unitId] = {};
-
-            // Copy each expense field, including formula fields
-            for (const field in this.currentExpenses[unitId]) {
-                data.expenses[unitId][field] = this.currentExpenses[unitId][field];
-            }
-        }
+        const snapshot = JSON.parse(JSON.stringify(this.currentExpenses));
 
         // Make API request to save data
         fetch('/api/expenses', {
@@ -441,6 +464,7 @@ class ExpensesManager {
             return response.json();
         })
         .then(result => {
+            this.savedExpenses = snapshot;
             this.showLoading(false);
             this.showSaveMessage('Data saved successfully');
         })
@@ -1971,6 +1995,25 @@ function updateYoYComparison() {
         });
 }
 
+/**
+ * Call fn(unitId, month, row) for every row of the columnar /api/expenses/yearly
+ * response. Only unit/months with data have a row; read an amount with
+ * data.columns[field][row].
+ */
+function forEachYearlyExpenseRow(data, fn) {
+    const rows = data.rows || { unit_id: [], month: [] };
+    for (let row = 0; row < rows.unit_id.length; row++) {
+        fn(rows.unit_id[row], rows.month[row], row);
+    }
+}
+
+// Total of the cost columns (every field except sales) of one yearly expense row
+function yearlyExpenseRowCosts(data, row) {
+    return data.fields
+        .filter(field => field !== 'sales')
+        .reduce((sum, field) => sum + data.columns[field][row], 0);
+}
+
 // Fetch monthly data for a specific year
 function fetchMonthlyDataForYear(year, unitId) {
     return new Promise((resolve, reject) => {
@@ -1984,12 +2027,6 @@ function fetchMonthlyDataForYear(year, unitId) {
                     profit: {}
                 };
 
-                // Filter units if specific unit is selected
-                let unitsToProcess = data.units;
-                if (unitId !== 'all') {
-                    unitsToProcess = data.units.filter(unit => unit.id == unitId);
-                }
-
                 // Initialize data structures for each month
                 for (let month = 1; month <= 12; month++) {
                     processedData.revenue[month] = 0;
@@ -1997,38 +2034,16 @@ function fetchMonthlyDataForYear(year, unitId) {
                     processedData.profit[month] = 0;
                 }
 
-                // Process each unit's data
-                unitsToProcess.forEach(unit => {
-                    const unitId = unit.id;
-                    const unitExpenses = data.expenses[unitId] || {};
-
-                    // For each month
-                    for (let month = 1; month <= 12; month++) {
-                        const monthData = unitExpenses[month] || {};
-
-                        // Revenue (sales)
-                        const revenue = parseFloat(monthData.sales || 0);
-                        processedData.revenue[month] += revenue;
-
-                        // Calculate total expenses for this unit/month
-                        const expenses =
-                            parseFloat(monthData.rental || 0) +
-                            parseFloat(monthData.electricity || 0) +
-                            parseFloat(monthData.water || 0) +
-                            parseFloat(monthData.sewage || 0) +
-                            parseFloat(monthData.internet || 0) +
-                            parseFloat(monthData.cleaner || 0) +
-                            parseFloat(monthData.laundry || 0) +
-                            parseFloat(monthData.supplies || 0) +
-                            parseFloat(monthData.repair || 0) +
-                            parseFloat(monthData.replace || 0) +
-                            parseFloat(monthData.other || 0);
-
-                        processedData.expenses[month] += expenses;
-
-                        // Calculate profit
-                        processedData.profit[month] += (revenue - expenses);
-                    }
+                // Sum the rows of the selected unit(s); months without a row stay 0
+                forEachYearlyExpenseRow(data, (rowUnitId, month, row) => {
+                    if (unitId !== 'all' && rowUnitId != unitId) return;
+
+                    const revenue = data.columns.sales[row];
+                    const expenses = yearlyExpenseRowCosts(data, row);
+
+                    processedData.revenue[month] += revenue;
+                    processedData.expenses[month] += expenses;
+                    processedData.profit[month] += (revenue - expenses);
                 });
 
                 resolve(processedData);
@@ -3262,12 +3277,29 @@ ExpensesManager.prototype.saveRemarks = function() {
     // Get selected month-year
     const [year, month] = this.monthFilter.value.split('-');
 
+    // Send only added, edited (text) and removed (null) remarks
+    const remarks = {};
+    const saved = this.savedRemarks || {};
+    const unitIds = new Set([...Object.keys(this.currentRemarks), ...Object.keys(saved)]);
+    unitIds.forEach(unitId => {
+        const current = this.currentRemarks[unitId] || {};
+        const previous = saved[unitId] || {};
+        new Set([...Object.keys(current), ...Object.keys(previous)]).forEach(column => {
+            if (current[column] !== previous[column]) {
+                remarks[unitId] = remarks[unitId] || {};
+                remarks[unitId][column] = column in current ? current[column] : null;
+            }
+        });
+    });
+    if (Object.keys(remarks).length === 0) return;
+
     // Prepare data for saving
     const data = {
         year: year,
         month: month,
-        remarks: this.currentRemarks
+        remarks: remarks
     };
+    const snapshot = JSON.parse(JSON.stringify(this.currentRemarks));
 
     // Make API request to save data
     fetch('/api/expenses/remarks', {
@@ -3284,6 +3316,7 @@ ExpensesManager.prototype.saveRemarks = function() {
         return response.json();
     })
     .then(result => {
+        this.savedRemarks = snapshot;
         console.log('Remarks saved successfully');
     })
     .catch(error => {
@@ -3334,8 +3367,9 @@ ExpensesManager.prototype.loadRemarks = function() {
             return response.json();
         })
         .then(data => {
-            // Store the remarks
+            // Store the remarks, and what the server has for saveRemarks()
             this.currentRemarks = data.remarks || {};
+            this.savedRemarks = JSON.parse(JSON.stringify(this.currentRemarks));
 
             // Apply remark indicators to cells
             this.applyRemarkIndicators();
@@ -3344,6 +3378,7 @@ ExpensesManager.prototype.loadRemarks = function() {
             console.error('Error loading remarks:', error);
             // Reset remarks to empty object
             this.currentRemarks = {};
+            this.savedRemarks = {};
         });
 };
 
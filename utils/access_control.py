@@ -2,85 +2,467 @@
 Access control utilities for filtering data based on user permissions
 """
 
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, has_app_context
 from flask_login import current_user
-from models import Unit, BookingForm, Issue, ExpenseData, Complaint, Repair, Replacement
-from sqlalchemy import and_
+from models import (db, User, Unit, BookingForm, Issue, ExpenseData, Complaint, Repair, Replacement,
+                    Role, CustomUserPermission, cleaner_units, staff_units)
+from sqlalchemy import and_, event, inspect, select
+from sqlalchemy.orm import Session
+
+
+# Process-wide access cache settings
+ACCESS_CACHE_MAX_ENTRIES = 1024
+ACCESS_CACHE_TTL_SECONDS = 300
+
+# How filter_query_by_accessible_units() restricts rows to accessible units:
+# 'subquery' keeps the restriction in SQL (company predicate for Admins/Managers,
+# a staff_units/cleaner_units subquery for Staff/Cleaners), 'in_list' binds every
+# accessible unit ID as an IN (...) list. Override with the ACCESS_FILTER_MODE config key.
+FILTER_MODE_SUBQUERY = 'subquery'
+FILTER_MODE_IN_LIST = 'in_list'
+DEFAULT_FILTER_MODE = FILTER_MODE_SUBQUERY
+
+
+# Permission columns that can be resolved through has_permission()
+PERMISSION_NAMES = tuple(sorted(
+    {column.name for column in Role.__table__.columns if column.name.startswith('can_')} |
+    {column.name for column in CustomUserPermission.__table__.columns if column.name.startswith('can_')}
+))
+
+
+class AccessContext:
+    """
+    Snapshot of everything needed to answer access questions for one user:
+    role name, accessible unit IDs and the effective permission map.
+
+    Built once per request (see get_access_context) so that repeated calls to
+    get_accessible_unit_ids(), can_access_unit() and has_permission() don't
+    re-run the same unit and permission queries. The unit IDs are only loaded
+    when first asked for, so subquery-mode filtering never reads them.
+    """
+
+    def __init__(self, user_id, company_id, role_name, is_admin, permissions, unit_ids=None):
+        self.user_id = user_id
+        self.company_id = company_id
+        self.role_name = role_name
+        self.is_admin = is_admin
+        self.permissions = permissions
+        self._unit_id_list = None
+        self._unit_ids = None
+        if unit_ids is not None:
+            self._set_unit_ids(unit_ids)
+
+    @classmethod
+    def build(cls, user):
+        """Resolve role and permissions for a user; accessible units are loaded on first use"""
+        role = user.role
+        role_name = role.name
+        is_admin = bool(role.is_admin)
+
+        permissions = cls._resolve_permissions(user, role, role_name, is_admin)
+
+        return cls(user.id, user.company_id, role_name, is_admin, permissions)
+
+    def _set_unit_ids(self, unit_ids):
+        # Keep the query order for callers that expect a list, and a set for lookups
+        self._unit_id_list = tuple(unit_ids)
+        self._unit_ids = frozenset(unit_ids)
+
+    def _load_unit_ids(self):
+        # Admins and Managers see all units in their company, Staff and Cleaners
+        # the units assigned to them, any other role none
+        unit_ids_query = accessible_unit_ids_subquery(self)
+        if unit_ids_query is None:
+            return []
+        return db.session.execute(unit_ids_query).scalars().all()
+
+    @property
+    def unit_id_list(self):
+        if self._unit_id_list is None:
+            self._set_unit_ids(self._load_unit_ids())
+        return self._unit_id_list
+
+    @property
+    def unit_ids(self):
+        if self._unit_ids is None:
+            self._set_unit_ids(self._load_unit_ids())
+        return self._unit_ids
+
+    @staticmethod
+    def _resolve_permissions(user, role, role_name, is_admin):
+        """Build the effective permission map, applying custom overrides for Staff/Cleaner"""
+        if is_admin:
+            # Admin users have all permissions
+            return {name: True for name in PERMISSION_NAMES}
+
+        if role_name in ['Staff', 'Cleaner']:
+            # Staff and Cleaners only get what a manager explicitly granted them
+            custom_perms = CustomUserPermission.query.filter_by(
+                user_id=user.id,
+                company_id=user.company_id
+            ).first()
+
+            permissions = {}
+            for name in PERMISSION_NAMES:
+                custom_value = getattr(custom_perms, name, None) if custom_perms else None
+                permissions[name] = bool(custom_value) if custom_value is not None else False
+            return permissions
+
+        # Managers and any other roles use role defaults
+        return {name: bool(getattr(role, name, False)) for name in PERMISSION_NAMES}
+
+    def has_permission(self, permission):
+        """Check a permission against the resolved map"""
+        if self.is_admin:
+            return True
+        return self.permissions.get(permission, False)
+
+    def can_access_unit(self, unit_id):
+        """Check if a unit ID is in the accessible set"""
+        # Convert unit_id to int to handle form data (strings)
+        try:
+            unit_id = int(unit_id)
+        except (ValueError, TypeError):
+            return False
+        return unit_id in self.unit_ids
+
+
+class AccessCache:
+    """
+    Process-wide LRU cache of AccessContext snapshots keyed by (user_id, company_id)
+
+    Entries expire after a TTL and are invalidated on commit whenever unit
+    assignments, roles, custom permissions or unit ownership change (see the
+    session listeners below). Each worker process keeps its own cache, so the
+    TTL bounds how stale another process' view can get.
+    """
+
+    def __init__(self, max_entries=ACCESS_CACHE_MAX_ENTRIES, ttl=ACCESS_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, context = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return context
+
+    def set(self, key, context):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), context)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_users(self, user_ids):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] in user_ids]:
+                del self._entries[key]
+                self.invalidations += 1
+
+    def invalidate_companies(self, company_ids):
+        with self._lock:
+            for key in [key for key in self._entries if key[1] in company_ids]:
+                del self._entries[key]
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'invalidations': self.invalidations
+            }
+
+
+access_cache = AccessCache()
+
+
+def get_access_cache_stats():
+    """Hit/miss counters for the process-wide access cache"""
+    return access_cache.stats()
+
+
+def get_access_context(user=None):
+    """
+    Get the access context for a user, cached on flask.g for the current request
+    and in the process-wide access cache across requests
+
+    Args:
+        user: User to resolve; defaults to current_user
+
+    Returns:
+        AccessContext, or None if there is no authenticated user
+    """
+    if user is None:
+        if not current_user.is_authenticated:
+            return None
+        user = current_user._get_current_object()
 
+    contexts = g.setdefault('_access_contexts', {}) if has_app_context() else {}
+    context = contexts.get(user.id)
+    if context is not None and context.company_id == user.company_id:
+        return context
 
-def filter_query_by_accessible_units(query, model_class):
+    key = (user.id, user.company_id)
+    context = access_cache.get(key)
+    if context is None:
+        context = AccessContext.build(user)
+        access_cache.set(key, context)
+
+    contexts[user.id] = context
+    return context
+
+
+def clear_access_context():
+    """Drop the per-request access contexts so the next lookup re-reads the database"""
+    if has_app_context():
+        g.pop('_access_contexts', None)
+
+
+# Session listeners that keep the access cache in sync with the database.
+# Changes are collected on flush and only applied once the transaction commits.
+
+_USER_ACCESS_ATTRIBUTES = ('role_id', 'company_id', 'assigned_units', 'assigned_staff_units')
+_UNIT_ACCESS_ATTRIBUTES = ('assigned_cleaners', 'assigned_staff')
+
+
+def _attribute_changed(state, name):
+    try:
+        return state.attrs[name].history.has_changes()
+    except KeyError:
+        return False
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_access_changes(session, flush_context):
+    pending = session.info.setdefault('access_cache_pending', {
+        'clear_all': False, 'user_ids': set(), 'company_ids': set()
+    })
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Role):
+            # Roles are shared between companies, so drop everything
+            pending['clear_all'] = True
+
+        elif isinstance(obj, CustomUserPermission):
+            pending['user_ids'].add(obj.user_id)
+
+        elif isinstance(obj, User):
+            state = inspect(obj)
+            if obj in session.deleted or any(_attribute_changed(state, name) for name in _USER_ACCESS_ATTRIBUTES):
+                pending['user_ids'].add(obj.id)
+
+        elif isinstance(obj, Unit):
+            state = inspect(obj)
+            if obj in session.new or obj in session.deleted:
+                # Managers see every unit of their company
+                pending['company_ids'].add(obj.company_id)
+            else:
+                company_history = state.attrs.company_id.history
+                if company_history.has_changes():
+                    pending['company_ids'].update(
+                        company_id for company_id in
+                        list(company_history.added) + list(company_history.deleted)
+                        if company_id is not None
+                    )
+                if any(_attribute_changed(state, name) for name in _UNIT_ACCESS_ATTRIBUTES):
+                    pending['company_ids'].add(obj.company_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_access_changes(session):
+    pending = session.info.pop('access_cache_pending', None)
+    if not pending:
+        return
+
+    if pending['clear_all']:
+        access_cache.clear()
+    else:
+        if pending['user_ids']:
+            access_cache.invalidate_users(pending['user_ids'])
+        if pending['company_ids']:
+            access_cache.invalidate_companies(pending['company_ids'])
+
+    if pending['clear_all'] or pending['user_ids'] or pending['company_ids']:
+        clear_access_context()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_access_changes(session):
+    session.info.pop('access_cache_pending', None)
+
+
+def accessible_unit_ids_subquery(context):
+    """
+    Build a SELECT of the unit IDs a user can access, to be used inside IN (...)
+
+    Args:
+        context: AccessContext of the user
+
+    Returns:
+        SQLAlchemy Select of unit IDs, or None if the role grants no units
+    """
+    if context.role_name in ['Admin', 'Manager'] or context.is_admin:
+        return select(Unit.id).where(Unit.company_id == context.company_id)
+    elif context.role_name == 'Staff':
+        return select(staff_units.c.unit_id).where(staff_units.c.user_id == context.user_id)
+    elif context.role_name == 'Cleaner':
+        return select(cleaner_units.c.unit_id).where(cleaner_units.c.user_id == context.user_id)
+    return None
+
+
+def _resolve_filter_mode(mode):
+    if mode:
+        return mode
+    if has_app_context():
+        return current_app.config.get('ACCESS_FILTER_MODE', DEFAULT_FILTER_MODE)
+    return DEFAULT_FILTER_MODE
+
+
+def filter_query_by_accessible_units(query, model_class, user=None, mode=None):
     """
     Filter a SQLAlchemy query to only include records for units the current user can access
 
     Args:
         query: SQLAlchemy query object
         model_class: The model class being queried (must have unit_id attribute)
+        user: User to filter for; defaults to current_user
+        mode: FILTER_MODE_SUBQUERY or FILTER_MODE_IN_LIST; defaults to the
+              ACCESS_FILTER_MODE config value
 
     Returns:
         Filtered query object
     """
-    if not current_user.is_authenticated:
+    context = get_access_context(user)
+    if context is None:
         # Return empty query if not authenticated
         return query.filter(model_class.id == -1)
 
-    # Get accessible unit IDs for the current user
-    accessible_unit_ids = current_user.get_accessible_unit_ids()
+    if _resolve_filter_mode(mode) == FILTER_MODE_IN_LIST or not hasattr(model_class, 'unit_id'):
+        if not context.unit_ids:
+            # If no accessible units, return empty query
+            return query.filter(model_class.id == -1)
+
+        if not hasattr(model_class, 'unit_id'):
+            # Fallback to company filter only
+            return query.filter(model_class.company_id == context.company_id)
 
-    if not accessible_unit_ids:
-        # If no accessible units, return empty query
+        # Filter by the materialized list of accessible units and company
+        return query.filter(
+            and_(
+                model_class.company_id == context.company_id,
+                model_class.unit_id.in_(context.unit_id_list)
+            )
+        )
+
+    # From here on the unit IDs are never loaded: an empty assignment simply
+    # makes the subquery match nothing
+    unit_ids_query = accessible_unit_ids_subquery(context)
+    if unit_ids_query is None:
+        # The role grants no units
         return query.filter(model_class.id == -1)
 
-    # Filter by accessible units and company
-    if hasattr(model_class, 'unit_id'):
+    if context.role_name in ['Admin', 'Manager'] or context.is_admin:
+        # Every unit of the company is accessible, so the company predicate is enough
         return query.filter(
             and_(
-                model_class.company_id == current_user.company_id,
-                model_class.unit_id.in_(accessible_unit_ids)
+                model_class.company_id == context.company_id,
+                model_class.unit_id.isnot(None)
             )
         )
-    else:
-        # Fallback to company filter only
-        return query.filter(model_class.company_id == current_user.company_id)
+
+    return query.filter(
+        and_(
+            model_class.company_id == context.company_id,
+            model_class.unit_id.in_(unit_ids_query)
+        )
+    )
 
 
-def get_accessible_units_query():
+def get_accessible_units_query(user=None, mode=None):
     """
     Get a query for units accessible to the current user
 
+    Args:
+        user: User to filter for; defaults to current_user
+        mode: FILTER_MODE_SUBQUERY or FILTER_MODE_IN_LIST
+
     Returns:
         SQLAlchemy query for accessible units
     """
-    if not current_user.is_authenticated:
+    context = get_access_context(user)
+    if context is None:
         return Unit.query.filter(Unit.id == -1)
 
-    accessible_unit_ids = current_user.get_accessible_unit_ids()
+    if _resolve_filter_mode(mode) == FILTER_MODE_IN_LIST:
+        if not context.unit_ids:
+            return Unit.query.filter(Unit.id == -1)
+        return Unit.query.filter(
+            and_(
+                Unit.company_id == context.company_id,
+                Unit.id.in_(context.unit_id_list)
+            )
+        )
 
-    if not accessible_unit_ids:
+    unit_ids_query = accessible_unit_ids_subquery(context)
+    if unit_ids_query is None:
         return Unit.query.filter(Unit.id == -1)
 
+    if context.role_name in ['Admin', 'Manager'] or context.is_admin:
+        return Unit.query.filter(Unit.company_id == context.company_id)
+
     return Unit.query.filter(
         and_(
-            Unit.company_id == current_user.company_id,
-            Unit.id.in_(accessible_unit_ids)
+            Unit.company_id == context.company_id,
+            Unit.id.in_(unit_ids_query)
         )
     )
 
 
-def get_accessible_bookings_query():
+def get_accessible_bookings_query(user=None, mode=None):
     """Get bookings query filtered by accessible units"""
-    base_query = BookingForm.query.filter_by(company_id=current_user.company_id)
-    return filter_query_by_accessible_units(base_query, BookingForm)
+    return filter_query_by_accessible_units(BookingForm.query, BookingForm, user=user, mode=mode)
 
 
-def get_accessible_issues_query():
+def get_accessible_issues_query(user=None, mode=None):
     """Get issues query filtered by accessible units"""
-    base_query = Issue.query.filter_by(company_id=current_user.company_id)
-    return filter_query_by_accessible_units(base_query, Issue)
+    return filter_query_by_accessible_units(Issue.query, Issue, user=user, mode=mode)
 
 
-def get_accessible_expenses_query():
+def get_accessible_expenses_query(user=None, mode=None):
     """Get expenses query filtered by accessible units"""
-    base_query = ExpenseData.query.filter_by(company_id=current_user.company_id)
-    return filter_query_by_accessible_units(base_query, ExpenseData)
+    return filter_query_by_accessible_units(ExpenseData.query, ExpenseData, user=user, mode=mode)
 
 
 def check_unit_access(unit_id):
@@ -93,10 +475,11 @@ def check_unit_access(unit_id):
     Returns:
         Boolean indicating access permission
     """
-    if not current_user.is_authenticated:
+    context = get_access_context()
+    if context is None:
         return False
 
-    return current_user.can_access_unit(unit_id)
+    return context.can_access_unit(unit_id)
 
 
 def require_unit_access(unit_id):
@@ -111,4 +494,4 @@ def require_unit_access(unit_id):
         PermissionError: If user doesn't have access to the unit
     """
     if not check_unit_access(unit_id):
-        raise PermissionError(f"User does not have access to unit {unit_id}")
\ No newline at end of file
+        raise PermissionError(f"User does not have access to unit {unit_id}")
@@ -0,0 +1,255 @@
+"""
+In-memory availability index for booking overlap checks
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+
+from models import db, BookingForm, Unit
+from sqlalchemy import event, inspect, or_
+from sqlalchemy.orm import Session
+
+
+# Units are reloaded from the database after this many seconds, which bounds
+# how stale another worker process' view can get
+AVAILABILITY_INDEX_TTL_SECONDS = 300
+
+# Maximum number of unit IDs bound into one IN (...) when loading the index
+AVAILABILITY_LOAD_CHUNK_SIZE = 500
+
+
+Stay = namedtuple('Stay', ['booking_id', 'check_in_date', 'check_out_date', 'guest_name'])
+
+
+class UnitStays:
+    """
+    Non-cancelled stays of one unit, sorted by check-in date
+
+    max_check_out[i] is the latest check-out among stays[0..i], which lets an
+    overlap query walk back from the last stay starting before the requested
+    check-out and stop as soon as no earlier stay can reach the check-in date.
+    """
+
+    def __init__(self, stays):
+        self.stays = sorted(stays, key=lambda stay: (stay.check_in_date, stay.booking_id))
+        self.check_ins = [stay.check_in_date for stay in self.stays]
+        self.max_check_out = []
+        latest = None
+        for stay in self.stays:
+            latest = stay.check_out_date if latest is None else max(latest, stay.check_out_date)
+            self.max_check_out.append(latest)
+        self.loaded_at = time.monotonic()
+
+    def overlapping(self, check_in_date, check_out_date, exclude_booking_id=None):
+        """
+        Return stays overlapping [check_in_date, check_out_date) in check-in order
+
+        A stay checking out on the requested check-in date doesn't conflict
+        (same-day turnover).
+        """
+        conflicts = []
+        index = bisect_left(self.check_ins, check_out_date) - 1
+        while index >= 0 and self.max_check_out[index] > check_in_date:
+            stay = self.stays[index]
+            if stay.check_out_date > check_in_date and stay.booking_id != exclude_booking_id:
+                conflicts.append(stay)
+            index -= 1
+        conflicts.reverse()
+        return conflicts
+
+
+class AvailabilityIndex:
+    """
+    Process-wide map of unit ID -> UnitStays
+
+    Units are loaded lazily (all missing units in one query) and dropped on
+    commit whenever one of their bookings is inserted, updated, cancelled or
+    deleted (see the session listeners below).
+    """
+
+    def __init__(self, ttl=AVAILABILITY_INDEX_TTL_SECONDS):
+        self.ttl = ttl
+        self._units = {}
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so a load that raced with a commit isn't stored
+        self._generation = 0
+
+    def get_units(self, unit_ids):
+        """Return {unit_id: UnitStays} for the given units, loading any that are missing"""
+        unit_ids = set(unit_ids)
+        now = time.monotonic()
+
+        with self._lock:
+            found = {unit_id: self._units[unit_id] for unit_id in unit_ids
+                     if unit_id in self._units and now - self._units[unit_id].loaded_at <= self.ttl}
+            generation = self._generation
+
+        missing = unit_ids - set(found)
+        if missing:
+            loaded = self._load(missing)
+            with self._lock:
+                if generation == self._generation:
+                    self._units.update(loaded)
+            found.update(loaded)
+
+        return found
+
+    def _load(self, unit_ids):
+        stays_by_unit = {unit_id: [] for unit_id in unit_ids}
+        unit_ids = sorted(unit_ids)
+
+        for start in range(0, len(unit_ids), AVAILABILITY_LOAD_CHUNK_SIZE):
+            chunk = unit_ids[start:start + AVAILABILITY_LOAD_CHUNK_SIZE]
+            rows = db.session.query(
+                BookingForm.unit_id,
+                BookingForm.id,
+                BookingForm.check_in_date,
+                BookingForm.check_out_date,
+                BookingForm.guest_name
+            ).filter(
+                BookingForm.unit_id.in_(chunk),
+                or_(BookingForm.is_cancelled == False, BookingForm.is_cancelled.is_(None))
+            ).all()
+
+            for unit_id, booking_id, check_in_date, check_out_date, guest_name in rows:
+                stays_by_unit[unit_id].append(Stay(booking_id, check_in_date, check_out_date, guest_name))
+
+        return {unit_id: UnitStays(stays) for unit_id, stays in stays_by_unit.items()}
+
+    def conflicts(self, unit_id, check_in_date, check_out_date, exclude_booking_id=None):
+        """Non-cancelled stays of a unit that overlap the given range"""
+        unit_stays = self.get_units([unit_id])[unit_id]
+        return unit_stays.overlapping(check_in_date, check_out_date, exclude_booking_id)
+
+    def free_units(self, unit_ids, check_in_date, check_out_date):
+        """Return the subset of unit_ids with no stay overlapping the range, in the given order"""
+        units = self.get_units(unit_ids)
+        return [unit_id for unit_id in unit_ids
+                if not units[unit_id].overlapping(check_in_date, check_out_date)]
+
+    def invalidate_units(self, unit_ids):
+        with self._lock:
+            self._generation += 1
+            for unit_id in unit_ids:
+                self._units.pop(unit_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._units.clear()
+
+
+availability_index = AvailabilityIndex()
+
+
+# Session listeners that keep the index in sync with the database.
+# Affected units are collected on flush and dropped when the transaction ends. A
+# rollback drops them too, since the index may have been loaded from flushed rows.
+
+def _pending_changes(session):
+    return session.info.setdefault('availability_pending', {'clear_all': False, 'unit_ids': set()})
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_booking_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, BookingForm):
+            continue
+
+        # A booking moved to another unit also frees up its old unit. Form handlers
+        # may assign unit_id as a string, so normalize before using it as a key.
+        unit_history = inspect(obj).attrs.unit_id.history
+        unit_ids = [obj.unit_id] + list(unit_history.deleted)
+        _pending_changes(session)['unit_ids'].update(int(unit_id) for unit_id in unit_ids if unit_id is not None)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_booking_changes(orm_execute_state):
+    # Bulk insert/update/delete statements bypass the flush
+    if orm_execute_state.is_select or orm_execute_state.bind_mapper is None or \
+            orm_execute_state.bind_mapper.class_ is not BookingForm:
+        return
+
+    pending = _pending_changes(orm_execute_state.session)
+    parameters = orm_execute_state.parameters
+    rows = parameters if isinstance(parameters, list) else [parameters or {}]
+
+    if orm_execute_state.is_insert and all('unit_id' in row for row in rows):
+        # Bulk inserts name their units
+        pending['unit_ids'].update(int(row['unit_id']) for row in rows)
+    else:
+        # Query.update()/delete() can touch any unit, so drop the whole index on commit
+        pending['clear_all'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _apply_booking_changes(session):
+    pending = session.info.pop('availability_pending', None)
+    if not pending:
+        return
+
+    if pending['clear_all']:
+        availability_index.clear()
+    elif pending['unit_ids']:
+        availability_index.invalidate_units(pending['unit_ids'])
+
+
+def has_overlapping_booking(unit_id, check_in_date, check_out_date, exclude_booking_id=None, session=None):
+    """
+    Check the database, not the index, for a non-cancelled booking of the unit
+    overlapping [check_in_date, check_out_date)
+
+    Used before writing a booking: the index can lag behind bookings committed
+    by another worker process. A stay checking out on the requested check-in
+    date doesn't conflict (same-day turnover).
+    """
+    session = session or db.session
+    query = session.query(BookingForm.id).filter(
+        BookingForm.unit_id == unit_id,
+        BookingForm.check_in_date < check_out_date,
+        BookingForm.check_out_date > check_in_date,
+        or_(BookingForm.is_cancelled == False, BookingForm.is_cancelled.is_(None))
+    )
+    if exclude_booking_id is not None:
+        query = query.filter(BookingForm.id != exclude_booking_id)
+    return session.query(query.exists()).scalar()
+
+
+def search_available_units(units_query, check_in_date, check_out_date, min_pax=None, building=None):
+    """
+    Find the units of units_query that are free for [check_in_date, check_out_date)
+
+    Capacity and building are filtered in SQL, availability is answered from the
+    index, and the result is ranked by fit: the smallest unit that still holds
+    min_pax guests first, then fewer bedrooms. Units without max_pax or bedrooms
+    sort last.
+
+    Args:
+        units_query: Unit query restricted to the units the caller may see
+        min_pax: Minimum guest capacity, optional
+        building: Exact building name, optional
+
+    Returns:
+        List of (id, unit_number, building, max_pax, bedrooms) rows
+    """
+    if min_pax:
+        units_query = units_query.filter(Unit.max_pax >= min_pax)
+    if building:
+        units_query = units_query.filter(Unit.building == building)
+
+    units = units_query.with_entities(
+        Unit.id, Unit.unit_number, Unit.building, Unit.max_pax, Unit.bedrooms
+    ).all()
+
+    free_unit_ids = set(availability_index.free_units([unit.id for unit in units], check_in_date, check_out_date))
+    available = [unit for unit in units if unit.id in free_unit_ids]
+
+    available.sort(key=lambda unit: (
+        unit.max_pax is None, unit.max_pax or 0,
+        unit.bedrooms is None, unit.bedrooms or 0,
+        unit.unit_number
+    ))
+    return available
@@ -0,0 +1,264 @@
+"""
+Bulk write helpers for bookings imported from calendar feeds and Airbnb CSV exports
+"""
+
+import csv
+import io
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import insert, select, update
+
+from models import db, BookingForm, BookingCalendarSource
+
+
+def insert_bookings(rows):
+    """
+    Insert bookings in a single executemany instead of one add() + flush() each
+
+    Args:
+        rows: List of dicts of BookingForm column values
+
+    Returns:
+        The new booking IDs, in the same order as rows
+    """
+    if not rows:
+        return []
+
+    statement = insert(BookingForm).returning(BookingForm.id, sort_by_parameter_order=True)
+    return list(db.session.scalars(statement, rows))
+
+
+def insert_calendar_mappings(calendar_source_id, booking_ids):
+    """Link bookings to the calendar source that imported them, in one statement"""
+    if not booking_ids:
+        return
+
+    db.session.execute(insert(BookingCalendarSource), [
+        {'booking_id': booking_id, 'calendar_source_id': calendar_source_id}
+        for booking_id in booking_ids
+    ])
+
+
+# Airbnb reservations export column -> import field, as mapped by bookings.html
+AIRBNB_CSV_COLUMNS = {
+    'Confirmation code': 'confirmation_code',
+    'Status': 'payment_status',
+    'Guest name': 'guest_name',
+    'Contact': 'contact_number',
+    '# of adults': 'adults',
+    '# of children': 'children',
+    '# of infants': 'infants',
+    'Start date': 'check_in_date',
+    'End date': 'check_out_date',
+    '# of nights': 'number_of_nights',
+    'Booked': 'booking_date',
+    'Listing': 'unit_number',
+    'Earnings': 'price',
+}
+
+# Candidate formats, in the order the per-row parsers used to try them
+STAY_DATE_FORMATS = ['%Y-%m-%d', '%m/%d/%Y']
+BOOKED_DATE_FORMATS = ['%b %d, %Y', '%B %d, %Y', '%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y']
+
+# Rows per IN query / bulk UPDATE
+IMPORT_BATCH_SIZE = 1000
+
+# Columns compared and updated by import_airbnb_bookings()
+_IMPORT_COLUMNS = [
+    'id', 'confirmation_code', 'booking_date', 'guest_name', 'contact_number',
+    'check_in_date', 'check_out_date', 'number_of_nights', 'price', 'payment_status',
+    'adults', 'children', 'infants', 'number_of_guests'
+]
+
+
+class DateFormatDetector:
+    """
+    Parses a column of dates, locking onto the first format that works so the
+    rest of the file costs one strptime per value instead of one per candidate
+    """
+
+    def __init__(self, formats):
+        self.formats = formats
+        self.format = None
+
+    def parse(self, value):
+        if not value or not str(value).strip():
+            return None
+        value = str(value).strip()
+
+        if self.format:
+            try:
+                return datetime.strptime(value, self.format).date()
+            except ValueError:
+                pass
+
+        for fmt in self.formats:
+            if fmt == self.format:
+                continue
+            try:
+                parsed = datetime.strptime(value, fmt).date()
+            except ValueError:
+                continue
+            if self.format is None:
+                self.format = fmt
+            return parsed
+        return None
+
+
+def _int_value(value):
+    try:
+        return int(value or 0)
+    except (ValueError, TypeError):
+        return 0
+
+
+def _price_value(value):
+    """Price from '1,234.50', 'RM 1,234.50' or a number; None if not a positive number"""
+    if not value:
+        return None
+    try:
+        price = float(str(value).replace('RM', '').replace(',', '').strip())
+    except ValueError:
+        print(f"Failed to convert price: {value}")
+        return None
+    return price if price > 0 else None
+
+
+def iter_airbnb_csv_rows(stream):
+    """
+    Read an Airbnb reservations CSV upload row by row, yielding the same dicts
+    the bookings page used to post as JSON
+
+    Args:
+        stream: Binary file object, e.g. request.files['csv_file'].stream
+    """
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    for row in reader:
+        if not any(value and value.strip() for value in row.values() if isinstance(value, str)):
+            continue
+        booking_data = {field: (row.get(column) or '').strip() for column, field in AIRBNB_CSV_COLUMNS.items()}
+        # Imported Airbnb reservations are paid through the platform
+        booking_data['payment_status'] = 'Paid'
+        yield booking_data
+
+
+@dataclass
+class AirbnbImportResult:
+    processed: int = 0
+    updated: int = 0
+    errors: int = 0
+    updated_booking_ids: List[int] = field(default_factory=list)
+
+
+def _diff_booking(existing, booking_data, stay_dates, booked_dates):
+    """Return the changed columns of one existing booking (as a dict of its values)"""
+    changes = {}
+
+    check_in_date = stay_dates.parse(booking_data.get('check_in_date'))
+    check_out_date = stay_dates.parse(booking_data.get('check_out_date'))
+    if check_in_date and check_out_date and check_in_date < check_out_date and (
+            check_in_date != existing['check_in_date'] or check_out_date != existing['check_out_date']):
+        changes['check_in_date'] = check_in_date
+        changes['check_out_date'] = check_out_date
+        changes['number_of_nights'] = (check_out_date - check_in_date).days
+
+    booking_date = booked_dates.parse(booking_data.get('booking_date'))
+    if booking_date and booking_date != existing['booking_date']:
+        changes['booking_date'] = booking_date
+
+    for column in ['guest_name', 'contact_number', 'payment_status']:
+        value = booking_data.get(column)
+        if value and value != existing[column]:
+            changes[column] = value
+
+    price = _price_value(booking_data.get('price'))
+    if price is not None and abs(float(existing['price'] or 0) - price) > 0.01:
+        changes['price'] = price
+
+    for column in ['adults', 'children', 'infants']:
+        value = _int_value(booking_data.get(column))
+        if value > 0 and value != (existing[column] or 0):
+            changes[column] = value
+
+    total_guests = sum((changes.get(column, existing[column]) or 0)
+                       for column in ['adults', 'children', 'infants'])
+    if total_guests != existing['number_of_guests']:
+        changes['number_of_guests'] = total_guests
+
+    return changes
+
+
+def _apply_import_batch(batch, company_id, stay_dates, booked_dates, result):
+    codes = {booking_data['confirmation_code'] for booking_data in batch}
+    rows = db.session.execute(
+        select(*[getattr(BookingForm, column) for column in _IMPORT_COLUMNS])
+        .where(BookingForm.company_id == company_id, BookingForm.confirmation_code.in_(codes))
+        .order_by(BookingForm.id)
+    ).all()
+
+    # Like .first() per code: the oldest booking with that code
+    existing_by_code = {}
+    for row in rows:
+        existing_by_code.setdefault(row.confirmation_code, dict(row._mapping))
+
+    updates = {}
+    for booking_data in batch:
+        existing = existing_by_code.get(booking_data['confirmation_code'])
+        if existing is None:
+            # New bookings are not created from the CSV, only existing ones updated
+            continue
+        try:
+            changes = _diff_booking(existing, booking_data, stay_dates, booked_dates)
+        except Exception as e:
+            result.errors += 1
+            print(f"Error processing booking: {e}")
+            continue
+
+        if changes:
+            # A later row for the same code is compared against this one's values
+            existing.update(changes)
+            updates.setdefault(existing['id'], {'id': existing['id']}).update(changes)
+
+    if updates:
+        db.session.execute(update(BookingForm), list(updates.values()))
+        for booking_id in updates:
+            if booking_id not in result.updated_booking_ids:
+                result.updated_booking_ids.append(booking_id)
+
+
+def import_airbnb_bookings(rows, company_id, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Update existing bookings from Airbnb CSV rows in batches: one IN query per
+    batch to find the bookings and one bulk UPDATE for the ones that changed.
+    Date formats are detected once per file. The caller commits.
+
+    Args:
+        rows: Iterable of booking dicts (posted JSON or iter_airbnb_csv_rows())
+        company_id: Only bookings of this company are matched
+
+    Returns:
+        AirbnbImportResult
+    """
+    result = AirbnbImportResult()
+    stay_dates = DateFormatDetector(STAY_DATE_FORMATS)
+    booked_dates = DateFormatDetector(BOOKED_DATE_FORMATS)
+
+    batch = []
+    for booking_data in rows:
+        result.processed += 1
+        if not isinstance(booking_data, dict) or not booking_data.get('confirmation_code'):
+            result.errors += 1
+            continue
+
+        batch.append(booking_data)
+        if len(batch) >= batch_size:
+            _apply_import_batch(batch, company_id, stay_dates, booked_dates, result)
+            batch = []
+
+    if batch:
+        _apply_import_batch(batch, company_id, stay_dates, booked_dates, result)
+
+    result.updated = len(result.updated_booking_ids)
+    return result
@@ -0,0 +1,437 @@
+"""
+Concurrent calendar sync engine for the scheduled ICS refresh
+"""
+
+import hashlib
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import List, Optional
+from urllib.parse import urlsplit
+
+import requests
+from flask import current_app, has_app_context
+
+from models import db, CalendarSource, Role, Unit, User
+
+
+# Defaults, each overridable with the config key of the same name
+CALENDAR_SYNC_MAX_WORKERS = 8
+CALENDAR_SYNC_CONNECT_TIMEOUT = 5
+CALENDAR_SYNC_READ_TIMEOUT = 30
+CALENDAR_SYNC_MAX_RETRIES = 2
+CALENDAR_SYNC_BACKOFF_SECONDS = 1.0
+# Minimum gap between two requests to the same host (Airbnb, Booking.com, ...)
+CALENDAR_SYNC_HOST_INTERVAL_SECONDS = 0.5
+
+# Responses worth retrying; everything else is reported as-is
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+MAX_RETRY_AFTER_SECONDS = 60
+
+# Outcomes reported per source
+OUTCOME_SYNCED = 'synced'
+# 304 from the upstream, or a body identical to the last processed one
+OUTCOME_NOT_MODIFIED = 'not_modified'
+OUTCOME_UNCHANGED = 'unchanged'
+OUTCOME_HTTP_ERROR = 'http_error'
+OUTCOME_FETCH_ERROR = 'fetch_error'
+OUTCOME_PROCESS_ERROR = 'process_error'
+
+
+# Properties some providers rewrite on every download; left out of the content hash
+VOLATILE_ICS_PROPERTIES = {'DTSTAMP', 'LAST-MODIFIED'}
+
+
+def _config(name, default):
+    if has_app_context():
+        return current_app.config.get(name, default)
+    return default
+
+
+@dataclass
+class FeedSpec:
+    """Plain copy of the CalendarSource fields the fetch threads need"""
+    source_id: int
+    url: str
+    unit_id: int
+    unit_number: str
+    company_id: int
+    source_name: str
+    source_identifier: Optional[str]
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+
+
+@dataclass
+class FetchResult:
+    status_code: Optional[int] = None
+    body: Optional[str] = None
+    attempts: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+    not_modified: bool = False
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+
+
+@dataclass
+class SyncResult:
+    """Outcome and timings of syncing one calendar source"""
+    source_id: int
+    source_identifier: Optional[str]
+    unit_number: str
+    outcome: str
+    http_status: Optional[int] = None
+    attempts: int = 0
+    fetch_seconds: float = 0.0
+    process_seconds: float = 0.0
+    units_added: int = 0
+    units_updated: int = 0
+    bookings_cancelled: int = 0
+    affected_booking_ids: List[int] = field(default_factory=list)
+    error: Optional[str] = None
+
+    def to_dict(self):
+        return asdict(self)
+
+    def changed_bookings(self):
+        """True if reconciling the feed added, updated or cancelled any booking"""
+        return bool(self.affected_booking_ids or self.units_added or self.units_updated or self.bookings_cancelled)
+
+    def summary(self):
+        line = (f"[{self.outcome}] {self.source_identifier} for unit {self.unit_number}: "
+                f"fetch {self.fetch_seconds * 1000:.0f} ms in {self.attempts} attempt(s), "
+                f"process {self.process_seconds * 1000:.0f} ms")
+        if self.error:
+            line += f" - {self.error}"
+        return line
+
+
+class HostRateLimiter:
+    """Spaces out request start times per host across all fetch threads"""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class FeedFetcher:
+    """
+    Downloads ICS feeds with timeouts, per-host rate limiting and retries with
+    exponential backoff. Safe to call from several threads; each thread keeps
+    its own requests.Session for connection reuse.
+    """
+
+    def __init__(self, connect_timeout, read_timeout, max_retries, backoff_seconds, rate_limiter):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.rate_limiter = rate_limiter
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def _retry_delay(self, attempt, response=None):
+        # Honour a numeric Retry-After (seconds) from rate-limited feeds
+        if response is not None and response.headers.get('Retry-After'):
+            try:
+                return min(float(response.headers['Retry-After']), MAX_RETRY_AFTER_SECONDS)
+            except ValueError:
+                pass
+        # Exponential backoff with jitter so retries from many sources don't line up
+        return self.backoff_seconds * (2 ** attempt) * (0.5 + random.random() / 2)
+
+    def fetch(self, url, etag=None, last_modified=None):
+        """
+        Download a feed, sending If-None-Match/If-Modified-Since when validators
+        from the previous download are given
+
+        On 200 the result carries the body, its normalized hash
+        (feed_content_hash) and the new validators;
+        on 304 it has not_modified set and no body.
+        """
+        result = FetchResult()
+        started = time.perf_counter()
+
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        for attempt in range(self.max_retries + 1):
+            result.attempts = attempt + 1
+            self.rate_limiter.wait(url)
+            try:
+                response = self._session().get(url, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                result.error = str(e)
+                result.status_code = None
+                if attempt < self.max_retries:
+                    time.sleep(self._retry_delay(attempt))
+                    continue
+                break
+
+            result.status_code = response.status_code
+            result.etag = response.headers.get('ETag')
+            result.last_modified = response.headers.get('Last-Modified')
+
+            if response.status_code == 304:
+                result.not_modified = True
+                result.error = None
+                break
+
+            if response.status_code == 200:
+                result.body = response.text
+                result.content_hash = feed_content_hash(response.text)
+                result.error = None
+                break
+
+            result.error = f'HTTP {response.status_code}'
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                time.sleep(self._retry_delay(attempt, response))
+                continue
+            break
+
+        result.seconds = time.perf_counter() - started
+        return result
+
+
+def feed_content_hash(text):
+    """
+    SHA-256 of an ICS body with the volatile parts normalized away
+
+    Folded lines are unfolded, DTSTAMP/LAST-MODIFIED lines dropped and the
+    VEVENT blocks sorted by UID, so a feed that only re-stamped or reordered
+    its events hashes the same as last time.
+    """
+    lines = []
+    for line in text.splitlines():
+        if line[:1] in (' ', '\t') and lines:
+            lines[-1] += line[1:]
+        elif line.strip():
+            lines.append(line.rstrip())
+
+    other, events, event_lines = [], [], None
+    for line in lines:
+        name = line.split(':', 1)[0].split(';', 1)[0].upper()
+        if name in VOLATILE_ICS_PROPERTIES:
+            continue
+        if line.upper() == 'BEGIN:VEVENT':
+            event_lines = [line]
+        elif event_lines is not None:
+            event_lines.append(line)
+            if line.upper() == 'END:VEVENT':
+                events.append(event_lines)
+                event_lines = None
+        else:
+            other.append(line)
+
+    def event_key(block):
+        uid = next((line.split(':', 1)[-1] for line in block
+                    if line.split(':', 1)[0].split(';', 1)[0].upper() == 'UID'), '')
+        return uid, block
+
+    digest = hashlib.sha256()
+    for line in other:
+        digest.update(line.encode('utf-8') + b'\n')
+    for block in sorted(events, key=event_key):
+        for line in block:
+            digest.update(line.encode('utf-8') + b'\n')
+    return digest.hexdigest()
+
+
+def load_feed_specs(source_ids=None):
+    """Load the active calendar sources with URLs (optionally only source_ids) in one query"""
+    query = db.session.query(
+        CalendarSource.id,
+        CalendarSource.source_url,
+        CalendarSource.unit_id,
+        Unit.unit_number,
+        Unit.company_id,
+        CalendarSource.source_name,
+        CalendarSource.source_identifier,
+        CalendarSource.etag,
+        CalendarSource.last_modified,
+        CalendarSource.content_hash
+    ).join(Unit, CalendarSource.unit_id == Unit.id).filter(
+        CalendarSource.source_url.isnot(None),
+        CalendarSource.is_active == True
+    )
+    if source_ids is not None:
+        query = query.filter(CalendarSource.id.in_(source_ids))
+
+    return [FeedSpec(*row) for row in query.order_by(CalendarSource.id).all()]
+
+
+def build_feed_fetcher(connect_timeout=None, read_timeout=None, max_retries=None,
+                       backoff_seconds=None, host_interval=None):
+    """Create a FeedFetcher, taking unset options from the app config"""
+    def option(value, name, default):
+        return value if value is not None else _config(name, default)
+
+    return FeedFetcher(
+        option(connect_timeout, 'CALENDAR_SYNC_CONNECT_TIMEOUT', CALENDAR_SYNC_CONNECT_TIMEOUT),
+        option(read_timeout, 'CALENDAR_SYNC_READ_TIMEOUT', CALENDAR_SYNC_READ_TIMEOUT),
+        option(max_retries, 'CALENDAR_SYNC_MAX_RETRIES', CALENDAR_SYNC_MAX_RETRIES),
+        option(backoff_seconds, 'CALENDAR_SYNC_BACKOFF_SECONDS', CALENDAR_SYNC_BACKOFF_SECONDS),
+        HostRateLimiter(option(host_interval, 'CALENDAR_SYNC_HOST_INTERVAL_SECONDS',
+                               CALENDAR_SYNC_HOST_INTERVAL_SECONDS))
+    )
+
+
+def feed_unchanged(fetched, content_hash):
+    """True if a fetched feed needs no parsing: a 304, or the same body as last time"""
+    return fetched.not_modified or (fetched.content_hash is not None and fetched.content_hash == content_hash)
+
+
+def save_feed_validators(source_id, fetched, processed):
+    """
+    Store the ETag/Last-Modified of a download and bump last_updated. The content
+    hash is only stored once the body has been processed successfully, so a
+    failed run is retried in full next time. The caller commits.
+    """
+    values = {'last_updated': datetime.utcnow()}
+    if fetched.etag:
+        values['etag'] = fetched.etag
+    if fetched.last_modified:
+        values['last_modified'] = fetched.last_modified
+    if processed and fetched.content_hash:
+        values['content_hash'] = fetched.content_hash
+    CalendarSource.query.filter_by(id=source_id).update(values)
+
+
+def get_import_user_id(company_id):
+    """
+    Pick the user that scheduled imports are recorded under: the company's first
+    Manager, falling back to any user of the company
+    """
+    manager = User.query.join(Role, User.role_id == Role.id).filter(
+        User.company_id == company_id,
+        Role.name == 'Manager'
+    ).order_by(User.id).first()
+    if manager:
+        return manager.id
+
+    user = User.query.filter_by(company_id=company_id).order_by(User.id).first()
+    return user.id if user else None
+
+
+class CalendarSyncEngine:
+    """
+    Syncs calendar sources by fetching feeds concurrently on a thread pool and
+    applying them one at a time on the calling thread, which is the only one
+    that touches the database session.
+    """
+
+    def __init__(self, max_workers=None, connect_timeout=None, read_timeout=None,
+                 max_retries=None, backoff_seconds=None, host_interval=None):
+        self.max_workers = max_workers or _config('CALENDAR_SYNC_MAX_WORKERS', CALENDAR_SYNC_MAX_WORKERS)
+        self.fetcher = build_feed_fetcher(connect_timeout, read_timeout, max_retries,
+                                          backoff_seconds, host_interval)
+        self._import_user_ids = {}
+
+    def run(self, source_ids=None):
+        """
+        Sync the active calendar sources with URLs
+
+        Args:
+            source_ids: Only sync these CalendarSource IDs (default: all)
+
+        Returns:
+            List of SyncResult, in completion order
+        """
+        specs = load_feed_specs(source_ids)
+        # Release the read transaction before the (possibly long) downloads
+        db.session.commit()
+
+        results = []
+        if not specs:
+            return results
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(specs)),
+                                thread_name_prefix='calendar-sync') as pool:
+            futures = {pool.submit(self.fetcher.fetch, spec.url, spec.etag, spec.last_modified): spec
+                       for spec in specs}
+            for future in as_completed(futures):
+                results.append(self._apply(futures[future], future.result()))
+
+        return results
+
+    def _import_user_id(self, company_id):
+        if company_id not in self._import_user_ids:
+            self._import_user_ids[company_id] = get_import_user_id(company_id)
+        return self._import_user_ids[company_id]
+
+    def _apply(self, spec, fetched):
+        """Process one downloaded feed; runs on the single writer thread"""
+        from routes.calendar import process_ics_calendar
+
+        result = SyncResult(
+            source_id=spec.source_id,
+            source_identifier=spec.source_identifier,
+            unit_number=spec.unit_number,
+            outcome=OUTCOME_SYNCED,
+            http_status=fetched.status_code,
+            attempts=fetched.attempts,
+            fetch_seconds=fetched.seconds
+        )
+
+        started = time.perf_counter()
+
+        if feed_unchanged(fetched, spec.content_hash):
+            # Nothing to parse or reconcile; just remember the new validators
+            result.outcome = OUTCOME_NOT_MODIFIED if fetched.not_modified else OUTCOME_UNCHANGED
+            save_feed_validators(spec.source_id, fetched, processed=False)
+            db.session.commit()
+            result.process_seconds = time.perf_counter() - started
+            return result
+
+        if fetched.body is None:
+            result.outcome = OUTCOME_HTTP_ERROR if fetched.status_code else OUTCOME_FETCH_ERROR
+            result.error = fetched.error
+            return result
+
+        try:
+            units_added, units_updated, bookings_cancelled, affected_booking_ids = process_ics_calendar(
+                fetched.body,
+                spec.unit_id,
+                spec.source_name,
+                spec.source_identifier,
+                user_id=self._import_user_id(spec.company_id)
+            )
+
+            save_feed_validators(spec.source_id, fetched, processed=True)
+            db.session.commit()
+
+            result.units_added = units_added
+            result.units_updated = units_updated
+            result.bookings_cancelled = bookings_cancelled
+            result.affected_booking_ids = affected_booking_ids
+        except Exception as e:
+            db.session.rollback()
+            result.outcome = OUTCOME_PROCESS_ERROR
+            result.error = str(e)
+
+        result.process_seconds = time.perf_counter() - started
+        return result
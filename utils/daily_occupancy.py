@@ -0,0 +1,267 @@
+"""
+Materialized unit_day_occupancy table: which booking occupies which unit on
+which day, kept in sync with BookingForm by session events
+
+Flushed booking changes are written to the table in the same flush. Bulk
+statements (insert_bookings(), the CSV import's bulk UPDATE, Query.delete())
+bypass the flush, so the bookings they touch are recorded and re-synced just
+before the transaction commits. rebuild_unit_day_occupancy() repairs drift.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from sqlalchemy import and_, delete, event, func, inspect, insert, or_, select
+from sqlalchemy.orm import Session
+
+from models import db, BookingForm, Unit, UnitDayOccupancy
+
+
+# Booking IDs / unit IDs bound into one IN (...)
+SYNC_CHUNK_SIZE = 500
+
+# Changing any of these moves a booking's rows
+_TRACKED_ATTRIBUTES = ['unit_id', 'check_in_date', 'check_out_date', 'is_cancelled']
+
+_active_booking = or_(BookingForm.is_cancelled == False, BookingForm.is_cancelled.is_(None))
+
+_booking_columns = [BookingForm.id, BookingForm.unit_id, BookingForm.check_in_date, BookingForm.check_out_date]
+
+
+def _chunks(values, size=SYNC_CHUNK_SIZE):
+    values = list(values)
+    for index in range(0, len(values), size):
+        yield values[index:index + size]
+
+
+def expand_booking_days(booking_id, unit_id, check_in_date, check_out_date, start=None, end=None):
+    """
+    Rows for one booking, one per day from check-in to check-out inclusive,
+    optionally clipped to [start, end]
+    """
+    if check_out_date < check_in_date:
+        return []
+
+    first = max(check_in_date, start) if start else check_in_date
+    last = min(check_out_date, end) if end else check_out_date
+
+    rows = []
+    day = first
+    while day <= last:
+        rows.append({
+            'unit_id': unit_id,
+            'date': day,
+            'booking_id': booking_id,
+            'is_checkin': day == check_in_date,
+            'is_checkout': day == check_out_date
+        })
+        day += timedelta(days=1)
+    return rows
+
+
+def sync_bookings(connection, booking_ids):
+    """Replace the rows of the given bookings with their current state"""
+    for chunk in _chunks(booking_ids):
+        connection.execute(delete(UnitDayOccupancy).where(UnitDayOccupancy.booking_id.in_(chunk)))
+        bookings = connection.execute(
+            select(*_booking_columns).where(BookingForm.id.in_(chunk), _active_booking)
+        ).all()
+
+        rows = [row for booking in bookings for row in expand_booking_days(*booking)]
+        if rows:
+            connection.execute(insert(UnitDayOccupancy), rows)
+
+
+def sync_unit_window(connection, unit_id, start, end):
+    """Replace the rows of one unit for the days in [start, end]"""
+    connection.execute(delete(UnitDayOccupancy).where(
+        UnitDayOccupancy.unit_id == unit_id,
+        UnitDayOccupancy.date.between(start, end)
+    ))
+    bookings = connection.execute(
+        select(*_booking_columns).where(
+            BookingForm.unit_id == unit_id,
+            BookingForm.check_in_date <= end,
+            BookingForm.check_out_date >= start,
+            _active_booking
+        )
+    ).all()
+
+    rows = [row for booking in bookings for row in expand_booking_days(*booking, start=start, end=end)]
+    if rows:
+        connection.execute(insert(UnitDayOccupancy), rows)
+
+
+def _pending_changes(session):
+    return session.info.setdefault('daily_occupancy_pending', {
+        'booking_ids': set(),
+        # unit_id -> [first day, last day] touched by bulk inserts
+        'unit_windows': {},
+        'rebuild_all': False
+    })
+
+
+@event.listens_for(Session, 'after_flush')
+def _sync_flushed_bookings(session, flush_context):
+    booking_ids = set()
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, BookingForm) and obj.id is not None:
+            booking_ids.add(obj.id)
+
+    for obj in session.dirty:
+        if not isinstance(obj, BookingForm):
+            continue
+        state = inspect(obj)
+        if any(state.attrs[name].history.has_changes() for name in _TRACKED_ATTRIBUTES):
+            booking_ids.add(obj.id)
+
+    if booking_ids:
+        sync_bookings(session.connection(), booking_ids)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_booking_changes(orm_execute_state):
+    if orm_execute_state.is_select or orm_execute_state.bind_mapper is None or \
+            orm_execute_state.bind_mapper.class_ is not BookingForm:
+        return
+
+    pending = _pending_changes(orm_execute_state.session)
+    parameters = orm_execute_state.parameters
+    rows = parameters if isinstance(parameters, list) else [parameters or {}]
+    statement = orm_execute_state.statement
+
+    if orm_execute_state.is_insert:
+        if all({'unit_id', 'check_in_date', 'check_out_date'} <= set(row) for row in rows):
+            # New IDs aren't known yet, so re-sync the unit/date windows they fall in
+            for row in rows:
+                window = pending['unit_windows'].setdefault(
+                    int(row['unit_id']), [row['check_in_date'], row['check_out_date']])
+                window[0] = min(window[0], row['check_in_date'])
+                window[1] = max(window[1], row['check_out_date'])
+        else:
+            pending['rebuild_all'] = True
+    elif rows and all('id' in row for row in rows):
+        # Bulk UPDATE by primary key
+        pending['booking_ids'].update(row['id'] for row in rows)
+    elif getattr(statement, 'whereclause', None) is not None:
+        # Query.update()/delete(): find the bookings before the statement changes them
+        matched = orm_execute_state.session.connection().execute(
+            select(BookingForm.id).where(statement.whereclause)
+        ).scalars()
+        pending['booking_ids'].update(matched)
+    else:
+        pending['rebuild_all'] = True
+
+
+@event.listens_for(Session, 'before_commit')
+def _sync_bulk_booking_changes(session):
+    pending = session.info.pop('daily_occupancy_pending', None)
+    if not pending:
+        return
+
+    if pending['rebuild_all']:
+        rebuild_unit_day_occupancy(session=session)
+        return
+
+    connection = session.connection()
+    if pending['booking_ids']:
+        sync_bookings(connection, pending['booking_ids'])
+    for unit_id, (start, end) in pending['unit_windows'].items():
+        sync_unit_window(connection, unit_id, start, end)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_bulk_booking_changes(session):
+    session.info.pop('daily_occupancy_pending', None)
+
+
+def rebuild_unit_day_occupancy(unit_ids=None, session=None):
+    """
+    Compare unit_day_occupancy with the bookings unit by unit and fix any
+    difference. The caller commits.
+
+    Args:
+        unit_ids: Only check these units (default: every unit, plus rows of
+                  units that no longer exist)
+
+    Returns:
+        (rows inserted, rows deleted)
+    """
+    session = session or db.session
+    connection = session.connection()
+
+    if unit_ids is None:
+        unit_ids = set(connection.execute(select(Unit.id)).scalars())
+        unit_ids |= set(connection.execute(select(UnitDayOccupancy.unit_id).distinct()).scalars())
+
+    inserted = deleted = 0
+    for chunk in _chunks(sorted(unit_ids)):
+        expected = set()
+        for booking in connection.execute(
+            select(*_booking_columns).where(BookingForm.unit_id.in_(chunk), _active_booking)
+        ):
+            for row in expand_booking_days(*booking):
+                expected.add((row['booking_id'], row['date'], row['unit_id'], row['is_checkin'], row['is_checkout']))
+
+        existing = defaultdict(list)
+        for row in connection.execute(
+            select(UnitDayOccupancy.booking_id, UnitDayOccupancy.date, UnitDayOccupancy.unit_id,
+                   UnitDayOccupancy.is_checkin, UnitDayOccupancy.is_checkout, UnitDayOccupancy.id)
+            .where(UnitDayOccupancy.unit_id.in_(chunk))
+        ):
+            existing[tuple(row[:5])].append(row.id)
+
+        # Duplicates and stale rows go; missing rows are added
+        stale_ids = []
+        for key, row_ids in existing.items():
+            stale_ids.extend(row_ids if key not in expected else row_ids[1:])
+        missing = expected - set(existing)
+
+        # A row whose flags changed keeps its (booking_id, date), so delete before inserting
+        for id_chunk in _chunks(stale_ids):
+            connection.execute(delete(UnitDayOccupancy).where(UnitDayOccupancy.id.in_(id_chunk)))
+        if missing:
+            connection.execute(insert(UnitDayOccupancy), [
+                {'booking_id': booking_id, 'date': day, 'unit_id': unit_id,
+                 'is_checkin': is_checkin, 'is_checkout': is_checkout}
+                for booking_id, day, unit_id, is_checkin, is_checkout in missing
+            ])
+
+        inserted += len(missing)
+        deleted += len(stale_ids)
+
+    return inserted, deleted
+
+
+def ensure_unit_day_occupancy(session=None):
+    """
+    Fill unit_day_occupancy from the bookings if it is empty while active
+    bookings exist, e.g. after db.create_all() added it to an existing
+    database. The caller commits.
+
+    Returns:
+        Number of rows inserted
+    """
+    session = session or db.session
+    connection = session.connection()
+
+    if connection.execute(select(UnitDayOccupancy.id).limit(1)).first() is not None:
+        return 0
+    if connection.execute(select(BookingForm.id).where(_active_booking).limit(1)).first() is None:
+        return 0
+    return rebuild_unit_day_occupancy(session=session)[0]
+
+
+def occupied_units_subquery(day, unit_ids):
+    """
+    Scalar subquery counting the units in unit_ids occupied on the night of day
+
+    unit_ids may be a list or a SELECT of unit IDs
+    """
+    return select(func.count(func.distinct(UnitDayOccupancy.unit_id))).where(
+        and_(
+            UnitDayOccupancy.date == day,
+            UnitDayOccupancy.is_checkout == False,
+            UnitDayOccupancy.unit_id.in_(unit_ids)
+        )
+    ).scalar_subquery()
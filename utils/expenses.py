@@ -0,0 +1,295 @@
+"""
+Monthly unit expenses (ExpenseData, ExpenseRemark): amount parsing, batched
+upserts and SQL-side totals
+"""
+
+from array import array
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Dict
+
+from sqlalchemy import and_, delete, func, or_, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, ExpenseData, ExpenseRemark, Unit
+
+
+# Costs, in the order they're listed on the expenses page and the dashboard
+EXPENSE_CATEGORIES = ['rental', 'electricity', 'water', 'sewage', 'internet', 'cleaner',
+                      'laundry', 'supplies', 'repair', 'replace', 'other']
+# Every money column of ExpenseData; sales is the revenue
+EXPENSE_FIELDS = ['sales'] + EXPENSE_CATEGORIES
+
+# ExpenseData amounts are Numeric(12, 2)
+AMOUNT_QUANTUM = Decimal('0.01')
+MAX_AMOUNT = Decimal('9999999999.99')
+
+
+def parse_amount(value):
+    """
+    Parse an amount typed into the expenses form, e.g. '1,250.5' or 'RM 80'
+
+    Returns:
+        Decimal rounded to cents, or None for an empty value
+
+    Raises:
+        ValueError: If the value isn't a number or doesn't fit the column
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        text = str(value)
+    else:
+        text = str(value).strip().upper().replace('RM', '').replace(',', '').replace(' ', '')
+    if text in ('', '-'):
+        return None
+
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f'Invalid amount: {value!r}')
+    if not amount.is_finite() or abs(amount) > MAX_AMOUNT:
+        raise ValueError(f'Invalid amount: {value!r}')
+    return amount.quantize(AMOUNT_QUANTUM, rounding=ROUND_HALF_UP)
+
+
+def format_amount(amount):
+    """An amount as the expenses form shows it: '' when empty, no trailing zeros"""
+    if amount is None:
+        return ''
+    amount = Decimal(amount)
+    return format(amount.normalize(), 'f') if amount == amount.to_integral() else format(amount, 'f')
+
+
+def _upsert(model, index_elements, rows, update_columns):
+    """
+    INSERT ... ON CONFLICT (index_elements) DO UPDATE SET update_columns for
+    rows that all carry the same keys, as one executemany
+    """
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    statement = dialect.insert(model)
+    statement = statement.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={name: statement.excluded[name] for name in update_columns}
+    )
+    db.session.execute(statement, rows)
+
+
+def owned_unit_ids(company_id, unit_ids):
+    """The subset of unit_ids that belong to the company, in one query"""
+    if not unit_ids:
+        return set()
+    return set(db.session.scalars(
+        select(Unit.id).where(Unit.company_id == company_id, Unit.id.in_(unit_ids))
+    ))
+
+
+def upsert_expenses(company_id, year, month, amounts_by_unit):
+    """
+    Save a month of expense cells for several units in as few statements as possible
+
+    Only the given fields are written, so a payload of changed cells leaves
+    the rest of a row alone. Cells equal to what is stored are skipped.
+    The caller commits.
+
+    Args:
+        amounts_by_unit: {unit_id: {field: Decimal or None}} for units the
+                         company owns
+
+    Returns:
+        Number of rows inserted or updated
+    """
+    if not amounts_by_unit:
+        return 0
+
+    # Current values of the units in the payload, one IN query
+    existing = {
+        row.unit_id: row
+        for row in db.session.query(ExpenseData.unit_id, *[getattr(ExpenseData, name) for name in EXPENSE_FIELDS])
+        .filter(
+            ExpenseData.company_id == company_id,
+            ExpenseData.year == year,
+            ExpenseData.month == month,
+            ExpenseData.unit_id.in_(list(amounts_by_unit))
+        )
+    }
+
+    # One executemany per distinct set of changed fields
+    now = datetime.utcnow()
+    batches = {}
+    for unit_id, amounts in amounts_by_unit.items():
+        current = existing.get(unit_id)
+        if current is not None:
+            amounts = {name: amount for name, amount in amounts.items() if amount != getattr(current, name)}
+            if not amounts:
+                continue
+
+        fields = tuple(sorted(amounts))
+        batches.setdefault(fields, []).append(dict(
+            amounts, company_id=company_id, unit_id=unit_id, year=year, month=month,
+            created_at=now, updated_at=now
+        ))
+
+    for fields, rows in batches.items():
+        _upsert(ExpenseData, ['company_id', 'unit_id', 'year', 'month'], rows, fields + ('updated_at',))
+
+    return sum(len(rows) for rows in batches.values())
+
+
+def upsert_expense_remarks(company_id, year, month, remarks_by_unit):
+    """
+    Save a month of cell remarks for several units; a None remark deletes it.
+    The caller commits.
+
+    Args:
+        remarks_by_unit: {unit_id: {column_name: text or None}} for units the
+                         company owns
+
+    Returns:
+        (remarks saved, remarks deleted)
+    """
+    now = datetime.utcnow()
+    rows = []
+    removed = []
+    for unit_id, columns in remarks_by_unit.items():
+        for column_name, remark in columns.items():
+            if remark is None:
+                removed.append((unit_id, column_name))
+            else:
+                rows.append({'company_id': company_id, 'unit_id': unit_id, 'year': year, 'month': month,
+                             'column_name': column_name, 'remark': remark,
+                             'created_at': now, 'updated_at': now})
+
+    if rows:
+        _upsert(ExpenseRemark, ['company_id', 'unit_id', 'year', 'month', 'column_name'], rows,
+                ['remark', 'updated_at'])
+    if removed:
+        db.session.execute(delete(ExpenseRemark).where(
+            ExpenseRemark.company_id == company_id,
+            ExpenseRemark.year == year,
+            ExpenseRemark.month == month,
+            tuple_(ExpenseRemark.unit_id, ExpenseRemark.column_name).in_(removed)
+        ))
+
+    return len(rows), len(removed)
+
+
+def _empty_totals():
+    totals = {field: 0.0 for field in EXPENSE_CATEGORIES}
+    totals.update({'revenue': 0.0, 'total_expenses': 0.0, 'net_income': 0.0})
+    return totals
+
+
+def _totals_from_row(row):
+    totals = _empty_totals()
+    totals['revenue'] = float(row.sales or 0)
+    for category in EXPENSE_CATEGORIES:
+        totals[category] = float(getattr(row, category) or 0)
+    totals['total_expenses'] = sum(totals[category] for category in EXPENSE_CATEGORIES)
+    totals['net_income'] = totals['revenue'] - totals['total_expenses']
+    return totals
+
+
+def _sum_columns():
+    return [func.sum(getattr(ExpenseData, field)).label(field) for field in EXPENSE_FIELDS]
+
+
+def monthly_expense_totals(company_id, unit_ids, periods):
+    """
+    Revenue, per-category costs, total expenses and net income of the given
+    units for several months, in one query
+
+    Args:
+        periods: (year, month) pairs
+
+    Returns:
+        Dict of (year, month) -> dict of floats keyed by 'revenue', each
+        category, 'total_expenses' and 'net_income'; months without data get zeros
+    """
+    periods = list(periods)
+    result = {period: _empty_totals() for period in periods}
+    if not unit_ids or not periods:
+        return result
+
+    rows = db.session.query(ExpenseData.year, ExpenseData.month, *_sum_columns()).filter(
+        ExpenseData.company_id == company_id,
+        ExpenseData.unit_id.in_(unit_ids),
+        or_(*[and_(ExpenseData.year == year, ExpenseData.month == month) for year, month in periods])
+    ).group_by(ExpenseData.year, ExpenseData.month).all()
+
+    for row in rows:
+        result[(row.year, row.month)] = _totals_from_row(row)
+    return result
+
+
+def expense_breakdown(totals):
+    """Non-zero categories with their share of total expenses, largest first"""
+    breakdown = []
+    for category in EXPENSE_CATEGORIES:
+        if totals[category] > 0:
+            percentage = (totals[category] / totals['total_expenses']) * 100 if totals['total_expenses'] > 0 else 0
+            breakdown.append({
+                'category': category.title(),
+                'amount': totals[category],
+                'percentage': percentage
+            })
+
+    breakdown.sort(key=lambda item: item['amount'], reverse=True)
+    return breakdown
+
+
+@dataclass
+class YearlyExpenseMatrix:
+    """
+    A year of ExpenseData in columnar form: row i is unit_ids[i] in months[i],
+    with columns[field][i] as its amount. Only months with data have a row.
+    """
+    year: int
+    unit_ids: array = field(default_factory=lambda: array('l'))
+    months: array = field(default_factory=lambda: array('b'))
+    columns: Dict[str, array] = field(default_factory=lambda: {name: array('d') for name in EXPENSE_FIELDS})
+
+    def __len__(self):
+        return len(self.unit_ids)
+
+    def to_dict(self):
+        return {
+            'year': self.year,
+            'months': list(range(1, 13)),
+            'fields': list(EXPENSE_FIELDS),
+            'rows': {
+                'unit_id': self.unit_ids.tolist(),
+                'month': self.months.tolist()
+            },
+            'columns': {name: values.tolist() for name, values in self.columns.items()}
+        }
+
+
+def yearly_expense_matrix(company_id, unit_ids, year):
+    """
+    Pivot a year of expenses for the given units into a YearlyExpenseMatrix
+    with one query, ordered by unit and month
+    """
+    matrix = YearlyExpenseMatrix(year)
+    if not unit_ids:
+        return matrix
+
+    rows = db.session.query(
+        ExpenseData.unit_id,
+        ExpenseData.month,
+        *_sum_columns()
+    ).filter(
+        ExpenseData.company_id == company_id,
+        ExpenseData.year == year,
+        ExpenseData.month.between(1, 12),
+        ExpenseData.unit_id.in_(unit_ids)
+    ).group_by(ExpenseData.unit_id, ExpenseData.month).order_by(ExpenseData.unit_id, ExpenseData.month)
+
+    columns = [matrix.columns[name] for name in EXPENSE_FIELDS]
+    for unit_id, month, *amounts in rows:
+        matrix.unit_ids.append(unit_id)
+        matrix.months.append(month)
+        for values, amount in zip(columns, amounts):
+            values.append(float(amount or 0))
+    return matrix
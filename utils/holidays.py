@@ -0,0 +1,327 @@
+"""
+Holiday resolution for the occupancy calendar and the holiday management page
+
+A company sees the system-wide public/school holidays, minus the ones it has
+marked deleted, plus its own holidays. Recurring holidays repeat every year
+from the year they were entered. All rows a company can see for the requested
+years are read in one query, expanded and merged in memory and cached per
+(company, year); the cache is dropped on commit whenever a Holiday or
+HolidayType row changes (see the session listeners below).
+"""
+
+import calendar
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import date
+
+from sqlalchemy import case, event, func, or_
+from sqlalchemy.orm import Session
+
+from models import db, Holiday, HolidayType
+
+
+# Cached years expire after this many seconds, which bounds how stale another
+# worker process' view can get
+HOLIDAY_CACHE_TTL_SECONDS = 300
+HOLIDAY_CACHE_MAX_ENTRIES = 2048
+
+# The holiday types shown on the occupancy calendar, by the key used in URLs and forms
+HOLIDAY_TYPES = {
+    'public': ('Malaysia Public Holiday', '#4CAF50'),
+    'school': ('Malaysia School Holiday', '#2196F3'),
+    'custom': ('Custom Holiday', '#9C27B0'),
+}
+# Only companies add custom holidays, so system rows of this type are ignored
+COMPANY_ONLY_TYPES = {'custom'}
+
+
+ResolvedHoliday = namedtuple('ResolvedHoliday', [
+    'id', 'name', 'date', 'type_key', 'color', 'company_id', 'is_recurring'
+])
+
+
+def holiday_type_key(type_name):
+    """'public', 'school' or 'custom' for a HolidayType name"""
+    if 'Public' in type_name:
+        return 'public'
+    if 'School' in type_name:
+        return 'school'
+    return 'custom'
+
+
+HolidayTypeInfo = namedtuple('HolidayTypeInfo', ['id', 'name', 'color'])
+
+
+class HolidayTypeCache:
+    """HolidayType id/name/color by key, created on first use if missing"""
+
+    def __init__(self):
+        self._types = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._types:
+                return self._types[key]
+
+        name, color = HOLIDAY_TYPES[key]
+        holiday_type = HolidayType.query.filter_by(name=name).first()
+        if not holiday_type:
+            holiday_type = HolidayType(name=name, color=color, is_system=True)
+            db.session.add(holiday_type)
+            db.session.commit()
+
+        info = HolidayTypeInfo(holiday_type.id, holiday_type.name, holiday_type.color)
+        with self._lock:
+            self._types[key] = info
+        return info
+
+    def all(self):
+        """{HolidayType.id: (key, color)} for every known type key"""
+        return {self.get(key).id: (key, self.get(key).color) for key in HOLIDAY_TYPES}
+
+    def clear(self):
+        with self._lock:
+            self._types.clear()
+
+
+class HolidayCache:
+    """Process-wide LRU cache of resolved holidays keyed by (company_id, year)"""
+
+    def __init__(self, max_entries=HOLIDAY_CACHE_MAX_ENTRIES, ttl=HOLIDAY_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so a load that raced with a commit isn't stored
+        self._generation = 0
+
+    def get_years(self, company_id, years):
+        """Return ({year: [ResolvedHoliday]} for the cached years, generation)"""
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for year in years:
+                entry = self._entries.get((company_id, year))
+                if entry is None or now - entry[0] > self.ttl:
+                    continue
+                self._entries.move_to_end((company_id, year))
+                found[year] = entry[1]
+            return found, self._generation
+
+    def set_years(self, company_id, holidays_by_year, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            for year, holidays in holidays_by_year.items():
+                self._entries[(company_id, year)] = (time.monotonic(), holidays)
+                self._entries.move_to_end((company_id, year))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_companies(self, company_ids):
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._entries if key[0] in company_ids]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+holiday_types = HolidayTypeCache()
+holiday_cache = HolidayCache()
+
+
+def _load_years(company_id, years):
+    """Resolve the given years for a company from a single Holiday query"""
+    types = holiday_types.all()
+    first_day = date(min(years), 1, 1)
+    last_day = date(max(years), 12, 31)
+
+    rows = db.session.query(
+        Holiday.id,
+        Holiday.name,
+        Holiday.date,
+        Holiday.holiday_type_id,
+        Holiday.company_id,
+        Holiday.is_recurring,
+        Holiday.is_deleted
+    ).filter(
+        Holiday.holiday_type_id.in_(types),
+        or_(Holiday.company_id == company_id, Holiday.company_id.is_(None)),
+        # Recurring holidays from earlier years project into the requested ones
+        or_(Holiday.date.between(first_day, last_day),
+            (Holiday.is_recurring == True) & (Holiday.date <= last_day))
+    ).order_by(Holiday.date, Holiday.id).all()
+
+    holidays_by_year = {year: [] for year in years}
+    merge_holidays(expand_recurring(rows, years), types, holidays_by_year)
+    return holidays_by_year
+
+
+def recurring_date(original, year):
+    """The anniversary of original in year; 29 February falls on the 28th in other years"""
+    if original.month == 2 and original.day == 29 and not calendar.isleap(year):
+        return date(year, 2, 28)
+    return original.replace(year=year)
+
+
+def expand_recurring(rows, years):
+    """
+    Yield (row, occurrence date) for every row in the given years. Recurring rows
+    (holidays and deletion markers alike) occur every year from their own year on.
+    """
+    years = set(years)
+    for row in rows:
+        if row.is_recurring:
+            for year in sorted(years):
+                if year >= row.date.year:
+                    yield row, recurring_date(row.date, year)
+        elif row.date.year in years:
+            yield row, row.date
+
+
+def merge_holidays(occurrences, types, holidays_by_year):
+    """
+    Merge system holidays, company holidays and company deletion markers
+
+    A system holiday is hidden when the company marked it deleted or added its
+    own holiday of the same type on the same date. An occurrence that is both
+    stored and projected from a recurring holiday is listed once.
+    """
+    occurrences = list(occurrences)
+    hidden = set()
+    for row, day in occurrences:
+        if row.company_id is not None:
+            hidden.add((row.holiday_type_id, day))
+
+    seen = set()
+    for row, day in occurrences:
+        if row.is_deleted:
+            continue
+        type_key, color = types[row.holiday_type_id]
+        if row.company_id is None and (type_key in COMPANY_ONLY_TYPES or (row.holiday_type_id, day) in hidden):
+            continue
+
+        key = (row.holiday_type_id, day, row.company_id, row.name)
+        if key in seen:
+            continue
+        seen.add(key)
+
+        holidays_by_year[day.year].append(ResolvedHoliday(
+            row.id, row.name, day, type_key, color, row.company_id, bool(row.is_recurring)
+        ))
+
+    for holidays in holidays_by_year.values():
+        holidays.sort(key=lambda holiday: (holiday.date, holiday.id))
+
+
+def resolve_holidays(company_id, start, end, type_key=None):
+    """
+    Holidays visible to a company between start and end (inclusive), sorted by date
+
+    Args:
+        type_key: Only 'public', 'school' or 'custom' holidays, optional
+
+    Returns:
+        List of ResolvedHoliday
+    """
+    years = range(start.year, end.year + 1)
+    holidays_by_year, generation = holiday_cache.get_years(company_id, years)
+
+    missing = [year for year in years if year not in holidays_by_year]
+    if missing:
+        loaded = _load_years(company_id, missing)
+        holiday_cache.set_years(company_id, loaded, generation)
+        holidays_by_year.update(loaded)
+
+    return [
+        holiday
+        for year in years
+        for holiday in holidays_by_year[year]
+        if start <= holiday.date <= end and (type_key is None or holiday.type_key == type_key)
+    ]
+
+
+def holiday_year_span(company_id, type_key):
+    """
+    (first year, last year) of the holidays of one type a company can see, or None
+
+    Recurring holidays have no last year, so the span then runs to next year.
+    """
+    first_day, last_day, recurring_count = db.session.query(
+        func.min(Holiday.date),
+        func.max(Holiday.date),
+        func.count(case((Holiday.is_recurring == True, 1)))
+    ).filter(
+        Holiday.holiday_type_id == holiday_types.get(type_key).id,
+        or_(Holiday.company_id == company_id, Holiday.company_id.is_(None))
+    ).one()
+    if first_day is None:
+        return None
+    if recurring_count:
+        return first_day.year, max(last_day.year, date.today().year + 1)
+    return first_day.year, last_day.year
+
+
+def holidays_by_day(company_id, start, end):
+    """Holidays between start and end grouped as {date: [{name, type, color}]} for the calendar"""
+    grouped = {}
+    for holiday in resolve_holidays(company_id, start, end):
+        grouped.setdefault(holiday.date, []).append({
+            'name': holiday.name,
+            'type': holiday.type_key,
+            'color': holiday.color
+        })
+    return grouped
+
+
+# Session listeners that keep the caches in sync with the database.
+# Affected companies are collected on flush and dropped when the transaction
+# commits; None means a system-wide holiday changed, which affects everyone.
+
+def _pending_changes(session):
+    return session.info.setdefault('holiday_cache_pending', {'clear_all': False, 'company_ids': set()})
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_holiday_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, HolidayType):
+            holiday_types.clear()
+            _pending_changes(session)['clear_all'] = True
+        elif isinstance(obj, Holiday):
+            if obj.company_id is None:
+                _pending_changes(session)['clear_all'] = True
+            else:
+                _pending_changes(session)['company_ids'].add(int(obj.company_id))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_holiday_changes(orm_execute_state):
+    # Query.update()/delete() can touch any company
+    if orm_execute_state.is_select or orm_execute_state.bind_mapper is None:
+        return
+    if orm_execute_state.bind_mapper.class_ in (Holiday, HolidayType):
+        _pending_changes(orm_execute_state.session)['clear_all'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_holiday_changes(session):
+    pending = session.info.pop('holiday_cache_pending', None)
+    if not pending:
+        return
+
+    if pending['clear_all']:
+        holiday_cache.clear()
+    elif pending['company_ids']:
+        holiday_cache.invalidate_companies(pending['company_ids'])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_holiday_changes(session):
+    session.info.pop('holiday_cache_pending', None)
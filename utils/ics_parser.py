@@ -0,0 +1,226 @@
+"""
+Streaming VEVENT extractor for ICS calendar feeds
+"""
+
+import re
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+
+# Only the fields process_ics_calendar() reads. start/end are dates, or None
+# when the event doesn't say (callers skip those)
+IcsEvent = namedtuple('IcsEvent', ['summary', 'description', 'start', 'end'])
+
+# 20250101, 20250101T150000 and 20250101T150000Z
+_DATE_VALUE = re.compile(r'^(\d{4})(\d{2})(\d{2})(?:T\d{6}Z?)?$')
+
+_TEXT_ESCAPES = {'n': '\n', 'N': '\n', ',': ',', ';': ';', '\\': '\\'}
+_TEXT_ESCAPE = re.compile(r'\\(.?)', re.DOTALL)
+
+_PROPERTY_NAME = re.compile(r'[^;:]*')
+
+# P1W, P2D, PT36H, P1DT12H, ... (RFC 5545 dur-value)
+_DURATION_VALUE = re.compile(r'^\+?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+
+
+class IcsParseError(ValueError):
+    """Raised when the streaming parser meets something it doesn't handle"""
+
+
+def _unfold(calendar_data):
+    """Yield logical content lines, joining RFC 5545 folded continuation lines"""
+    current = None
+    for line in calendar_data.splitlines():
+        if line[:1] in (' ', '\t'):
+            if current is None:
+                raise IcsParseError('Continuation line before any content line')
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+
+def _split_property(line):
+    """Split 'NAME;PARAM=VALUE:value' into (NAME, {PARAM: VALUE}, value)"""
+    if '"' not in line:
+        head, sep, value = line.partition(':')
+        if not sep:
+            raise IcsParseError(f'Malformed content line: {line[:50]}')
+        parts = head.split(';')
+    else:
+        # Quoted parameter values may contain ':' and ';'
+        parts, current, quoted, value = [], [], False, None
+        for index, char in enumerate(line):
+            if char == '"':
+                quoted = not quoted
+            elif not quoted and char == ';':
+                parts.append(''.join(current))
+                current = []
+                continue
+            elif not quoted and char == ':':
+                parts.append(''.join(current))
+                value = line[index + 1:]
+                break
+            current.append(char)
+        if value is None:
+            raise IcsParseError(f'Malformed content line: {line[:50]}')
+
+    params = {}
+    for param in parts[1:]:
+        key, _, param_value = param.partition('=')
+        params[key.upper()] = param_value.strip('"')
+    return parts[0].upper(), params, value
+
+
+def _unescape_text(value):
+    if '\\' not in value:
+        return value
+    return _TEXT_ESCAPE.sub(lambda match: _TEXT_ESCAPES.get(match.group(1), match.group(1)), value)
+
+
+def _parse_date(value, params):
+    """
+    Parse a DTSTART/DTEND value to a date. VALUE=DATE, UTC, floating and TZID
+    forms all keep the calendar date as written, like icalendar's .dt.date().
+    """
+    value_type = params.get('VALUE', 'DATE-TIME').upper()
+    match = _DATE_VALUE.match(value.strip())
+    if not match or value_type not in ('DATE', 'DATE-TIME'):
+        raise IcsParseError(f'Unsupported date value: {value!r}')
+    year, month, day = (int(part) for part in match.groups())
+    return date(year, month, day)
+
+
+def _parse_duration(value):
+    """Whole days of a DURATION value, or None if it isn't a forward duration"""
+    match = _DURATION_VALUE.match(value.strip().upper())
+    if not match or not any(match.groups()):
+        return None
+    weeks, days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return timedelta(weeks=weeks, days=days, hours=hours, minutes=minutes, seconds=seconds).days
+
+
+def _event_end(start, end, duration_days):
+    """DTEND, else DTSTART + DURATION, else None"""
+    if end is not None:
+        return end
+    if start is not None and duration_days is not None:
+        return start + timedelta(days=duration_days)
+    return None
+
+
+def iter_vevents(calendar_data):
+    """
+    Yield an IcsEvent for every VEVENT, reading only SUMMARY, DESCRIPTION,
+    DTSTART, DTEND and DURATION. Properties of nested components (e.g. VALARM)
+    are ignored.
+
+    Raises:
+        IcsParseError: on input the streaming parser doesn't handle
+    """
+    if isinstance(calendar_data, bytes):
+        calendar_data = calendar_data.decode('utf-8')
+
+    in_event = False
+    nested = []
+    fields = {}
+
+    for line in _unfold(calendar_data):
+        if not line:
+            continue
+
+        head = line[:6].upper()
+        if head == 'BEGIN:':
+            component = line[6:].strip().upper()
+            if in_event:
+                nested.append(component)
+            elif component == 'VEVENT':
+                in_event = True
+                fields = {}
+            continue
+
+        if head.startswith('END:'):
+            component = line[4:].strip().upper()
+            if nested:
+                if nested.pop() != component:
+                    raise IcsParseError(f'Unbalanced END:{component}')
+            elif in_event and component == 'VEVENT':
+                in_event = False
+                start = fields.get('DTSTART')
+                yield IcsEvent(
+                    fields.get('SUMMARY', 'Booking'),
+                    fields.get('DESCRIPTION', ''),
+                    start,
+                    _event_end(start, fields.get('DTEND'), fields.get('DURATION'))
+                )
+            continue
+
+        # Every property we read starts with S or D; skip UID, LOCATION, ... cheaply
+        if not in_event or nested or head[:1] not in ('S', 'D'):
+            continue
+
+        name = _PROPERTY_NAME.match(line).group(0).upper()
+
+        if name in ('SUMMARY', 'DESCRIPTION'):
+            if name not in fields:
+                _, _, value = _split_property(line)
+                fields[name] = _unescape_text(value)
+        elif name in ('DTSTART', 'DTEND'):
+            _, params, value = _split_property(line)
+            fields[name] = _parse_date(value, params)
+        elif name == 'DURATION':
+            _, _, value = _split_property(line)
+            fields[name] = _parse_duration(value)
+
+    if in_event or nested:
+        raise IcsParseError('Unterminated component')
+
+
+def _icalendar_events(calendar_data):
+    """Same output as iter_vevents(), built with the icalendar package"""
+    from icalendar import Calendar
+
+    events = []
+    for component in Calendar.from_ical(calendar_data).walk():
+        if component.name != "VEVENT":
+            continue
+
+        dtstart = component.get('dtstart')
+        dtend = component.get('dtend')
+        duration = component.get('duration')
+
+        start_date = dtstart.dt if dtstart is not None else None
+        end_date = dtend.dt if dtend is not None else None
+        if end_date is None and start_date is not None and duration is not None:
+            end_date = start_date + duration.dt
+
+        # Convert datetime objects to date objects if needed
+        if isinstance(start_date, datetime):
+            start_date = start_date.date()
+        if isinstance(end_date, datetime):
+            end_date = end_date.date()
+
+        events.append(IcsEvent(
+            str(component.get('summary', 'Booking')),
+            str(component.get('description', '')),
+            start_date,
+            end_date
+        ))
+    return events
+
+
+def parse_ics_events(calendar_data):
+    """
+    Parse the VEVENTs of an ICS feed into a list of IcsEvent tuples
+
+    Uses the streaming parser and falls back to icalendar for anything it
+    doesn't handle. Errors from icalendar propagate to the caller.
+    """
+    try:
+        return list(iter_vevents(calendar_data))
+    except (IcsParseError, UnicodeDecodeError) as e:
+        print(f"Streaming ICS parser fell back to icalendar: {str(e)}")
+        return _icalendar_events(calendar_data)
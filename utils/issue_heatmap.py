@@ -0,0 +1,200 @@
+"""
+Issue counts per unit and category for the dashboard heatmap
+
+The whole matrix comes from one GROUP BY query plus the unit and category
+labels, and is cached per (company, accessible unit set). The cache is dropped
+on commit whenever an Issue, Unit or Category row changes (see the session
+listeners below).
+"""
+
+import hashlib
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from models import db, Category, Issue, Unit
+
+
+# Cached matrices expire after this many seconds, which bounds how stale
+# another worker process' view can get
+HEATMAP_CACHE_TTL_SECONDS = 300
+HEATMAP_CACHE_MAX_ENTRIES = 512
+
+
+@dataclass
+class IssueHeatmap:
+    """Dense units x categories matrix of issue counts, stored row by row"""
+    unit_ids: List[int] = field(default_factory=list)
+    units: List[str] = field(default_factory=list)
+    category_ids: List[int] = field(default_factory=list)
+    categories: List[str] = field(default_factory=list)
+    counts: array = field(default_factory=lambda: array('l'))
+
+    def row(self, index):
+        width = len(self.categories)
+        return self.counts[index * width:(index + 1) * width]
+
+    def to_dict(self):
+        """JSON-ready form: labels once, then one list of counts per unit"""
+        return {
+            'unit_ids': self.unit_ids,
+            'units': self.units,
+            'categories': self.categories,
+            'counts': [self.row(index).tolist() for index in range(len(self.units))],
+            'max': max(self.counts, default=0)
+        }
+
+
+class HeatmapCache:
+    """Process-wide LRU cache of heatmaps keyed by (company_id, unit set hash)"""
+
+    def __init__(self, max_entries=HEATMAP_CACHE_MAX_ENTRIES, ttl=HEATMAP_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so a load that raced with a commit isn't stored
+        self._generation = 0
+
+    def get(self, key):
+        """Return (cached heatmap or None, generation)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                return None, self._generation
+            self._entries.move_to_end(key)
+            return entry[1], self._generation
+
+    def set(self, key, heatmap, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic(), heatmap)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_companies(self, company_ids):
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._entries if key[0] in company_ids]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+heatmap_cache = HeatmapCache()
+
+
+def unit_set_hash(unit_ids):
+    """Stable digest of a set of unit IDs, used in cache keys"""
+    return hashlib.sha1(','.join(str(unit_id) for unit_id in sorted(set(unit_ids))).encode()).hexdigest()
+
+
+def _load_heatmap(company_id, unit_ids):
+    units = db.session.query(Unit.id, Unit.unit_number).filter(
+        Unit.company_id == company_id,
+        Unit.id.in_(unit_ids)
+    ).order_by(Unit.unit_number).all()
+    categories = db.session.query(Category.id, Category.name).order_by(Category.id).all()
+
+    heatmap = IssueHeatmap(
+        unit_ids=[unit.id for unit in units],
+        units=[unit.unit_number for unit in units],
+        category_ids=[category.id for category in categories],
+        categories=[category.name for category in categories],
+        counts=array('l', bytes(array('l').itemsize * len(units) * len(categories)))
+    )
+    if not units or not categories:
+        return heatmap
+
+    unit_index = {unit_id: index for index, unit_id in enumerate(heatmap.unit_ids)}
+    category_index = {category_id: index for index, category_id in enumerate(heatmap.category_ids)}
+    width = len(categories)
+
+    for unit_id, category_id, count in db.session.query(
+        Issue.unit_id, Issue.category_id, func.count(Issue.id)
+    ).filter(
+        Issue.company_id == company_id,
+        Issue.unit_id.in_(heatmap.unit_ids),
+        Issue.category_id.isnot(None)
+    ).group_by(Issue.unit_id, Issue.category_id):
+        if category_id in category_index:
+            heatmap.counts[unit_index[unit_id] * width + category_index[category_id]] = count
+
+    return heatmap
+
+
+def issue_heatmap(company_id, unit_ids):
+    """
+    Issue counts of the given units per category, cached until an issue,
+    unit or category changes
+
+    Returns:
+        IssueHeatmap with units ordered by unit number and categories by ID
+    """
+    unit_ids = sorted(set(unit_ids))
+    if not unit_ids:
+        return IssueHeatmap()
+
+    key = (company_id, unit_set_hash(unit_ids))
+    heatmap, generation = heatmap_cache.get(key)
+    if heatmap is None:
+        heatmap = _load_heatmap(company_id, unit_ids)
+        heatmap_cache.set(key, heatmap, generation)
+    return heatmap
+
+
+# Session listeners that keep the cache in sync with the database.
+# Affected companies are collected on flush and dropped when the transaction
+# commits; categories are shared by every company, so they clear everything.
+
+def _pending_changes(session):
+    return session.info.setdefault('heatmap_cache_pending', {'clear_all': False, 'company_ids': set()})
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_heatmap_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Category):
+            _pending_changes(session)['clear_all'] = True
+        elif isinstance(obj, (Issue, Unit)):
+            if obj.company_id is None:
+                _pending_changes(session)['clear_all'] = True
+            else:
+                _pending_changes(session)['company_ids'].add(int(obj.company_id))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_heatmap_changes(orm_execute_state):
+    # Bulk inserts, Query.update() and Query.delete() can touch any company
+    if orm_execute_state.is_select or orm_execute_state.bind_mapper is None:
+        return
+    if orm_execute_state.bind_mapper.class_ in (Issue, Unit, Category):
+        _pending_changes(orm_execute_state.session)['clear_all'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_heatmap_changes(session):
+    pending = session.info.pop('heatmap_cache_pending', None)
+    if not pending:
+        return
+
+    if pending['clear_all']:
+        heatmap_cache.clear()
+    elif pending['company_ids']:
+        heatmap_cache.invalidate_companies(pending['company_ids'])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_heatmap_changes(session):
+    session.info.pop('heatmap_cache_pending', None)
@@ -0,0 +1,273 @@
+"""
+In-process background job queue backed by the background_job table
+
+Jobs are stored before they run, so a restart loses no work. Every worker
+process stamps the jobs it runs with its ID and a heartbeat; a running job whose
+heartbeat has gone stale belonged to a process that stopped, and is queued
+again. Handlers run on a small thread pool inside an app context; the
+APScheduler instance from app.py periodically dispatches anything still queued.
+"""
+
+import json
+import os
+import socket
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_, update
+
+from models import db, BackgroundJob
+
+
+# Defaults, each overridable with the config key of the same name
+JOB_QUEUE_MAX_WORKERS = 2
+JOB_QUEUE_POLL_SECONDS = 15
+# Jobs interrupted by a restart are retried this many times in total
+JOB_QUEUE_MAX_ATTEMPTS = 3
+# Running jobs refresh their heartbeat this often...
+JOB_QUEUE_HEARTBEAT_SECONDS = 30
+# ...and are treated as interrupted once it is older than this
+JOB_QUEUE_STALE_SECONDS = 120
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+
+_handlers = {}
+
+
+class JobError(Exception):
+    """Raised by a handler to fail its job with a message meant for the user"""
+
+
+def register_job_handler(job_type):
+    """
+    Register a function as the handler for job_type
+
+    The handler is called as handler(job, payload) with a JobContext and the
+    decoded payload, and returns a JSON-serialisable result.
+    """
+    def decorator(func):
+        _handlers[job_type] = func
+        return func
+    return decorator
+
+
+class JobContext:
+    """What a running handler knows about its job"""
+
+    def __init__(self, job_id, company_id, user_id):
+        self.job_id = job_id
+        self.company_id = company_id
+        self.user_id = user_id
+
+    def report(self, progress, message=None):
+        """Record progress (0-100). Commits the current session."""
+        BackgroundJob.query.filter_by(id=self.job_id).update({
+            'progress': max(0, min(100, int(progress))),
+            'progress_message': message
+        })
+        db.session.commit()
+
+
+class JobQueue:
+    """Thread pool that claims and runs queued BackgroundJob rows"""
+
+    def __init__(self):
+        self.app = None
+        self.executor = None
+        self.max_attempts = JOB_QUEUE_MAX_ATTEMPTS
+        self.stale_seconds = JOB_QUEUE_STALE_SECONDS
+        # Identifies this process on the jobs it claims
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def init_app(self, app, scheduler):
+        """Start the worker pool and schedule the dispatcher and the heartbeat"""
+        self.app = app
+        self.max_attempts = app.config.get('JOB_QUEUE_MAX_ATTEMPTS', JOB_QUEUE_MAX_ATTEMPTS)
+        self.stale_seconds = app.config.get('JOB_QUEUE_STALE_SECONDS', JOB_QUEUE_STALE_SECONDS)
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config.get('JOB_QUEUE_MAX_WORKERS', JOB_QUEUE_MAX_WORKERS),
+            thread_name_prefix='job-worker'
+        )
+
+        scheduler.add_job(
+            func=self.dispatch_queued_jobs,
+            trigger='interval',
+            seconds=app.config.get('JOB_QUEUE_POLL_SECONDS', JOB_QUEUE_POLL_SECONDS),
+            id='dispatch_background_jobs',
+            replace_existing=True
+        )
+        scheduler.add_job(
+            func=self.send_heartbeat,
+            trigger='interval',
+            seconds=app.config.get('JOB_QUEUE_HEARTBEAT_SECONDS', JOB_QUEUE_HEARTBEAT_SECONDS),
+            id='background_job_heartbeat',
+            replace_existing=True
+        )
+        self.dispatch_queued_jobs()
+
+    def recover_interrupted_jobs(self):
+        """
+        Put running jobs whose heartbeat has gone stale back in the queue, or
+        fail them once they have used up their attempts. Jobs other live worker
+        processes are running keep a fresh heartbeat and are left alone.
+        """
+        now = datetime.utcnow()
+        # Rows claimed before heartbeats existed only have started_at
+        last_seen = func.coalesce(BackgroundJob.heartbeat_at, BackgroundJob.started_at)
+        interrupted = (
+            BackgroundJob.status == JOB_RUNNING,
+            or_(last_seen.is_(None), last_seen < now - timedelta(seconds=self.stale_seconds))
+        )
+
+        db.session.execute(
+            update(BackgroundJob)
+            .where(*interrupted, BackgroundJob.attempts >= self.max_attempts)
+            .values(status=JOB_FAILED, error='Interrupted too many times', finished_at=now, worker_id=None)
+        )
+        db.session.execute(
+            update(BackgroundJob)
+            .where(*interrupted)
+            .values(status=JOB_QUEUED, worker_id=None)
+        )
+        db.session.commit()
+
+    def send_heartbeat(self):
+        """Mark the jobs this process is running as alive (run by the scheduler)"""
+        with self._lock:
+            if not self._in_flight:
+                return
+        with self.app.app_context():
+            db.session.execute(
+                update(BackgroundJob)
+                .where(BackgroundJob.status == JOB_RUNNING, BackgroundJob.worker_id == self.worker_id)
+                .values(heartbeat_at=datetime.utcnow())
+            )
+            db.session.commit()
+            db.session.remove()
+
+    def submit(self, job_id):
+        """Hand a queued job to the pool. Does nothing before init_app()."""
+        if self.executor is None:
+            return
+        with self._lock:
+            if job_id in self._in_flight:
+                return
+            self._in_flight.add(job_id)
+        self.executor.submit(self._run, job_id)
+
+    def dispatch_queued_jobs(self):
+        """Requeue stale jobs, then submit every queued job, oldest first (run by the scheduler)"""
+        with self.app.app_context():
+            # Picks up the jobs of a worker process that stopped while others kept running
+            self.recover_interrupted_jobs()
+            job_ids = [job_id for (job_id,) in db.session.query(BackgroundJob.id).filter(
+                BackgroundJob.status == JOB_QUEUED
+            ).order_by(BackgroundJob.created_at, BackgroundJob.id).all()]
+            db.session.remove()
+
+        for job_id in job_ids:
+            self.submit(job_id)
+
+    def _claim(self, job_id):
+        """Atomically move a job from queued to running; False if someone else has it"""
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job_id, BackgroundJob.status == JOB_QUEUED)
+            .values(status=JOB_RUNNING, started_at=now, worker_id=self.worker_id, heartbeat_at=now,
+                    attempts=BackgroundJob.attempts + 1, progress=0, error=None)
+        ).rowcount == 1
+        db.session.commit()
+        return claimed
+
+    def _run(self, job_id):
+        try:
+            with self.app.app_context():
+                try:
+                    self._execute(job_id)
+                finally:
+                    db.session.remove()
+        finally:
+            with self._lock:
+                self._in_flight.discard(job_id)
+
+    def _execute(self, job_id):
+        if not self._claim(job_id):
+            return
+
+        job = db.session.get(BackgroundJob, job_id)
+        context = JobContext(job.id, job.company_id, job.user_id)
+        handler = _handlers.get(job.job_type)
+
+        try:
+            if handler is None:
+                raise JobError(f'No handler registered for job type {job.job_type}')
+            payload = json.loads(job.payload) if job.payload else {}
+            result = handler(context, payload)
+        except Exception as e:
+            db.session.rollback()
+            if not isinstance(e, JobError):
+                traceback.print_exc()
+            values = {'status': JOB_FAILED, 'error': str(e)}
+        else:
+            values = {'status': JOB_SUCCEEDED, 'result': json.dumps(result),
+                      'progress': 100, 'progress_message': None}
+
+        values['finished_at'] = datetime.utcnow()
+        # No-op if the job was declared stale and handed to another worker meanwhile
+        db.session.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job_id, BackgroundJob.status == JOB_RUNNING,
+                   BackgroundJob.worker_id == self.worker_id)
+            .values(**values)
+        )
+        db.session.commit()
+
+
+job_queue = JobQueue()
+
+
+def enqueue_job(job_type, payload=None, company_id=None, user_id=None):
+    """
+    Store a job and hand it to the worker pool once committed
+
+    Returns:
+        The new BackgroundJob
+    """
+    job = BackgroundJob(
+        job_type=job_type,
+        status=JOB_QUEUED,
+        payload=json.dumps(payload or {}),
+        company_id=company_id,
+        user_id=user_id
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    job_queue.submit(job.id)
+    return job
+
+
+def serialize_job(job):
+    """JSON view of a job for the status endpoint"""
+    return {
+        'id': job.id,
+        'job_type': job.job_type,
+        'status': job.status,
+        'progress': job.progress,
+        'progress_message': job.progress_message,
+        'attempts': job.attempts,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
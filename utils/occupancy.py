@@ -0,0 +1,169 @@
+"""
+Occupancy over an arbitrary date range, computed in one pass over the
+overlapping bookings with a difference array instead of walking every night
+"""
+
+from dataclasses import dataclass, field
+from datetime import timedelta
+from itertools import accumulate
+from typing import Dict, List
+
+from sqlalchemy import or_
+
+from models import BookingForm
+from utils.access_control import filter_query_by_accessible_units, get_access_context
+
+
+# Upper bound on the number of days one request may cover
+MAX_OCCUPANCY_RANGE_DAYS = 731
+
+
+@dataclass
+class UnitOccupancy:
+    unit_id: int
+    occupied_nights: int = 0
+    sold_nights: int = 0
+    occupancy_rate: float = 0.0
+    revenue: float = 0.0
+    adr: float = 0.0
+
+
+@dataclass
+class OccupancyReport:
+    """Occupancy of a set of units for the nights in [start, end)"""
+    start: object
+    end: object
+    total_units: int = 0
+    # Occupied units per night, one entry per day of the range
+    occupied_units: List[int] = field(default_factory=list)
+    units: Dict[int, UnitOccupancy] = field(default_factory=dict)
+    sold_nights: int = 0
+    revenue: float = 0.0
+
+    @property
+    def days(self):
+        return [self.start + timedelta(days=offset) for offset in range(len(self.occupied_units))]
+
+    @property
+    def occupancy_rate(self):
+        capacity = self.total_units * len(self.occupied_units)
+        return sum(self.occupied_units) / capacity if capacity else 0.0
+
+    @property
+    def adr(self):
+        """Average daily rate: revenue per sold night in the range"""
+        return self.revenue / self.sold_nights if self.sold_nights else 0.0
+
+    def to_dict(self):
+        return {
+            'start': self.start.isoformat(),
+            'end': self.end.isoformat(),
+            'total_units': self.total_units,
+            'occupancy_rate': round(self.occupancy_rate, 4),
+            'adr': round(self.adr, 2),
+            'revenue': round(self.revenue, 2),
+            'sold_nights': self.sold_nights,
+            'days': [
+                {'date': day.isoformat(), 'occupied_units': occupied}
+                for day, occupied in zip(self.days, self.occupied_units)
+            ],
+            'units': [
+                {
+                    'unit_id': unit.unit_id,
+                    'occupied_nights': unit.occupied_nights,
+                    'sold_nights': unit.sold_nights,
+                    'occupancy_rate': round(unit.occupancy_rate, 4),
+                    'revenue': round(unit.revenue, 2),
+                    'adr': round(unit.adr, 2)
+                }
+                for unit in self.units.values()
+            ]
+        }
+
+
+def compute_occupancy(start, end, user=None):
+    """
+    Compute per-night occupied-unit counts, per-unit occupancy and ADR for the
+    nights in [start, end) across the user's accessible units
+
+    Cancelled bookings are ignored. A booking's price is spread evenly over its
+    nights, so only the nights inside the range count towards revenue.
+
+    Args:
+        start: First night of the range
+        end: Day after the last night (a check-out on `end` is fully inside)
+        user: User to compute occupancy for; defaults to current_user
+
+    Returns:
+        OccupancyReport
+    """
+    day_count = (end - start).days
+    report = OccupancyReport(start=start, end=end, occupied_units=[0] * max(day_count, 0))
+
+    context = get_access_context(user)
+    if context is None or not context.unit_ids or day_count <= 0:
+        return report
+
+    report.total_units = len(context.unit_ids)
+    report.units = {unit_id: UnitOccupancy(unit_id) for unit_id in sorted(context.unit_ids)}
+
+    query = filter_query_by_accessible_units(
+        BookingForm.query.with_entities(
+            BookingForm.unit_id,
+            BookingForm.check_in_date,
+            BookingForm.check_out_date,
+            BookingForm.price
+        ),
+        BookingForm,
+        user
+    ).filter(
+        BookingForm.check_in_date < end,
+        BookingForm.check_out_date > start,
+        or_(BookingForm.is_cancelled == False, BookingForm.is_cancelled.is_(None))
+    ).order_by(BookingForm.unit_id, BookingForm.check_in_date)
+
+    # +1 where a unit becomes occupied, -1 the day it frees up
+    diff = [0] * (day_count + 1)
+    current_unit = None
+    run_start = run_end = None
+
+    def close_run():
+        if current_unit is not None and run_start is not None:
+            diff[run_start] += 1
+            diff[run_end] -= 1
+            report.units[current_unit].occupied_nights += run_end - run_start
+
+    for unit_id, check_in, check_out, price in query:
+        stay_nights = (check_out - check_in).days
+        first = max((check_in - start).days, 0)
+        last = min((check_out - start).days, day_count)
+        if stay_nights <= 0 or last <= first or unit_id not in report.units:
+            continue
+
+        # Revenue and sold nights count every booking, even double bookings
+        nights = last - first
+        revenue = float(price or 0) * nights / stay_nights
+        report.sold_nights += nights
+        report.revenue += revenue
+        report.units[unit_id].sold_nights += nights
+        report.units[unit_id].revenue += revenue
+
+        # Occupied units count each unit once per night: merge overlapping stays
+        if unit_id != current_unit:
+            close_run()
+            current_unit, run_start, run_end = unit_id, first, last
+        elif first <= run_end:
+            run_end = max(run_end, last)
+        else:
+            close_run()
+            run_start, run_end = first, last
+
+    close_run()
+
+    report.occupied_units = list(accumulate(diff[:day_count]))
+
+    for unit in report.units.values():
+        unit.occupancy_rate = unit.occupied_nights / day_count
+        unit.adr = unit.revenue / unit.sold_nights if unit.sold_nights else 0.0
+
+    return report
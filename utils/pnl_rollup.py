@@ -0,0 +1,426 @@
+"""
+P&L rollup (pnl_rollup table): entered revenue and expenses, booking revenue,
+booked nights and repair/replace issue costs per company, unit, month and
+category, kept in sync with ExpenseData, BookingForm and Issue by session events
+
+A change marks the unit-months it touches, before and after the change, and
+those months are recomputed from the source tables: flushed changes in the
+same flush, bulk statements just before the transaction commits.
+rebuild_pnl_rollup() repairs drift. query_pnl() slices the rollup by building,
+unit set and time grain.
+"""
+
+import calendar
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from sqlalchemy import delete, event, func, insert, inspect, or_, select
+from sqlalchemy.orm import Session
+
+from models import db, BookingForm, ExpenseData, Issue, PnlRollup, Type, Unit
+from utils.expenses import AMOUNT_QUANTUM, EXPENSE_CATEGORIES, EXPENSE_FIELDS
+from utils.revenue import PERIOD_GRAINS, nightly_rate, period_start
+
+
+# Entered per month on the expenses page, stored with day 0
+MONTHLY_CATEGORIES = list(EXPENSE_FIELDS)
+# Dated facts, stored on their day of the month
+DAILY_CATEGORIES = ['booking_revenue', 'booked_nights', 'repair_cost', 'replace_cost']
+# Issue type name -> category of its cost
+ISSUE_COST_CATEGORIES = {'Repair': 'repair_cost', 'Replace': 'replace_cost'}
+
+# Day and week grains only see DAILY_CATEGORIES
+GRAINS = PERIOD_GRAINS
+
+# Unit IDs bound into one IN (...)
+ROLLUP_CHUNK_SIZE = 500
+
+# Changing any of these moves or changes a row's rollup amounts
+_TRACKED_ATTRIBUTES = {
+    ExpenseData: ['company_id', 'unit_id', 'year', 'month'] + EXPENSE_FIELDS,
+    BookingForm: ['company_id', 'unit_id', 'check_in_date', 'check_out_date', 'price', 'is_cancelled'],
+    Issue: ['company_id', 'unit_id', 'date_added', 'cost', 'type_id'],
+}
+
+# The columns that decide which unit-months a row lands in
+_BUCKET_COLUMNS = {
+    ExpenseData: ['unit_id', 'year', 'month'],
+    BookingForm: ['unit_id', 'check_in_date', 'check_out_date'],
+    Issue: ['unit_id', 'date_added'],
+}
+
+_active_booking = or_(BookingForm.is_cancelled == False, BookingForm.is_cancelled.is_(None))
+
+
+def _chunks(values, size=ROLLUP_CHUNK_SIZE):
+    values = list(values)
+    for index in range(0, len(values), size):
+        yield values[index:index + size]
+
+
+def _months(first, last):
+    """(year, month) of every month from first to last, inclusive"""
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _buckets_of(model, values):
+    """The (unit_id, year, month) buckets a source row with these values lands in"""
+    unit_id = values.get('unit_id')
+    if unit_id is None:
+        return set()
+
+    if model is ExpenseData:
+        if values.get('year') is None or values.get('month') is None:
+            return set()
+        return {(int(unit_id), int(values['year']), int(values['month']))}
+
+    if model is BookingForm:
+        check_in, check_out = values.get('check_in_date'), values.get('check_out_date')
+        if not isinstance(check_in, date) or not isinstance(check_out, date):
+            return set()
+        return {(int(unit_id), year, month) for year, month in _months(check_in, max(check_in, check_out))}
+
+    date_added = values.get('date_added')
+    if not isinstance(date_added, date):
+        return set()
+    return {(int(unit_id), date_added.year, date_added.month)}
+
+
+def _select_buckets(connection, model, condition):
+    """(row IDs, buckets) of the source rows matching condition"""
+    ids = set()
+    buckets = set()
+    columns = _BUCKET_COLUMNS[model]
+    for row in connection.execute(select(model.id, *[getattr(model, name) for name in columns]).where(condition)):
+        ids.add(row[0])
+        buckets |= _buckets_of(model, dict(zip(columns, row[1:])))
+    return ids, buckets
+
+
+def _as_decimal(value):
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def _refresh_month(connection, year, month, unit_ids):
+    """Replace the rollup rows of the given units for one month"""
+    first = date(year, month, 1)
+    last = date(year, month, calendar.monthrange(year, month)[1])
+    amounts = defaultdict(Decimal)
+
+    # Amounts entered on the expenses page
+    for row in connection.execute(
+        select(ExpenseData.company_id, ExpenseData.unit_id, *[getattr(ExpenseData, name) for name in EXPENSE_FIELDS])
+        .where(ExpenseData.year == year, ExpenseData.month == month, ExpenseData.unit_id.in_(unit_ids))
+    ):
+        for name, value in zip(EXPENSE_FIELDS, row[2:]):
+            if value:
+                amounts[(row.company_id, row.unit_id, 0, name)] += _as_decimal(value)
+
+    # Every night spent in this month, with its share of the booking price
+    for company_id, unit_id, check_in, check_out, price in connection.execute(
+        select(BookingForm.company_id, BookingForm.unit_id, BookingForm.check_in_date,
+               BookingForm.check_out_date, BookingForm.price)
+        .where(BookingForm.unit_id.in_(unit_ids), BookingForm.check_in_date <= last,
+               BookingForm.check_out_date >= first, _active_booking)
+    ):
+        rate = nightly_rate(price, check_in, check_out)
+        night = max(check_in, first)
+        while night < check_out and night <= last:
+            amounts[(company_id, unit_id, night.day, 'booked_nights')] += 1
+            if rate:
+                amounts[(company_id, unit_id, night.day, 'booking_revenue')] += rate
+            night += timedelta(days=1)
+
+    # Repair and replace costs on the day the issue was logged
+    for company_id, unit_id, date_added, cost, type_name in connection.execute(
+        select(Issue.company_id, Issue.unit_id, Issue.date_added, Issue.cost, Type.name)
+        .join(Type, Issue.type_id == Type.id)
+        .where(Issue.unit_id.in_(unit_ids), Issue.cost.isnot(None), Type.name.in_(ISSUE_COST_CATEGORIES),
+               Issue.date_added >= datetime.combine(first, datetime.min.time()),
+               Issue.date_added < datetime.combine(last + timedelta(days=1), datetime.min.time()))
+    ):
+        amounts[(company_id, unit_id, date_added.day, ISSUE_COST_CATEGORIES[type_name])] += _as_decimal(cost)
+
+    connection.execute(delete(PnlRollup).where(
+        PnlRollup.year == year, PnlRollup.month == month, PnlRollup.unit_id.in_(unit_ids)
+    ))
+    # Nightly revenue shares carry more decimals than the column keeps
+    rounded = {key: amount.quantize(AMOUNT_QUANTUM, rounding=ROUND_HALF_UP) for key, amount in amounts.items()}
+    rows = [
+        {'company_id': company_id, 'unit_id': unit_id, 'year': year, 'month': month,
+         'day': day, 'category': category, 'amount': amount}
+        for (company_id, unit_id, day, category), amount in rounded.items() if amount
+    ]
+    if rows:
+        connection.execute(insert(PnlRollup), rows)
+
+
+def refresh_buckets(connection, buckets):
+    """Recompute the rollup for the given (unit_id, year, month) buckets"""
+    unit_ids_by_month = defaultdict(set)
+    for unit_id, year, month in buckets:
+        unit_ids_by_month[(year, month)].add(unit_id)
+
+    for (year, month), unit_ids in sorted(unit_ids_by_month.items()):
+        for chunk in _chunks(sorted(unit_ids)):
+            _refresh_month(connection, year, month, chunk)
+
+
+def _pending_changes(session):
+    return session.info.setdefault('pnl_rollup_pending', {
+        'buckets': set(),
+        # Rows changed by bulk updates, re-read at commit for where they ended up
+        'ids': defaultdict(set),
+        'rebuild_all': False
+    })
+
+
+def _tracked_model(obj):
+    for model in _TRACKED_ATTRIBUTES:
+        if isinstance(obj, model):
+            return model
+    return None
+
+
+def _values(obj, model):
+    return {name: getattr(obj, name) for name in _BUCKET_COLUMNS[model]}
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_deleted_rows(session, flush_context, instances):
+    # Read deleted rows while they still exist: their attributes may be expired
+    buckets = session.info.setdefault('pnl_rollup_deleted', set())
+    for obj in session.deleted:
+        model = _tracked_model(obj)
+        if model is not None:
+            buckets |= _buckets_of(model, _values(obj, model))
+
+
+@event.listens_for(Session, 'after_flush')
+def _refresh_flushed_rows(session, flush_context):
+    buckets = session.info.pop('pnl_rollup_deleted', set())
+
+    for obj in session.new:
+        model = _tracked_model(obj)
+        if model is not None:
+            buckets |= _buckets_of(model, _values(obj, model))
+
+    for obj in session.dirty:
+        model = _tracked_model(obj)
+        if model is None:
+            continue
+        state = inspect(obj)
+        if not any(state.attrs[name].history.has_changes() for name in _TRACKED_ATTRIBUTES[model]):
+            continue
+
+        current = _values(obj, model)
+        previous = dict(current)
+        for name in _BUCKET_COLUMNS[model]:
+            history = state.attrs[name].history
+            if history.deleted:
+                previous[name] = history.deleted[0]
+        buckets |= _buckets_of(model, current) | _buckets_of(model, previous)
+
+    if buckets:
+        refresh_buckets(session.connection(), buckets)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_changes(orm_execute_state):
+    if orm_execute_state.is_select or orm_execute_state.bind_mapper is None:
+        return
+    model = orm_execute_state.bind_mapper.class_
+    if model not in _TRACKED_ATTRIBUTES:
+        return
+
+    pending = _pending_changes(orm_execute_state.session)
+    parameters = orm_execute_state.parameters
+    rows = parameters if isinstance(parameters, list) else [parameters or {}]
+    statement = orm_execute_state.statement
+
+    if orm_execute_state.is_insert:
+        # Inserts and upserts carry the columns that place them
+        if all(set(_BUCKET_COLUMNS[model]) <= set(row) for row in rows):
+            for row in rows:
+                pending['buckets'] |= _buckets_of(model, row)
+        else:
+            pending['rebuild_all'] = True
+        return
+
+    if rows and all('id' in row for row in rows):
+        # Bulk UPDATE by primary key
+        condition = model.id.in_([row['id'] for row in rows])
+    elif getattr(statement, 'whereclause', None) is not None:
+        # Query.update()/delete()
+        condition = statement.whereclause
+    else:
+        pending['rebuild_all'] = True
+        return
+
+    # Where the rows are now; where they end up is read at commit
+    ids, buckets = _select_buckets(orm_execute_state.session.connection(), model, condition)
+    pending['buckets'] |= buckets
+    pending['ids'][model] |= ids
+
+
+@event.listens_for(Session, 'before_commit')
+def _refresh_bulk_changes(session):
+    pending = session.info.pop('pnl_rollup_pending', None)
+    if not pending:
+        return
+
+    if pending['rebuild_all']:
+        rebuild_pnl_rollup(session=session)
+        return
+
+    connection = session.connection()
+    buckets = set(pending['buckets'])
+    for model, ids in pending['ids'].items():
+        for chunk in _chunks(ids):
+            buckets |= _select_buckets(connection, model, model.id.in_(chunk))[1]
+    refresh_buckets(connection, buckets)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_bulk_changes(session):
+    session.info.pop('pnl_rollup_pending', None)
+    session.info.pop('pnl_rollup_deleted', None)
+
+
+def rebuild_pnl_rollup(session=None):
+    """
+    Recompute every unit-month that has source rows or rollup rows. The caller
+    commits.
+
+    Returns:
+        Number of unit-months recomputed
+    """
+    session = session or db.session
+    connection = session.connection()
+
+    buckets = set(connection.execute(select(ExpenseData.unit_id, ExpenseData.year, ExpenseData.month).distinct()).all())
+    buckets |= set(connection.execute(select(PnlRollup.unit_id, PnlRollup.year, PnlRollup.month).distinct()).all())
+    for check_in, check_out, unit_id in connection.execute(
+        select(BookingForm.check_in_date, BookingForm.check_out_date, BookingForm.unit_id)
+        .where(BookingForm.unit_id.isnot(None), _active_booking)
+    ):
+        buckets |= _buckets_of(BookingForm, {'unit_id': unit_id, 'check_in_date': check_in,
+                                             'check_out_date': check_out})
+    for unit_id, date_added in connection.execute(
+        select(Issue.unit_id, Issue.date_added).where(Issue.unit_id.isnot(None), Issue.cost.isnot(None))
+    ):
+        buckets |= _buckets_of(Issue, {'unit_id': unit_id, 'date_added': date_added})
+
+    refresh_buckets(connection, buckets)
+    return len(buckets)
+
+
+def ensure_pnl_rollup(session=None):
+    """
+    Rebuild the rollup if it is empty while there are expenses, bookings or
+    issue costs, e.g. after db.create_all() added it to an existing database.
+    The caller commits.
+
+    Returns:
+        Number of unit-months recomputed
+    """
+    session = session or db.session
+    connection = session.connection()
+
+    if connection.execute(select(PnlRollup.id).limit(1)).first() is not None:
+        return 0
+    has_sources = any(connection.execute(query.limit(1)).first() is not None for query in (
+        select(ExpenseData.id),
+        select(BookingForm.id).where(BookingForm.unit_id.isnot(None), _active_booking),
+        select(Issue.id).where(Issue.unit_id.isnot(None), Issue.cost.isnot(None))
+    ))
+    if not has_sources:
+        return 0
+    return rebuild_pnl_rollup(session=session)
+
+
+def query_pnl(company_id, start, end, grain='month', unit_ids=None, building=None, categories=None, by_unit=False):
+    """
+    Slice and dice the rollup for the days from start to end (inclusive)
+
+    Day and week grains only see the dated categories (DAILY_CATEGORIES).
+    Month, quarter and year grains cover every month the range touches,
+    including the amounts entered per month.
+
+    Args:
+        grain: 'day', 'week' (starting Monday), 'month', 'quarter' or 'year'
+        unit_ids: Only these units, optional
+        building: Only units in this building, optional
+        categories: Only these categories, optional
+        by_unit: Split every period by unit
+
+    Returns:
+        Dict of period start date, or (period start date, unit_id) with by_unit,
+        -> {category: amount}, in period order
+    """
+    if grain not in GRAINS:
+        raise ValueError(f'Unknown grain: {grain}')
+    if unit_ids is not None and not unit_ids:
+        return {}
+
+    key_columns = [PnlRollup.year, PnlRollup.month, PnlRollup.day, PnlRollup.category]
+    if by_unit:
+        key_columns.append(PnlRollup.unit_id)
+
+    query = db.session.query(*key_columns, func.sum(PnlRollup.amount).label('amount')).filter(
+        PnlRollup.company_id == company_id,
+        PnlRollup.year.between(start.year, end.year)
+    )
+    if grain in ('day', 'week'):
+        day_key = PnlRollup.year * 10000 + PnlRollup.month * 100 + PnlRollup.day
+        query = query.filter(
+            PnlRollup.day > 0,
+            day_key.between(start.year * 10000 + start.month * 100 + start.day,
+                            end.year * 10000 + end.month * 100 + end.day)
+        )
+    else:
+        month_key = PnlRollup.year * 100 + PnlRollup.month
+        query = query.filter(month_key.between(start.year * 100 + start.month, end.year * 100 + end.month))
+
+    if unit_ids is not None:
+        query = query.filter(PnlRollup.unit_id.in_(list(unit_ids)))
+    if building:
+        query = query.filter(PnlRollup.unit_id.in_(
+            select(Unit.id).where(Unit.company_id == company_id, Unit.building == building)
+        ))
+    if categories:
+        query = query.filter(PnlRollup.category.in_(categories))
+
+    result = defaultdict(lambda: defaultdict(float))
+    for row in query.group_by(*key_columns):
+        period = period_start(date(row.year, row.month, row.day or 1), grain)
+        key = (period, row.unit_id) if by_unit else period
+        result[key][row.category] += float(row.amount or 0)
+
+    return {key: dict(values) for key, values in sorted(result.items())}
+
+
+def pnl_totals(company_id, start, end, grain, unit_ids=None, categories=None):
+    """query_pnl() summed over every period in the range: {category: amount}"""
+    totals = defaultdict(float)
+    for values in query_pnl(company_id, start, end, grain, unit_ids=unit_ids, categories=categories).values():
+        for category, amount in values.items():
+            totals[category] += amount
+    return dict(totals)
+
+
+def rollup_expense_totals(company_id, unit_ids, start, end):
+    """
+    Revenue, per-category costs, total expenses and net income of the given
+    units read from the rollup, for every month the range touches
+    """
+    values = pnl_totals(company_id, start, end, 'month', unit_ids=unit_ids, categories=MONTHLY_CATEGORIES)
+    totals = {category: values.get(category, 0.0) for category in EXPENSE_CATEGORIES}
+    totals['revenue'] = values.get('sales', 0.0)
+    totals['total_expenses'] = sum(totals[category] for category in EXPENSE_CATEGORIES)
+    totals['net_income'] = totals['revenue'] - totals['total_expenses']
+    return totals
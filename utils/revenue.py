@@ -0,0 +1,143 @@
+"""
+Revenue recognition: a booking's price is earned evenly over its nights
+
+Shared by the expenses page, the dashboard and the P&L rollup so every screen
+attributes revenue to the same days. recognize_revenue() reads the bookings
+overlapping a range in one query and spreads them over the nights with a
+difference array per unit, so the cost grows with bookings + days rather than
+bookings x nights.
+"""
+
+from array import array
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import accumulate
+from typing import Dict
+
+from sqlalchemy import or_
+
+from models import db, BookingForm
+
+
+PERIOD_GRAINS = ('day', 'week', 'month', 'quarter', 'year')
+
+
+def period_start(day, grain):
+    """First day of the day/week (Monday)/month/quarter/year period containing day"""
+    if grain == 'day':
+        return day
+    if grain == 'week':
+        return day - timedelta(days=day.weekday())
+    if grain == 'month':
+        return day.replace(day=1)
+    if grain == 'quarter':
+        return date(day.year, 3 * ((day.month - 1) // 3) + 1, 1)
+    if grain == 'year':
+        return date(day.year, 1, 1)
+    raise ValueError(f'Unknown grain: {grain}')
+
+
+def nightly_rate(price, check_in, check_out):
+    """Revenue earned per night of a booking, as a Decimal; 0 if it has no nights"""
+    nights = (check_out - check_in).days
+    if nights <= 0 or not price:
+        return Decimal(0)
+    return Decimal(str(price)) / nights
+
+
+@dataclass
+class RevenueSchedule:
+    """Revenue earned per unit per night for the nights in [start, end)"""
+    start: date
+    end: date
+    # unit_id -> revenue of each night, one entry per day of the range
+    nightly: Dict[int, array] = field(default_factory=dict)
+
+    @property
+    def day_count(self):
+        return max((self.end - self.start).days, 0)
+
+    def total(self):
+        return sum(sum(values) for values in self.nightly.values())
+
+    def by_unit(self):
+        """{unit_id: revenue over the whole range}"""
+        return {unit_id: sum(values) for unit_id, values in self.nightly.items()}
+
+    def _periods(self, grain):
+        """(period start, first day index, end day index) of each period in the range"""
+        periods = []
+        for index in range(self.day_count):
+            key = period_start(self.start + timedelta(days=index), grain)
+            if periods and periods[-1][0] == key:
+                periods[-1][2] = index + 1
+            else:
+                periods.append([key, index, index + 1])
+        return periods
+
+    def aggregate(self, grain='month', by_unit=True):
+        """
+        Revenue per period of the given grain
+
+        Returns:
+            {period start: {unit_id: revenue}} with by_unit, otherwise
+            {period start: revenue}. Periods are clipped to the range.
+        """
+        periods = self._periods(grain)
+        if by_unit:
+            return {
+                key: {unit_id: sum(values[first:last]) for unit_id, values in self.nightly.items()}
+                for key, first, last in periods
+            }
+        return {
+            key: sum(sum(values[first:last]) for values in self.nightly.values())
+            for key, first, last in periods
+        }
+
+
+def recognize_revenue(company_id, unit_ids, start, end):
+    """
+    Spread the price of every active booking of the given units evenly over
+    its nights, for the nights in [start, end)
+
+    Returns:
+        RevenueSchedule; units without revenue in the range are left out
+    """
+    schedule = RevenueSchedule(start=start, end=end)
+    day_count = schedule.day_count
+    if not unit_ids or day_count <= 0:
+        return schedule
+
+    bookings = db.session.query(
+        BookingForm.unit_id,
+        BookingForm.check_in_date,
+        BookingForm.check_out_date,
+        BookingForm.price
+    ).filter(
+        BookingForm.company_id == company_id,
+        BookingForm.unit_id.in_(list(unit_ids)),
+        BookingForm.check_in_date < end,
+        BookingForm.check_out_date > start,
+        or_(BookingForm.is_cancelled == False, BookingForm.is_cancelled.is_(None))
+    )
+
+    # +rate on a booking's first night in range, -rate the day after its last
+    diffs = {}
+    for unit_id, check_in, check_out, price in bookings:
+        nights = (check_out - check_in).days
+        if nights <= 0 or not price:
+            continue
+        rate = float(price) / nights
+        first = max((check_in - start).days, 0)
+        last = min((check_out - start).days, day_count)
+
+        diff = diffs.get(unit_id)
+        if diff is None:
+            diff = diffs[unit_id] = array('d', bytes(8 * (day_count + 1)))
+        diff[first] += rate
+        diff[last] -= rate
+
+    for unit_id, diff in diffs.items():
+        schedule.nightly[unit_id] = array('d', accumulate(diff[:day_count]))
+    return schedule
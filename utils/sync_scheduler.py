@@ -0,0 +1,167 @@
+"""
+Adaptive, staggered schedule for the calendar feed sync
+
+Every active CalendarSource with a URL has its own next_sync_at. A frequent
+scheduler tick syncs only the sources that are due, so downloads are spread
+over the day instead of all running at 02:00. After each sync the source's
+interval adapts: feeds that changed bookings recently or have a check-in coming up are
+polled often, quiet feeds back off, and failing feeds back off faster.
+"""
+
+import random
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import or_
+
+from models import db, BookingForm, CalendarSource
+from utils.calendar_sync import CalendarSyncEngine
+
+
+# Defaults, each overridable with the config key of the same name
+CALENDAR_SYNC_TICK_SECONDS = 60
+CALENDAR_SYNC_MIN_INTERVAL = 15 * 60
+CALENDAR_SYNC_DEFAULT_INTERVAL = 60 * 60
+CALENDAR_SYNC_MAX_INTERVAL = 24 * 60 * 60
+# Upper bound on sources synced per tick; the rest wait for the next tick
+CALENDAR_SYNC_MAX_SOURCES_PER_TICK = 50
+
+# A source is "hot" while a check-in is this close or its feed changed bookings this recently
+HOT_CHECK_IN_WINDOW = timedelta(hours=48)
+HOT_CHANGE_WINDOW = timedelta(hours=24)
+
+# Quiet feeds multiply their interval by this after each unchanged sync
+BACKOFF_FACTOR = 1.5
+# +/- spread applied to every next_sync_at so sources don't drift into lockstep
+JITTER = 0.1
+
+
+def _option(name, default):
+    return current_app.config.get(name, default)
+
+
+def next_sync_interval(previous, hot, failed, min_interval, default_interval, max_interval):
+    """
+    Seconds until a source should be synced again
+
+    Args:
+        previous: The source's current interval, or None
+        hot: Whether the feed changed recently or a check-in is near
+        failed: Whether this sync failed to download or process the feed
+    """
+    previous = previous or default_interval
+    if failed:
+        # Don't hammer a broken feed, but keep trying at least daily
+        return min(max_interval, max(previous, default_interval) * 2)
+    if hot:
+        return min_interval
+    return int(min(max_interval, max(previous * BACKOFF_FACTOR, default_interval)))
+
+
+def jittered(seconds):
+    return seconds * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+def stagger_offsets(count, interval):
+    """Evenly spaced start offsets (seconds) for count sources over one interval"""
+    if count == 0:
+        return []
+    return [interval * index / count for index in range(count)]
+
+
+def schedule_new_sources(now):
+    """Give sources that were never scheduled a next_sync_at, spread over one interval"""
+    default_interval = _option('CALENDAR_SYNC_DEFAULT_INTERVAL', CALENDAR_SYNC_DEFAULT_INTERVAL)
+
+    sources = CalendarSource.query.filter(
+        CalendarSource.is_active == True,
+        CalendarSource.source_url.isnot(None),
+        CalendarSource.next_sync_at.is_(None)
+    ).order_by(CalendarSource.id).all()
+
+    for source, offset in zip(sources, stagger_offsets(len(sources), default_interval)):
+        source.next_sync_at = now + timedelta(seconds=offset)
+        source.sync_interval = default_interval
+
+    if sources:
+        db.session.commit()
+    return len(sources)
+
+
+def get_due_source_ids(now, limit):
+    """Active sources whose next_sync_at has passed, most overdue first"""
+    rows = db.session.query(CalendarSource.id).filter(
+        CalendarSource.is_active == True,
+        CalendarSource.source_url.isnot(None),
+        CalendarSource.next_sync_at <= now
+    ).order_by(CalendarSource.next_sync_at).limit(limit).all()
+    return [source_id for (source_id,) in rows]
+
+
+def get_units_with_upcoming_check_ins(unit_ids, now):
+    """Units among unit_ids with a non-cancelled check-in between today and now + 48 hours"""
+    if not unit_ids:
+        return set()
+
+    rows = db.session.query(BookingForm.unit_id).filter(
+        BookingForm.unit_id.in_(unit_ids),
+        BookingForm.check_in_date >= now.date(),
+        BookingForm.check_in_date <= (now + HOT_CHECK_IN_WINDOW).date(),
+        or_(BookingForm.is_cancelled == False, BookingForm.is_cancelled.is_(None))
+    ).distinct().all()
+    return {unit_id for (unit_id,) in rows}
+
+
+def reschedule_sources(source_ids, results, now):
+    """Set next_sync_at/sync_interval of the synced sources from their results"""
+    min_interval = _option('CALENDAR_SYNC_MIN_INTERVAL', CALENDAR_SYNC_MIN_INTERVAL)
+    default_interval = _option('CALENDAR_SYNC_DEFAULT_INTERVAL', CALENDAR_SYNC_DEFAULT_INTERVAL)
+    max_interval = _option('CALENDAR_SYNC_MAX_INTERVAL', CALENDAR_SYNC_MAX_INTERVAL)
+
+    results_by_source = {result.source_id: result for result in results}
+    sources = CalendarSource.query.filter(CalendarSource.id.in_(source_ids)).all()
+    hot_units = get_units_with_upcoming_check_ins({source.unit_id for source in sources}, now)
+
+    for source in sources:
+        result = results_by_source.get(source.id)
+        failed = result is None or result.error is not None
+
+        if failed:
+            source.sync_failures = (source.sync_failures or 0) + 1
+        else:
+            source.sync_failures = 0
+            # A new body alone doesn't count: some providers re-stamp every download
+            if result.changed_bookings():
+                source.last_changed_at = now
+
+        hot = source.unit_id in hot_units or (
+            source.last_changed_at is not None and now - source.last_changed_at <= HOT_CHANGE_WINDOW
+        )
+
+        source.sync_interval = next_sync_interval(source.sync_interval, hot, failed,
+                                                  min_interval, default_interval, max_interval)
+        source.next_sync_at = now + timedelta(seconds=jittered(source.sync_interval))
+
+    db.session.commit()
+
+
+def sync_due_calendars(engine=None, now=None):
+    """
+    One scheduler tick: schedule new sources, sync the due ones and plan their next sync
+
+    Returns:
+        List of SyncResult for the sources synced in this tick
+    """
+    started = datetime.utcnow()
+    now = now or started
+    schedule_new_sources(now)
+
+    limit = _option('CALENDAR_SYNC_MAX_SOURCES_PER_TICK', CALENDAR_SYNC_MAX_SOURCES_PER_TICK)
+    source_ids = get_due_source_ids(now, limit)
+    if not source_ids:
+        return []
+
+    results = (engine or CalendarSyncEngine()).run(source_ids)
+    # Plan from when the sync finished, on the caller's clock
+    reschedule_sources(source_ids, results, now + (datetime.utcnow() - started))
+    return results